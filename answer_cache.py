@@ -0,0 +1,198 @@
+"""
+Cache delle risposte a livello di domanda, per intento normalizzato.
+
+Molte domande sono riformulazioni della stessa richiesta ("Quali piatti
+includono X?", "Quali sono i piatti leggendari della galassia che
+combinano X?"). La chiave non è il testo ma una forma canonica:
+
+- entità riconosciute dal QueryEngine (ingredienti, tecniche, ordini,
+  pianeti) con la polarità: +ingrediente:x / -tecnica:y
+- tutte le altre parole, tranne quelle di FILLER_WORDS (articoli,
+  "quali piatti", verbi come "contengono"/"utilizzano", abbellimenti come
+  "leggendari" o "della galassia"); i trigger di negazione diventano "non"
+- la presenza di "o"/"oppure" tra più entità
+
+così le riformulazioni condividono la chiave, mentre un vincolo in più
+("... e sono vegani?") o una negazione no. Le domande senza entità usano
+come chiave il testo normalizzato.
+
+Fallback opzionale per similarità (disattivato di default): con un modello
+di embedding, una domanda senza hit esatto riusa la risposta della domanda
+in cache più simile (coseno >= similarity), ma solo se ha le stesse entità
+con la stessa polarità: "con X" e "senza X" non si confondono mai.
+
+Le voci scadono dopo ttl secondi e le meno usate vengono eliminate oltre
+max_entries (LRU). Thread-safe (usata dai worker di qa_service.py).
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from dish_records import normalize_name
+from entity_spotter import NEGATION_CUES
+from query_engine import QueryEngine
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 3600.0
+DEFAULT_SIMILARITY = 0.95
+
+_DISJUNCTION_RE = re.compile(r"\b(o|oppure)\b")
+# Parole che non cambiano l'intento della domanda (testo normalizzato)
+FILLER_WORDS = frozenset("""
+    il lo la i gli le l un una uno d di del dello della dei degli delle dell a al allo alla ai agli
+    alle all da dal dallo dalla dai dagli dalle in nel nello nella nei negli nelle nell con su sul
+    sullo sulla sui per tra fra e ed o oppure ma pero anche sia che come loro quei quelli quelle
+    quali quale sono e si possono posso vengono piatti piatto ricette ricetta ingrediente ingredienti
+    tecnica tecniche preparazione uso applicazione preparati preparato preparate preparare prepari
+    creati contengono contiene contenenti includono include includa combinano combinando utilizzano
+    utilizza utilizzando utilizzare usano usa usando usare impiegano impiegare sfruttano richiedono
+    fanno tramite attraverso mediante coinvolgendo galassia galattico galattici universo
+    leggendari leggendaria leggendario deliziosi deliziosa delizioso strepitosi raffinata raffinato
+    mistici mistico misteriosi misteriose misteriosa misterioso celebri intrigante nostro nostra
+    vostro vostra tutto
+""".split())
+_NEGATION_WORDS = frozenset(NEGATION_CUES)
+
+
+def intent_signature(engine: QueryEngine, question: str) -> Tuple[str, Optional[str]]:
+    """
+    (entità con polarità, chiave canonica completa) di una domanda.
+    La chiave è None se la domanda non cita entità.
+    """
+    matches = engine.find_entities(question)
+    entities = sorted({f"{'-' if m.negated else '+'}{m.kind}:{m.key}" for m in matches})
+    signature = "|".join(entities)
+    if not entities:
+        return signature, None
+
+    # Parole fuori dalle entità che possono cambiare l'intento (vincoli, nomi, numeri)
+    masked = list(question)
+    for m in matches:
+        for i in range(m.start, m.end):
+            masked[i] = " "
+    words = set()
+    for word in re.findall(r"\w[\w+\-]*", normalize_name("".join(masked))):
+        if word in _NEGATION_WORDS:
+            words.add("non")
+        elif word not in FILLER_WORDS:
+            words.add(word)
+
+    parts = list(entities) + [f"parola:{w}" for w in sorted(words)]
+    if len(matches) > 1 and _DISJUNCTION_RE.search(normalize_name(question)):
+        parts.append("op:o")
+    return signature, "|".join(parts)
+
+
+@dataclass
+class _Entry:
+    ids: List[int]
+    expires: float
+    signature: str
+    vector: Optional[np.ndarray] = None
+
+
+class AnswerCache:
+    def __init__(self, engine: QueryEngine, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: Optional[float] = DEFAULT_TTL, embedding=None,
+                 similarity: float = DEFAULT_SIMILARITY):
+        """
+        ttl: secondi di validità di una voce (None = nessuna scadenza)
+        embedding: modello con embed_query (es. backends.make_embeddings()) per il
+        fallback per similarità; None = solo hit sulla chiave canonica
+        """
+        self.engine = engine
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embedding = embedding
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Vettori calcolati in get() e riusati dal put() della stessa domanda
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def _key(self, question: str) -> Tuple[str, str]:
+        signature, key = intent_signature(self.engine, question)
+        return signature, key if key is not None else f"testo:{normalize_name(question)}"
+
+    def _vector(self, question: str) -> np.ndarray:
+        with self._lock:
+            vector = self._vectors.get(question)
+        if vector is None:
+            vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vector = vector / norm if norm else vector
+            with self._lock:
+                self._vectors[question] = vector
+                if len(self._vectors) > 256:
+                    self._vectors.popitem(last=False)
+        return vector
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl is not None and now >= entry.expires
+
+    def get(self, question: str) -> Optional[List[int]]:
+        """ID in cache per l'intento della domanda, o None"""
+        signature, key = self._key(question)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry.ids)
+            candidates = [(k, e) for k, e in self._entries.items()
+                          if e.signature == signature and e.vector is not None and not self._expired(e, now)]
+
+        if self.embedding is not None and candidates:
+            vector = self._vector(question)
+            scores = np.stack([e.vector for _, e in candidates]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity:
+                with self._lock:
+                    self.near_hits += 1
+                    if candidates[best][0] in self._entries:
+                        self._entries.move_to_end(candidates[best][0])
+                return list(candidates[best][1].ids)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, question: str, ids: List[int]) -> None:
+        signature, key = self._key(question)
+        vector = self._vector(question) if self.embedding is not None else None
+        expires = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = _Entry(list(ids), expires, signature, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, int]:
+        """Istantanea coerente dei contatori (i worker li aggiornano sotto lo stesso lock)"""
+        with self._lock:
+            return {"hit": self.hits, "hit_simili": self.near_hits, "miss": self.misses,
+                    "voci": len(self._entries)}
+
+    def print_stats(self) -> None:
+        s = self.stats()
+        total = s["hit"] + s["hit_simili"] + s["miss"]
+        if total:
+            print(f"🗂️ Cache risposte: {s['hit']} hit, {s['hit_simili']} per similarità, {s['miss']} miss "
+                  f"({(s['hit'] + s['hit_simili']) / total * 100:.0f}% hit rate, {s['voci']} voci)")
@@ -0,0 +1,169 @@
+"""
+Motore di esecuzione asincrono per chiamate LLM in parallelo.
+
+- limite globale di concorrenza (semaforo)
+- rate limiting con token bucket (richieste al secondo)
+- retry con backoff esponenziale + jitter sugli errori 429 (rate limit)
+- risultati restituiti nello stesso ordine dei job, indipendentemente
+  dall'ordine di completamento
+- run() sincrono su un unico event loop di fondo, condiviso da tutti i
+  runner: i client async (httpx sotto AsyncOpenAI) restano legati al loop
+  in cui aprono le connessioni, quindi un asyncio.run per batch farebbe
+  fallire i batch successivi con "Event loop is closed"
+
+Le risposte passano dalla cache di llm_cache.py.
+"""
+
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from llm_cache import LLMCache, get_default_cache
+from tracing import current_span, get_tracer, record_llm_usage
+
+
+class TokenBucket:
+    """
+    Token bucket: al massimo `rate` acquisizioni al secondo, con burst fino a `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError(f"⚠️ Rate del token bucket non valido: {rate} (deve essere > 0)")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+_background_lock = threading.Lock()
+_background: Optional[asyncio.AbstractEventLoop] = None
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop persistente in un thread daemon, creato al primo uso"""
+    global _background
+    with _background_lock:
+        if _background is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-llm-loop", daemon=True).start()
+            _background = loop
+        return _background
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 429 or type(e).__name__ == "RateLimitError"
+
+
+def _retry_after(e: Exception) -> Optional[float]:
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncLLMRunner:
+    """
+    Esegue job di chat completion (model, messages, params) con un client
+    AsyncOpenAI, rispettando concorrenza, rate limit e retry.
+    requests_per_second=0 disattiva il rate limiting (resta il semaforo).
+    """
+
+    def __init__(self, client, max_concurrency: int = 8, requests_per_second: float = 5.0,
+                 max_retries: int = 5, base_delay: float = 1.0,
+                 cache: Optional[LLMCache] = None):
+        if requests_per_second < 0:
+            raise ValueError(f"⚠️ requests_per_second non valido: {requests_per_second}")
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.cache = cache or get_default_cache()
+        self.retries = 0
+        self._loop = None
+
+    def _limits(self) -> Tuple[asyncio.Semaphore, Optional[TokenBucket]]:
+        """Semaforo e token bucket: devono appartenere all'event loop corrente, creati al primo uso"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._bucket = TokenBucket(self.requests_per_second) if self.requests_per_second else None
+        return self._semaphore, self._bucket
+
+    async def _call(self, model: str, messages: List[Dict], params: Dict) -> str:
+        semaphore, bucket = self._limits()
+        for attempt in range(self.max_retries + 1):
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                async with semaphore:
+                    response = await self.client.chat.completions.create(
+                        model=model, messages=messages, **params
+                    )
+                content = response.choices[0].message.content
+                record_llm_usage(model, messages, content, getattr(response, "usage", None))
+                return content
+            except Exception as e:
+                if not _is_rate_limit(e) or attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                current_span().incr("retries")
+                delay = _retry_after(e) or self.base_delay * (2 ** attempt)
+                await asyncio.sleep(delay * (1 + random.random() * 0.25))
+
+    async def complete(self, model: str, messages: List[Dict], **params) -> str:
+        return await self._complete(model, messages, params, {})
+
+    async def _complete(self, model: str, messages: List[Dict], params: Dict, attrs: Dict) -> str:
+        # Ogni task di gather ha il proprio contesto: lo span resta legato a questa chiamata
+        with get_tracer().span("llm_call", model=model, **attrs):
+            return await self.cache.acached_call(
+                model, messages, params, lambda: self._call(model, messages, params)
+            )
+
+    async def run_all(self, jobs: List[Tuple[str, List[Dict], Dict]]) -> List:
+        """
+        Esegue tutti i job e restituisce i risultati nell'ordine dei job.
+        Un job fallito restituisce l'eccezione al posto della risposta.
+        Un quarto elemento opzionale del job è un dict di attributi per lo span di tracing.
+        """
+        tasks = [self._complete(job[0], job[1], job[2], job[3] if len(job) > 3 else {}) for job in jobs]
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self, jobs: List[Tuple[str, List[Dict], Dict]]) -> List:
+        """
+        Versione sincrona di run_all, richiamabile più volte e da più thread:
+        i job girano sempre sull'event loop di fondo. Il contesto del chiamante
+        (span di tracing correnti) passa ai job tramite run_coroutine_threadsafe.
+        """
+        loop = background_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("❌ run() chiamato dall'event loop di fondo: usare await run_all()")
+        future = asyncio.run_coroutine_threadsafe(self.run_all(jobs), loop)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
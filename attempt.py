@@ -1,33 +1,35 @@
 import os
-import openai
-import pandas as pd
 import json
-import difflib
-from tqdm import tqdm
 from dotenv import load_dotenv
 
-# Carica variabili d'ambiente
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from llm_cache import get_default_cache, ReplayMissError
+from async_llm import AsyncLLMRunner
+from dish_store import open_dish_store
+from query_engine import QueryEngine
+from candidate_filter import CandidateFilter, format_entry
+from name_resolver import NameResolver
+from token_packer import PackingReport, block_budget, count_message_tokens, count_tokens, pack_entries
+from backends import make_chat_client, require_api_key
+from pipeline_stats import PipelineStats
+from tracing import get_tracer
+
+# Limiti del motore asincrono (tutte le chiamate domanda × blocco partono insieme)
+MAX_CONCORRENZA = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+RICHIESTE_AL_SECONDO = float(os.getenv("LLM_REQUESTS_PER_SECOND", "5"))
+
+# Modello e dimensione dei blocchi (in token del modello)
+MODELLO = "gpt-4o"
+MAX_TOKENS_RISPOSTA = 150
+MAX_TOKEN_BLOCCO = int(os.getenv("MAX_TOKEN_BLOCCO", "6000"))
+# Spazio riservato alla domanda quando le domande non sono note in anticipo
+MAX_TOKEN_DOMANDA = 200
 
 # Percorsi
 mapping_path = "Hackapizza Dataset/Misc/dish_mapping.json"
 domande_path = "Hackapizza Dataset/domande.csv"
 ricette_path = "Hackapizza Dataset/ricette_estratte_agentico.csv"
 
-# Carica i file
-df_domande = pd.read_csv(domande_path)
-df_ricette = pd.read_csv(ricette_path)
-with open(mapping_path, "r", encoding="utf-8") as f:
-    dish_mapping = json.load(f)
-
-# Rimuovi colonne inutili
-df_ricette = df_ricette.drop(columns=["ristorante"], errors="ignore")
-
-# Prepara lista ricette testuali
-lista_piatti = [f"{row['nome_ricetta']}: {row['ingredienti']}" for _, row in df_ricette.iterrows()]
-
-# Funzione per dividere le ricette in blocchi
+# Divisione greedy a parole (strategia originale, sostituita da pack_entries)
 def chunk_lista(lista, max_words=2500):
     chunks = []
     current_chunk = []
@@ -46,77 +48,248 @@ def chunk_lista(lista, max_words=2500):
         chunks.append(current_chunk)
     return chunks
 
-# Suddividi in blocchi
-blocchi = chunk_lista(lista_piatti, max_words=2500)
-
-# Fuzzy matching tra nome predetto e chiavi del mapping
-def trova_match(nome_predetto, dish_mapping_keys):
-    match = difflib.get_close_matches(nome_predetto, dish_mapping_keys, n=1, cutoff=0.8)
-    return match[0] if match else None
-
-# Funzione agentica su ciascun blocco
-def chiedi_ai_llm_con_chunk(domanda):
-    ricette_rilevanti = set()
-    for blocco in blocchi:
-        contesto = "\n".join(blocco)
-        messaggi = [
-            {
-                "role": "system",
-                "content": (
-                    "Sei un assistente che seleziona ricette esatte da una lista.\n"
-                    "Ogni riga è nel formato 'nome: ingredienti'.\n"
-                    "Devi rispondere alla domanda dell'utente **selezionando da 1 a massimo 7 nomi esattamente come compaiono nella lista**, separati da virgola.\n"
-                    "Non inventare nomi. Non riscrivere. Non aggiungere testo.\n\n"
-                    f"Ecco le ricette:\n{contesto}"
+# Messaggi per un blocco di ricette
+def costruisci_messaggi(domanda, blocco):
+    contesto = "\n".join(blocco)
+    return [
+        {
+            "role": "system",
+            "content": (
+                "Sei un assistente che seleziona ricette esatte da una lista.\n"
+                "Ogni riga è nel formato 'nome: ingredienti'.\n"
+                "Devi rispondere alla domanda dell'utente **selezionando da 1 a massimo 7 nomi esattamente come compaiono nella lista**, separati da virgola.\n"
+                "Non inventare nomi. Non riscrivere. Non aggiungere testo.\n\n"
+                f"Ecco le ricette:\n{contesto}"
+            )
+        },
+        {"role": "user", "content": domanda}
+    ]
+
+
+class AttemptPipeline:
+    """
+    Motore locale + LLM a blocchi sulla lista delle ricette.
+
+    ricette/dish_mapping: catalogo alternativo (es. sintetico, da benchmark.py);
+    di default l'archivio dei piatti e dish_mapping.json.
+    domande: se note in anticipo, il budget dei blocchi usa la domanda più lunga.
+    strategia_blocchi: "token" (pack_entries) o "parole" (chunk_lista, originale).
+    """
+
+    def __init__(self, ricette=None, dish_mapping=None, domande=None,
+                 strategia_blocchi="token", stats=None):
+        self.stats = stats or PipelineStats(MODELLO)
+
+        # Carica variabili d'ambiente
+        load_dotenv()
+        # Con HACKAPIZZA_BACKEND=local il client è simulato (nessuna chiamata di rete)
+        self.client = make_chat_client(asynchronous=True, api_key=require_api_key())
+
+        with self.stats.stage("dish_store"):
+            if dish_mapping is None:
+                with open(mapping_path, "r", encoding="utf-8") as f:
+                    dish_mapping = json.load(f)
+            if ricette is None:
+                # Archivio colonnare dei piatti (ricostruito solo se CSV o mapping cambiano)
+                dish_store = open_dish_store(ricette_path=ricette_path, mapping_path=mapping_path)
+                ricette = list(dish_store.records())
+        self.dish_mapping = dish_mapping
+
+        with self.stats.stage("index_build"):
+            # Motore deterministico: le domande di algebra su ingredienti/tecniche non passano dall'LLM
+            self.query_engine = QueryEngine(ricette)
+            # Pre-filtro: all'LLM arrivano solo le ricette che citano le entità della domanda
+            self.candidate_filter = CandidateFilter(self.query_engine)
+            # Fuzzy matching tra nomi predetti e chiavi del mapping (indice di trigrammi)
+            self.name_resolver = NameResolver(dish_mapping.keys())
+
+        # Cache persistente delle risposte (LLM_CACHE_MODE=replay per girare offline)
+        self.llm_cache = get_default_cache()
+
+        with self.stats.stage("chunking"):
+            # Prepara lista ricette testuali
+            lista_piatti = [format_entry(r) for r in ricette]
+
+            # Suddividi in blocchi misurati in token, riservando spazio a prompt, domanda e risposta
+            if domande:
+                overhead_prompt = max(count_message_tokens(costruisci_messaggi(d, []), MODELLO) for d in domande)
+            else:
+                overhead_prompt = count_message_tokens(costruisci_messaggi("", []), MODELLO) + MAX_TOKEN_DOMANDA
+            if strategia_blocchi == "parole":
+                self.blocchi = chunk_lista(lista_piatti)
+                self.report_blocchi = PackingReport(
+                    model=MODELLO,
+                    budget=block_budget(MODELLO, overhead_prompt, MAX_TOKENS_RISPOSTA, MAX_TOKEN_BLOCCO),
+                    block_tokens=[count_tokens("\n".join(b), MODELLO) for b in self.blocchi],
+                    prompt_overhead=overhead_prompt,
+                    max_output_tokens=MAX_TOKENS_RISPOSTA
+                )
+            else:
+                self.blocchi, self.report_blocchi = pack_entries(
+                    lista_piatti,
+                    model=MODELLO,
+                    prompt_overhead=overhead_prompt,
+                    max_output_tokens=MAX_TOKENS_RISPOSTA,
+                    max_block_tokens=MAX_TOKEN_BLOCCO
                 )
-            },
-            {"role": "user", "content": domanda}
+
+    def trova_match_batch(self, nomi_predetti):
+        return [m[0][0] if m else None
+                for m in self.name_resolver.resolve_batch(nomi_predetti, cutoff=0.8)]
+
+    # Blocchi per una domanda: solo i candidati se la domanda cita entità note,
+    # altrimenti tutti i blocchi (scansione completa)
+    def blocchi_per_domanda(self, domanda):
+        return self._blocchi_e_report(domanda)[0]
+
+    def _blocchi_e_report(self, domanda):
+        candidati = self.candidate_filter.candidates(domanda)
+        if not candidati:
+            return self.blocchi, self.report_blocchi
+        return pack_entries(
+            [format_entry(r) for r in candidati],
+            model=MODELLO,
+            prompt_overhead=count_message_tokens(costruisci_messaggi(domanda, []), MODELLO),
+            max_output_tokens=MAX_TOKENS_RISPOSTA,
+            max_block_tokens=MAX_TOKEN_BLOCCO
+        )
+
+    # Funzione agentica su tutti i blocchi di tutte le domande, in parallelo
+    def chiedi_ai_llm_tutte(self, domande):
+        return [nomi for nomi, _ in self._chiedi_ai_llm(domande)]
+
+    # (nomi, completa) per domanda: completa è False se almeno un blocco è fallito
+    def _chiedi_ai_llm(self, domande):
+        params = {"temperature": 0.0, "max_tokens": MAX_TOKENS_RISPOSTA}
+        blocchi_e_report = [self._blocchi_e_report(domanda) for domanda in domande]
+        blocchi_domande = [blocchi for blocchi, _ in blocchi_e_report]
+        # Chiamate e token effettivi, dopo il pre-filtro dei candidati
+        self.report_blocchi.print_summary(reports=[report for _, report in blocchi_e_report])
+        # Il quarto elemento etichetta lo span della chiamata (domanda e blocco)
+        jobs = [
+            (MODELLO, costruisci_messaggi(domanda, blocco), params, {"domanda": domanda, "blocco": b})
+            for domanda, blocchi_domanda in zip(domande, blocchi_domande)
+            for b, blocco in enumerate(blocchi_domanda)
         ]
+        filtrate = sum(b is not self.blocchi for b in blocchi_domande)
+        print(f"🎯 {filtrate}/{len(domande)} domande pre-filtrate: "
+              f"{len(jobs)} chiamate LLM invece di {len(domande) * len(self.blocchi)}")
 
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-4o",
-                messages=messaggi,
-                temperature=0.0,
-                max_tokens=150
-            )
-            risposta = response['choices'][0]['message']['content'].strip()
-            nomi = [r.strip() for r in risposta.split(",") if r.strip()]
-            ricette_rilevanti.update(nomi)
-        except Exception as e:
-            print(f"⚠️ Errore nel blocco: {e}")
-
-    return list(ricette_rilevanti)[:7] if ricette_rilevanti else []
-
-# Loop sulle domande
-risultati = []
-
-for i, domanda in tqdm(enumerate(df_domande["domanda"]), total=len(df_domande)):
-    try:
-        nomi_ricette = chiedi_ai_llm_con_chunk(domanda)
-        ids = []
-
-        for nome in nomi_ricette:
-            match = trova_match(nome, dish_mapping.keys())
-            if match:
-                ids.append(str(dish_mapping[match]))
-
-        if not ids:
-            print(f"❌ Nessuna ricetta trovata per la domanda {i+1}: {domanda}")
-            print(f"🔎 GPT ha risposto: {nomi_ricette}")
+        runner = AsyncLLMRunner(
+            self.client,
+            max_concurrency=MAX_CONCORRENZA,
+            requests_per_second=RICHIESTE_AL_SECONDO,
+            cache=self.llm_cache
+        )
+        risposte = runner.run(jobs)
+        if runner.retries:
+            print(f"🔁 {runner.retries} retry per rate limit")
+
+        # Ricompone i risultati per domanda, nell'ordine dei blocchi (deterministico)
+        risultati = []
+        pos = 0
+        for blocchi_domanda in blocchi_domande:
+            ricette_rilevanti = {}
+            completa = True
+            for (_, messaggi, _, _), risposta in zip(jobs[pos:pos + len(blocchi_domanda)],
+                                                    risposte[pos:pos + len(blocchi_domanda)]):
+                if isinstance(risposta, ReplayMissError):
+                    raise risposta
+                if isinstance(risposta, Exception):
+                    print(f"⚠️ Errore nel blocco: {risposta}")
+                    completa = False
+                    continue
+                self.stats.record_chat(messaggi, risposta)
+                for nome in risposta.strip().split(","):
+                    if nome.strip():
+                        ricette_rilevanti.setdefault(nome.strip(), None)
+            pos += len(blocchi_domanda)
+            risultati.append((list(ricette_rilevanti)[:7], completa))
+        return risultati
+
+    def chiedi_ai_llm_con_chunk(self, domanda):
+        return self.chiedi_ai_llm_tutte([domanda])[0]
+
+    def answer_all(self, domande):
+        """
+        Per ogni domanda: {"fonte": "locale" | "llm" | "errore", "ids": [...], "nomi": [...], "completa": bool}
+        completa è False se la risposta è parziale o vuota per un errore (blocchi falliti, matching).
+        Le domande di un batch condividono una traccia (le chiamate LLM partono insieme).
+        """
+        with get_tracer().span("batch", pipeline="attempt", domande=len(domande)):
+            return self._answer_all(domande)
+
+    def _answer_all(self, domande):
+        self.stats.questions += len(domande)
+
+        # Prima il motore locale; un risultato vuoto viene comunque verificato dall'LLM
+        risposte_locali = {}
+        with self.stats.stage("local_engine"):
+            for i, domanda in enumerate(domande):
+                with get_tracer().span("question", pipeline="attempt", domanda=domanda) as span:
+                    ids_locali = self.query_engine.answer(domanda)
+                    span.set(locale=bool(ids_locali))
+                if ids_locali:
+                    risposte_locali[i] = ids_locali
+        print(f"🧮 {len(risposte_locali)}/{len(domande)} domande risolte dal motore locale")
+
+        domande_llm = [i for i in range(len(domande)) if i not in risposte_locali]
+        nomi_per_domanda = {}
+        if domande_llm:
+            with self.stats.stage("llm"):
+                nomi_per_domanda = dict(zip(domande_llm, self._chiedi_ai_llm([domande[i] for i in domande_llm])))
+
+        risultati = []
+        with self.stats.stage("matching"):
+            for i, domanda in enumerate(domande):
+                if i in risposte_locali:
+                    risultati.append({"fonte": "locale", "ids": risposte_locali[i], "nomi": [], "completa": True})
+                    continue
+                try:
+                    nomi_ricette, completa = nomi_per_domanda[i]
+                    ids = [self.dish_mapping[match] for match in self.trova_match_batch(nomi_ricette) if match]
+                    risultati.append({"fonte": "llm", "ids": ids, "nomi": nomi_ricette, "completa": completa})
+                except Exception as e:
+                    print(f"❌ Errore nella riga {i+1}: {e}")
+                    risultati.append({"fonte": "errore", "ids": [], "nomi": [], "completa": False})
+        return risultati
+
+    def answer_ids(self, domanda):
+        return self.answer_all([domanda])[0]["ids"]
+
+
+def main():
+    # pandas e tqdm servono solo allo script, non a chi importa AttemptPipeline
+    import pandas as pd
+    from tqdm import tqdm
+
+    df_domande = pd.read_csv(domande_path)
+    domande = list(df_domande["domanda"])
+    pipeline = AttemptPipeline(domande=domande)
+
+    # Loop sulle domande
+    risultati = []
+    for i, (domanda, risposta) in tqdm(enumerate(zip(domande, pipeline.answer_all(domande))), total=len(domande)):
+        ids = [str(x) for x in risposta["ids"]]
+        if risposta["fonte"] == "locale":
+            result = ",".join(ids)
+        elif not ids:
+            if risposta["fonte"] == "llm":
+                print(f"❌ Nessuna ricetta trovata per la domanda {i+1}: {domanda}")
+                print(f"🔎 GPT ha risposto: {risposta['nomi']}")
             result = "1"
         elif len(ids) == 1:
             result = "1"
         else:
             result = ",".join(ids)
-
         risultati.append({"row_id": i + 1, "result": result})
 
-    except Exception as e:
-        print(f"❌ Errore nella riga {i+1}: {e}")
-        risultati.append({"row_id": i + 1, "result": "1"})
+    # Salva il CSV
+    df_output = pd.DataFrame(risultati)
+    df_output.to_csv("risposte.csv", index=False)
+    print("✅ File 'risposte.csv' salvato con successo.")
+    pipeline.llm_cache.print_stats()
+
 
-# Salva il CSV
-df_output = pd.DataFrame(risultati)
-df_output.to_csv("risposte.csv", index=False)
-print("✅ File 'risposte.csv' salvato con successo.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
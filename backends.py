@@ -0,0 +1,249 @@
+"""
+Backend dei modelli (chat ed embedding) selezionabile con la variabile
+d'ambiente HACKAPIZZA_BACKEND:
+
+- "openai" (default): client OpenAI / langchain_openai, come prima
+- "local": implementazioni deterministiche senza rete, per misurare il costo
+  della pipeline (chunking, retrieval, matching, orchestrazione) senza il
+  rumore della latenza dell'API:
+    * HashingEmbeddings: feature hashing di parole e trigrammi di caratteri
+    * LocalChatClient / AsyncLocalChatClient: stessa interfaccia di
+      client.chat.completions.create, risposte da copione o euristiche
+    * make_chat_model: chat model LangChain per le RetrievalQA
+
+Latenza simulata (solo backend locale):
+    HACKAPIZZA_LOCAL_LATENCY      secondi fissi per chiamata (default 0)
+    HACKAPIZZA_LOCAL_TOKEN_LATENCY secondi per token della risposta (default 0)
+Copione di risposte: HACKAPIZZA_LOCAL_SCRIPT = file JSON {sottostringa del prompt: risposta}
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import functools
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from dish_records import normalize_name
+
+BACKENDS = ("openai", "local")
+MAX_NOMI_RISPOSTA = 7
+
+
+def get_backend() -> str:
+    backend = os.getenv("HACKAPIZZA_BACKEND", "openai")
+    if backend not in BACKENDS:
+        raise ValueError(f"⚠️ Backend non valido: '{backend}' (attesi: {', '.join(BACKENDS)})")
+    return backend
+
+
+def is_local() -> bool:
+    return get_backend() == "local"
+
+
+def require_api_key(*names: str) -> Optional[str]:
+    """Chiave OpenAI dall'ambiente: obbligatoria solo con il backend openai"""
+    for name in names or ("OPENAI_API_KEY",):
+        if os.getenv(name):
+            os.environ.setdefault("OPENAI_API_KEY", os.environ[name])
+            return os.environ[name]
+    if is_local():
+        return None
+    raise ValueError("⚠️ La variabile OPENAI_API_KEY non è stata trovata nel file .env")
+
+
+# --- Embedding ---
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def _hashing_vector(text: str, dim: int) -> np.ndarray:
+    vector = np.zeros(dim, dtype=np.float32)
+    words = _TOKEN_RE.findall(normalize_name(text))
+    features = words + [f"#{w[i:i + 3]}" for w in words for i in range(max(len(w) - 2, 1))]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        h = int.from_bytes(digest, "little")
+        # Segno dal bit alto: le collisioni tendono ad annullarsi invece di sommarsi
+        vector[h % dim] += 1.0 if h >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+@functools.lru_cache(maxsize=None)
+def _hashing_embeddings_class():
+    # langchain_core si importa solo quando servono gli embedding (non per attempt.py)
+    from langchain_core.embeddings import Embeddings
+
+    class HashingEmbeddings(Embeddings):
+        """Embedding deterministici (feature hashing, norma L2 unitaria) senza rete"""
+
+        def __init__(self, dim: int = 1024):
+            self.dim = dim
+            self.model = f"hashing-{dim}"
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return [_hashing_vector(t, self.dim).tolist() for t in texts]
+
+        def embed_query(self, text: str) -> List[float]:
+            return _hashing_vector(text, self.dim).tolist()
+
+    return HashingEmbeddings
+
+
+def __getattr__(name: str):
+    if name == "HashingEmbeddings":
+        return _hashing_embeddings_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def make_embeddings():
+    """Modello di embedding del backend attivo"""
+    if is_local():
+        return _hashing_embeddings_class()()
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings()
+
+
+# --- Chat ---
+
+class LocalResponder:
+    """
+    Risposte deterministiche a un prompt di chat:
+    1. copione: la prima chiave contenuta nel prompt determina la risposta
+    2. prompt che chiedono JSON (estrazione dei menu): menu vuoto
+    3. altrimenti i nomi delle righe 'nome: ...' o della lista dei piatti che
+       condividono più parole con la domanda (al massimo 7), oppure "Nessuno"
+    """
+
+    def __init__(self, script: Optional[Dict[str, str]] = None):
+        if script is None:
+            script_path = os.getenv("HACKAPIZZA_LOCAL_SCRIPT")
+            script = {}
+            if script_path:
+                with open(script_path, "r", encoding="utf-8") as f:
+                    script = json.load(f)
+        self.script = script
+
+    def __call__(self, messages: List[Dict]) -> str:
+        prompt = "\n".join(m["content"] for m in messages)
+        for key, reply in self.script.items():
+            if key in prompt:
+                return reply
+        if "JSON" in prompt:
+            return json.dumps({"ristorante": {}, "ricette": []})
+
+        # La domanda è l'ultimo messaggio, o la parte dopo "Domanda:"/"DOMANDA:" nei prompt RAG
+        parts = re.split(r"domanda:", prompt, flags=re.IGNORECASE)
+        if len(parts) > 1:
+            context, question = "".join(parts[:-1]), parts[-1]
+        else:
+            context = "\n".join(m["content"] for m in messages[:-1])
+            question = messages[-1]["content"]
+        q_words = set(_TOKEN_RE.findall(question.lower()))
+        scored = []
+        for line in context.splitlines():
+            nome = line.partition(":")[0].strip()
+            if not nome or len(nome) > 120 or nome.endswith("?"):
+                continue
+            overlap = len(q_words & set(_TOKEN_RE.findall(line.lower())))
+            if overlap > 1:
+                scored.append((-overlap, len(scored), nome))
+        scored.sort()
+        nomi = list(dict.fromkeys(n for _, _, n in scored))[:MAX_NOMI_RISPOSTA]
+        return ", ".join(nomi) if nomi else "Nessuno"
+
+
+def _latency(reply: str) -> float:
+    base = float(os.getenv("HACKAPIZZA_LOCAL_LATENCY", "0"))
+    per_token = float(os.getenv("HACKAPIZZA_LOCAL_TOKEN_LATENCY", "0"))
+    return base + per_token * max(len(reply) // 4, 1)
+
+
+def _completion(model: str, messages: List[Dict], reply: str) -> SimpleNamespace:
+    """Oggetto con la stessa forma della risposta OpenAI (choices, usage)"""
+    prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                 message=SimpleNamespace(role="assistant", content=reply))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(reply) // 4,
+                              total_tokens=prompt_tokens + len(reply) // 4),
+    )
+
+
+class LocalChatClient:
+    """Sostituto sincrono di openai.OpenAI: client.chat.completions.create(...)"""
+
+    def __init__(self, responder: Optional[LocalResponder] = None):
+        self.responder = responder or LocalResponder()
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str, messages: List[Dict], **params):
+        self.calls += 1
+        reply = self.responder(messages)
+        delay = _latency(reply)
+        if delay:
+            time.sleep(delay)
+        return _completion(model, messages, reply)
+
+
+class AsyncLocalChatClient(LocalChatClient):
+    """Sostituto di openai.AsyncOpenAI: la latenza simulata non blocca l'event loop"""
+
+    async def _create(self, model: str, messages: List[Dict], **params):
+        self.calls += 1
+        reply = self.responder(messages)
+        delay = _latency(reply)
+        if delay:
+            await asyncio.sleep(delay)
+        return _completion(model, messages, reply)
+
+
+def make_chat_client(asynchronous: bool = False, api_key: Optional[str] = None):
+    """Client con l'interfaccia chat.completions.create del backend attivo"""
+    if is_local():
+        return AsyncLocalChatClient() if asynchronous else LocalChatClient()
+    from openai import AsyncOpenAI, OpenAI
+    return AsyncOpenAI(api_key=api_key) if asynchronous else OpenAI(api_key=api_key)
+
+
+def make_chat_model(model: str = "gpt-3.5-turbo"):
+    """Chat model LangChain del backend attivo (per le RetrievalQA di rag.py/rag2.py)"""
+    if not is_local():
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model)
+
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    roles = {"system": "system", "human": "user", "ai": "assistant"}
+
+    class LocalChatModel(BaseChatModel):
+        model_name: str = model
+
+        @property
+        def _llm_type(self) -> str:
+            return "hackapizza-local"
+
+        @property
+        def _identifying_params(self) -> Dict:
+            return {"model_name": self.model_name}
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            chat = [{"role": roles.get(m.type, "user"), "content": m.content} for m in messages]
+            reply = _responder(chat)
+            delay = _latency(reply)
+            if delay:
+                time.sleep(delay)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    _responder = LocalResponder()
+    return LocalChatModel()
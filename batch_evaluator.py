@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Valutatore offline di molte submission contro una ground truth etichettata.
+
+Gli insiemi di ID dei piatti vengono convertiti in bitset (np.packbits) su
+un vocabolario comune degli ID: per S submission e Q domande si ottiene un
+tensore (S, Q, byte) e la Jaccard di tutte le coppie si calcola con AND/OR
+vettorizzati e una tabella di popcount, senza cicli Python per domanda.
+
+Stesse regole della valutazione ufficiale (realistic_example.py):
+- Jaccard = |intersezione| / |unione|
+- predizione vuota e risposta corretta vuota -> 1.0
+- una domanda assente dalla submission vale come predizione vuota
+
+Uso:
+    python batch_evaluator.py --ground-truth gt.csv sweep/*.csv
+    python batch_evaluator.py --ground-truth gt.csv sweep/ --diff best
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+from glob import glob
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Numero di bit a 1 per ogni valore di un byte
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def parse_result(value) -> List[int]:
+    """'"101,102"' / '101' / '' -> [101, 102] / [101] / []"""
+    if value is None:
+        return []
+    text = str(value).strip().strip('"\'')
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def load_submission(path: str) -> Dict[int, List[int]]:
+    """CSV row_id,result oppure JSON {row_id: [ID, ...]}"""
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data = data.get("predictions", data)
+        return {int(k): [int(x) for x in v] for k, v in data.items()}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return {int(row["row_id"]): parse_result(row["result"]) for row in csv.DictReader(f)}
+
+
+def expand_paths(paths: Sequence[str]) -> List[str]:
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files.extend(sorted(glob(os.path.join(p, "*.csv"))))
+        else:
+            files.extend(sorted(glob(p)) or [p])
+    return files
+
+
+class BatchEvaluator:
+    def __init__(self, ground_truth: Dict[int, List[int]]):
+        self.row_ids = sorted(ground_truth)
+        self.ground_truth = ground_truth
+        self.id_index: Dict[int, int] = {}
+        for row_id in self.row_ids:
+            for dish_id in ground_truth[row_id]:
+                self.id_index.setdefault(dish_id, len(self.id_index))
+
+    def _bitsets(self, submissions: Sequence[Dict[int, List[int]]]) -> Tuple[np.ndarray, np.ndarray]:
+        # Gli ID predetti ma assenti dalla ground truth entrano nel vocabolario
+        # (contano nell'unione); una colonna per ciascun ID distinto
+        for sub in submissions:
+            for row_id in self.row_ids:
+                for dish_id in sub.get(row_id, ()):
+                    self.id_index.setdefault(dish_id, len(self.id_index))
+        n_ids = max(len(self.id_index), 1)
+        q_index = {row_id: q for q, row_id in enumerate(self.row_ids)}
+
+        def dense(items) -> np.ndarray:
+            rows, cols = [], []
+            for s, sub in items:
+                for row_id, ids in sub.items():
+                    q = q_index.get(row_id)
+                    if q is None:
+                        continue
+                    for dish_id in ids:
+                        rows.append(s * len(self.row_ids) + q)
+                        cols.append(self.id_index[dish_id])
+            n = max(s for s, _ in items) + 1 if items else 0
+            matrix = np.zeros((n * len(self.row_ids), n_ids), dtype=np.uint8)
+            matrix[rows, cols] = 1
+            return np.packbits(matrix, axis=1).reshape(n, len(self.row_ids), -1)
+
+        gt_bits = dense([(0, self.ground_truth)])[0]
+        sub_bits = dense(list(enumerate(submissions)))
+        return gt_bits, sub_bits
+
+    def score(self, submissions: Sequence[Dict[int, List[int]]]) -> np.ndarray:
+        """Matrice (submission, domanda) delle Jaccard, domande nell'ordine di self.row_ids"""
+        if not submissions:
+            return np.zeros((0, len(self.row_ids)))
+        gt_bits, sub_bits = self._bitsets(submissions)
+        inter = POPCOUNT[sub_bits & gt_bits].sum(axis=-1)
+        union = POPCOUNT[sub_bits | gt_bits].sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(union == 0, 1.0, inter / np.maximum(union, 1))
+
+    def diff(self, submission: Dict[int, List[int]], scores: np.ndarray) -> List[Dict]:
+        """Per ogni domanda non perfetta: Jaccard, ID mancanti e ID in più"""
+        rows = []
+        for q, row_id in enumerate(self.row_ids):
+            if scores[q] >= 1.0:
+                continue
+            gt, pred = set(self.ground_truth[row_id]), set(submission.get(row_id, ()))
+            rows.append({
+                "row_id": row_id,
+                "jaccard": float(scores[q]),
+                "mancanti": sorted(gt - pred),
+                "in_piu": sorted(pred - gt),
+            })
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione Jaccard di molte submission")
+    parser.add_argument("submissions", nargs="+", help="File CSV/JSON o cartelle di submission")
+    parser.add_argument("--ground-truth", required=True, help="Risposte corrette (row_id,result)")
+    parser.add_argument("--top", type=int, default=20, help="Righe della classifica da mostrare")
+    parser.add_argument("--diff", default=None,
+                        help="Differenze per domanda di una submission (percorso o 'best')")
+    parser.add_argument("--output", default=None,
+                        help="CSV con la matrice submission × domanda delle Jaccard "
+                             "(.json: classifica con differenze per domanda)")
+    args = parser.parse_args()
+
+    paths = expand_paths(args.submissions)
+    evaluator = BatchEvaluator(load_submission(args.ground_truth))
+
+    start = time.perf_counter()
+    submissions = [load_submission(p) for p in paths]
+    loaded = time.perf_counter()
+    scores = evaluator.score(submissions)
+    scored = time.perf_counter()
+    print(f"⏱️ {len(paths)} submission × {len(evaluator.row_ids)} domande: "
+          f"lettura {1000 * (loaded - start):.1f} ms, valutazione {1000 * (scored - loaded):.1f} ms")
+
+    means = scores.mean(axis=1) if len(paths) else np.array([])
+    order = np.argsort(-means, kind="stable")
+    print(f"\n🏆 CLASSIFICA (media Jaccard su {len(evaluator.row_ids)} domande)")
+    print(f"   {'#':>3}  {'media':>7}  {'perfette':>8}  {'a zero':>6}  submission")
+    for rank, s in enumerate(order[:args.top], 1):
+        print(f"   {rank:>3}  {means[s]:>7.4f}  {int((scores[s] >= 1).sum()):>8}  "
+              f"{int((scores[s] == 0).sum()):>6}  {paths[s]}")
+
+    if args.diff and len(paths):
+        s = int(order[0]) if args.diff == "best" else paths.index(args.diff)
+        print(f"\n🔍 DIFFERENZE PER DOMANDA: {paths[s]}")
+        for row in evaluator.diff(submissions[s], scores[s]):
+            print(f"   Domanda {row['row_id']:>3}: Jaccard {row['jaccard']:.3f}  "
+                  f"mancanti {row['mancanti']}  in più {row['in_piu']}")
+
+    if args.output and args.output.endswith(".json"):
+        report = [{
+            "submission": paths[s],
+            "media": float(means[s]),
+            "per_domanda": dict(zip(evaluator.row_ids, scores[s].tolist())),
+            "differenze": evaluator.diff(submissions[s], scores[s]),
+        } for s in order]
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Classifica e differenze salvate in '{args.output}'")
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["submission", "media"] + evaluator.row_ids)
+            for s in order:
+                writer.writerow([paths[s], f"{means[s]:.6f}"] + [f"{x:.6f}" for x in scores[s]])
+        print(f"\n💾 Matrice delle Jaccard salvata in '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Benchmark end-to-end delle pipeline (attempt.py, rag.py, rag2.py).
+
+Per ogni pipeline misura il tempo delle fasi (pdf_load, chunking, embedding,
+index_build, retrieval, llm, matching, ...) e l'uso dell'LLM (chiamate e
+token in input/output per domanda) sulle domande di domande.csv, oppure su
+un corpus sintetico ottenuto replicando il catalogo reale --scale volte.
+
+Misura anche il tempo di import a freddo (interprete nuovo, mediana di
+--import-repeats esecuzioni) della CLI e dei moduli delle pipeline.
+
+I risultati vengono scritti in JSON e confrontati con una baseline salvata:
+le fasi e gli import più lenti della tolleranza, e ogni aumento di chiamate
+o token, vengono segnalati come regressioni.
+
+Di default il benchmark usa il backend locale (backends.py) e cache vuote,
+così le misure sono riproducibili e senza rete:
+
+    python benchmark.py --pipeline attempt rag2 --scale 10
+    python benchmark.py --baseline bench_baseline.json --fail-on-regression
+    python benchmark.py --output bench_baseline.json          # nuova baseline
+
+Il rate limit di attempt.py (LLM_REQUESTS_PER_SECOND) vale anche per il
+backend locale: alzarlo per misurare solo l'overhead dell'orchestrazione.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+PIPELINES = ("attempt", "rag", "rag2")
+DOMANDE_PATH = "Hackapizza Dataset/domande.csv"
+# Metriche LLM per domanda: qualsiasi aumento è una regressione
+LLM_METRICS = ("calls_per_question", "tokens_in_per_question", "tokens_out_per_question")
+# Moduli di cui si misura il tempo di import a freddo
+IMPORT_MODULES = ("hackapizza.cli", "attempt", "rag", "rag2", "extract_recipe_agent",
+                  "qa_service", "validate_submission", "submit_to_server")
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import {0}; print(time.perf_counter() - t)"
+
+
+def load_questions(limit: Optional[int] = None) -> List[str]:
+    import csv
+    with open(DOMANDE_PATH, "r", encoding="utf-8", newline="") as f:
+        domande = [row["domanda"] for row in csv.DictReader(f)]
+    return domande[:limit] if limit else domande
+
+
+def synthetic_catalog(scale: int):
+    """
+    Catalogo reale replicato scale volte: la copia c ha nomi con suffisso
+    "#c", ristoranti distinti e ID spostati oltre l'ID massimo reale.
+    Restituisce (ricette, dish_mapping).
+    """
+    from dataclasses import replace
+    from dish_store import open_dish_store
+
+    base = list(open_dish_store().records())
+    step = max(r.dish_id for r in base) + 1
+    ricette = []
+    for c in range(scale):
+        suffix = f" #{c}" if c else ""
+        ricette.extend(
+            replace(r, dish_id=r.dish_id + c * step, nome=r.nome + suffix, ristorante=r.ristorante + suffix)
+            for r in base
+        )
+    return ricette, {r.nome: r.dish_id for r in ricette}
+
+
+def synthetic_documents(ricette) -> List:
+    """Un documento per ristorante, con lo stesso schema testuale dei menu"""
+    from langchain_core.documents import Document
+
+    menus: Dict[str, List[str]] = {}
+    for r in ricette:
+        righe = [r.nome, f"Ingredienti: {', '.join(r.ingredienti)}"]
+        if r.tecniche:
+            righe.append(f"Tecniche: {', '.join(r.tecniche)}")
+        menus.setdefault(r.ristorante, [f"Ristorante {r.ristorante}"]).append("\n".join(righe))
+    return [Document(page_content="\n\n".join(blocchi), metadata={"source": f"{nome}.pdf"})
+            for nome, blocchi in menus.items()]
+
+
+def _rag_kwargs(args) -> Dict:
+    kwargs = {}
+    for key in ("chunk_size", "chunk_overlap", "k"):
+        if getattr(args, key) is not None:
+            kwargs[key] = getattr(args, key)
+    return kwargs
+
+
+def run_pipeline(name: str, args, domande: List[str], catalog) -> Dict:
+    from pipeline_stats import PipelineStats
+
+    ricette, dish_mapping = catalog if catalog else (None, None)
+    wall_start = time.perf_counter()
+
+    if name == "attempt":
+        from attempt import AttemptPipeline, MODELLO
+        stats = PipelineStats(MODELLO)
+        t0 = time.perf_counter()
+        pipeline = AttemptPipeline(ricette=ricette, dish_mapping=dish_mapping, domande=domande,
+                                   strategia_blocchi=args.chunk_strategy, stats=stats)
+        build_seconds = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        pipeline.answer_all(domande)
+        answer_seconds = time.perf_counter() - t0
+    else:
+        module = __import__(name)
+        stats = PipelineStats(module.MODELLO)
+        kwargs = _rag_kwargs(args)
+        kwargs["dish_chunks"] = args.dish_chunks
+        if name == "rag2":
+            kwargs["neighbors"] = not args.no_neighbors
+            kwargs["hybrid"] = not args.no_hybrid
+        if catalog:
+            kwargs["documents"] = synthetic_documents(ricette)
+            kwargs["dish_mapping"] = dish_mapping
+        else:
+            kwargs["index_dir"] = os.path.join(args.work_dir, f"faiss_{name}")
+        t0 = time.perf_counter()
+        pipeline = module.build_pipeline(stats=stats, **kwargs)
+        build_seconds = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for domanda in domande:
+            pipeline.answer_ids(domanda)
+        answer_seconds = time.perf_counter() - t0
+
+    result = stats.as_dict()
+    result.update({
+        "wall_seconds": round(time.perf_counter() - wall_start, 6),
+        "build_seconds": round(build_seconds, 6),
+        "answer_seconds": round(answer_seconds, 6),
+        "ms_per_question": round(1000 * answer_seconds / max(len(domande), 1), 3),
+    })
+    return result
+
+
+def measure_imports(modules=IMPORT_MODULES, repeats: int = 3) -> Dict:
+    """Secondi di import di ogni modulo in un interprete nuovo (mediana), o l'errore"""
+    env = dict(os.environ, HACKAPIZZA_TRACE="")
+    results = {}
+    for module in modules:
+        samples = []
+        for _ in range(repeats):
+            proc = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET.format(module)],
+                                  capture_output=True, text=True, env=env)
+            if proc.returncode != 0:
+                results[module] = {"error": proc.stderr.strip().splitlines()[-1]}
+                break
+            samples.append(float(proc.stdout.strip().splitlines()[-1]))
+        else:
+            results[module] = {"seconds": round(statistics.median(samples), 6)}
+    return results
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> Tuple[List[str], List[str]]:
+    """Righe del confronto e regressioni (tempo oltre la tolleranza, più chiamate o token)"""
+    lines, regressions = [], []
+
+    def check(label: str, now: float, before: float, timing: bool) -> None:
+        if before is None or now is None:
+            return
+        delta = (now - before) / before if before else (0.0 if now == before else float("inf"))
+        marker = ""
+        # Tempi sotto il millisecondo: rumore di misura, non regressioni
+        if (timing and delta > tolerance and now - before > 1e-3) or (not timing and now > before):
+            marker = "  ⚠️ REGRESSIONE"
+            regressions.append(f"{label}: {before} → {now} ({delta:+.1%})")
+        lines.append(f"   {label:<40} {before:>12.4f} {now:>12.4f} {delta:>+9.1%}{marker}")
+
+    for name, now in current["pipelines"].items():
+        before = baseline.get("pipelines", {}).get(name)
+        if not before or "error" in now or "error" in before:
+            continue
+        lines.append(f"📊 {name}")
+        for key in ("wall_seconds", "build_seconds", "answer_seconds", "ms_per_question"):
+            check(key, now.get(key), before.get(key), timing=True)
+        for stage in sorted(set(now["stages"]) | set(before["stages"])):
+            check(f"stage.{stage}", now["stages"].get(stage), before["stages"].get(stage), timing=True)
+        for metric in LLM_METRICS:
+            check(f"llm.{metric}", now["llm"][metric], before["llm"][metric], timing=False)
+
+    imports_before = baseline.get("imports", {})
+    if current.get("imports") and imports_before:
+        lines.append("📦 import")
+        for module, now in current["imports"].items():
+            before = imports_before.get(module, {})
+            check(f"import.{module}", now.get("seconds"), before.get("seconds"), timing=True)
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delle pipeline con tempi per fase")
+    parser.add_argument("--pipeline", nargs="+", choices=PIPELINES, default=list(PIPELINES))
+    parser.add_argument("--backend", choices=("local", "openai"), default="local",
+                        help="Backend dei modelli (default: local, senza rete)")
+    parser.add_argument("--questions", type=int, default=None, help="Numero massimo di domande")
+    parser.add_argument("--scale", type=int, default=0,
+                        help="Corpus sintetico: catalogo reale replicato N volte (0 = menu PDF reali)")
+    parser.add_argument("--warm", action="store_true",
+                        help="Usa le cache su disco (PDF, embedding, LLM) invece di cache vuote")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    parser.add_argument("--chunk-overlap", type=int, default=None)
+    parser.add_argument("--k", type=int, default=None, help="Chunk recuperati per domanda (rag/rag2)")
+    parser.add_argument("--no-neighbors", action="store_true", help="rag2 senza NeighborRetriever")
+    parser.add_argument("--no-hybrid", action="store_true", help="rag2 solo FAISS, senza BM25")
+    parser.add_argument("--dish-chunks", action="store_true",
+                        help="rag/rag2 con un chunk per piatto (menu_splitter.py)")
+    parser.add_argument("--chunk-strategy", choices=("token", "parole"), default="token",
+                        help="Blocchi di attempt.py: pack_entries o chunk_lista")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", default=None, help="JSON di una run precedente da confrontare")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Rallentamento relativo tollerato prima di segnalare una regressione")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--import-repeats", type=int, default=3,
+                        help="Esecuzioni per misurare gli import a freddo (0 = non misurare)")
+    args = parser.parse_args()
+
+    # Ambiente fissato prima di importare le pipeline (le cache leggono le variabili all'import)
+    os.environ["HACKAPIZZA_BACKEND"] = args.backend
+    args.work_dir = tempfile.mkdtemp(prefix="hackapizza_bench_")
+    if not args.warm:
+        os.environ["PDF_CACHE_DIR"] = os.path.join(args.work_dir, "pdf_text")
+        os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(args.work_dir, "embeddings")
+        os.environ["LLM_CACHE_MODE"] = "off"
+
+    domande = load_questions(args.questions)
+    catalog = synthetic_catalog(args.scale) if args.scale > 0 else None
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "backend": args.backend,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "questions": len(domande),
+            "scale": args.scale,
+            "n_dishes": len(catalog[0]) if catalog else None,
+            "warm": args.warm,
+            "settings": {k: getattr(args, k) for k in
+                         ("chunk_size", "chunk_overlap", "k", "no_neighbors", "no_hybrid",
+                          "dish_chunks", "chunk_strategy")},
+        },
+        "pipelines": {},
+    }
+
+    for name in args.pipeline:
+        print(f"\n🏁 Pipeline {name}")
+        try:
+            results["pipelines"][name] = run_pipeline(name, args, domande, catalog)
+        except ImportError as e:
+            print(f"⚠️ Pipeline {name} saltata: dipendenza mancante ({e})")
+            results["pipelines"][name] = {"error": str(e)}
+            continue
+        r = results["pipelines"][name]
+        print(f"⏱️ {name}: {r['wall_seconds']:.3f}s totali, {r['ms_per_question']:.2f} ms/domanda")
+        for stage, seconds in r["stages"].items():
+            print(f"   • {stage}: {seconds:.4f}s")
+        print(f"   • LLM: {r['llm']['calls_per_question']} chiamate/domanda, "
+              f"{r['llm']['tokens_in_per_question']} token in, {r['llm']['tokens_out_per_question']} out")
+
+    if args.import_repeats > 0:
+        print("\n📦 Tempi di import a freddo")
+        results["imports"] = measure_imports(repeats=args.import_repeats)
+        for module, r in results["imports"].items():
+            if "error" in r:
+                print(f"   • {module}: non importabile ({r['error']})")
+            else:
+                print(f"   • {module}: {r['seconds'] * 1000:.1f} ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Risultati salvati in '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        diff = [k for k in ("backend", "questions", "scale", "warm", "settings")
+                if baseline.get("meta", {}).get(k) != results["meta"][k]]
+        if diff:
+            print(f"⚠️ Baseline con impostazioni diverse ({', '.join(diff)}): confronto indicativo")
+        lines, regressions = compare(results, baseline, args.tolerance)
+        print(f"\n🔬 Confronto con '{args.baseline}' (baseline, attuale, delta)")
+        for line in lines:
+            print(line)
+        if regressions:
+            print(f"❌ {len(regressions)} regressioni")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("✅ Nessuna regressione")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Indice BM25 in memoria sui chunk dei menu.
+
+Gli embedding tendono a perdere i termini rari ed esatti ("Sashimi di
+Magikarp", "Latte+"): l'indice lessicale li ritrova e viene fuso con i
+risultati vettoriali (rag2.HybridRetriever, reciprocal rank fusion).
+
+Il testo è normalizzato con dish_records.normalize_name; i token sono
+parole alfanumeriche, con gli eventuali "+" finali ("latte+" ≠ "latte").
+Per ogni termine si salvano gli indici dei chunk e il peso BM25 già
+calcolato, così una ricerca è una somma vettorizzata sulle posting list.
+"""
+
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from dish_records import normalize_name
+
+_TOKEN = re.compile(r"\w+\+*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(normalize_name(text))
+
+
+class BM25Index:
+    def __init__(self, items: Iterable[Tuple[int, str]], k1: float = 1.5, b: float = 0.75):
+        """items: coppie (chunk_id, testo)"""
+        self.ids: List[int] = []
+        counts: List[Counter] = []
+        for chunk_id, text in items:
+            self.ids.append(chunk_id)
+            counts.append(Counter(tokenize(text)))
+
+        n = len(self.ids)
+        lengths = np.array([sum(c.values()) for c in counts], dtype=np.float64)
+        avgdl = lengths.mean() if n and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths / avgdl)
+
+        rows: Dict[str, List[int]] = {}
+        tfs: Dict[str, List[int]] = {}
+        for i, c in enumerate(counts):
+            for term, tf in c.items():
+                rows.setdefault(term, []).append(i)
+                tfs.setdefault(term, []).append(tf)
+
+        # term -> (indici dei chunk, peso BM25 del termine in ciascun chunk)
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term, idx in rows.items():
+            idx = np.array(idx, dtype=np.int32)
+            tf = np.array(tfs[term], dtype=np.float64)
+            idf = np.log(1 + (n - len(idx) + 0.5) / (len(idx) + 0.5))
+            self.postings[term] = (idx, idf * tf * (k1 + 1) / (tf + norm[idx]))
+
+    @classmethod
+    def from_docs_map(cls, docs_map: Dict[int, object], **kwargs) -> "BM25Index":
+        """Stessi chunk dell'indice FAISS ({chunk_id: Document} di menu_index)"""
+        return cls(((cid, d.page_content) for cid, d in docs_map.items()), **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """I k chunk con punteggio BM25 più alto (solo quelli con almeno un termine in comune)"""
+        if k <= 0:
+            return []
+        scores = np.zeros(len(self.ids))
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in hits]
@@ -0,0 +1,45 @@
+"""
+Pre-filtro dei candidati: prima di interrogare l'LLM si tengono solo le
+ricette che contengono almeno uno degli ingredienti/tecniche citati (in
+forma positiva) nella domanda: OR delle righe della DishBitMatrix del
+QueryEngine.
+
+Se la domanda non cita entità note, o solo entità negate, si restituisce
+None e il chiamante ripiega sulla scansione completa.
+"""
+
+from typing import List, Optional
+
+import numpy as np
+
+from dish_records import DishRecord
+from query_engine import QueryEngine, Term
+
+
+def format_entry(record: DishRecord) -> str:
+    """Stesso formato 'nome: ingredienti' usato nei prompt di attempt.py"""
+    return f"{record.nome}: {', '.join(record.ingredienti)}"
+
+
+class CandidateFilter:
+    def __init__(self, engine: QueryEngine):
+        self.engine = engine
+
+    def candidate_mask(self, question: str) -> Optional[np.ndarray]:
+        positives = [m for m in self.engine.find_entities(question) if not m.negated]
+        if not positives:
+            return None
+        return np.bitwise_or.reduce([self.engine.term_mask(Term(m.kind, m.key)) for m in positives])
+
+    def candidate_ids(self, question: str) -> Optional[List[int]]:
+        mask = self.candidate_mask(question)
+        if mask is None:
+            return None
+        return sorted(set(self.engine.bitmatrix.ids(mask)))
+
+    def candidates(self, question: str) -> Optional[List[DishRecord]]:
+        """Ricette candidate nell'ordine del catalogo, o None per la scansione completa"""
+        mask = self.candidate_mask(question)
+        if mask is None:
+            return None
+        return [self.engine.records[j] for j in self.engine.bitmatrix.positions(mask)]
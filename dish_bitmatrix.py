@@ -0,0 +1,243 @@
+"""
+Rappresentazione compatta piatti × ingredienti e piatti × tecniche come
+matrice di bit NumPy (np.packbits), con tabelle di vocabolario.
+
+La matrice è salvata trasposta: una riga per ingrediente/tecnica, con un bit
+per piatto. Un filtro "include A e B, esclude C" diventa quindi
+    AND(riga A, riga B) & ~OR(riga C)
+su poche righe da n_piatti/8 byte, vettorizzato su un batch di query.
+
+Il file salvato è unico e mappabile in memoria (np.memmap):
+    MAGIC | lunghezza header (8 byte) | header JSON | padding | dish_ids | bits
+
+Esegui `python dish_bitmatrix.py` per il benchmark su un catalogo sintetico.
+"""
+
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dish_records import DishRecord, normalize_name
+
+MAGIC = b"HPBITS1\n"
+ALIGN = 64
+
+
+class DishBitMatrix:
+    def __init__(self, dish_ids: np.ndarray, bits: np.ndarray,
+                 ingredients: List[str], techniques: List[str]):
+        # bits: (n_ingredienti + n_tecniche + 2, ceil(n_piatti / 8)) uint8.
+        # Le ultime due righe sono sentinelle: tutti i piatti / nessun piatto,
+        # usate come padding nei batch di query di lunghezza diversa.
+        self.dish_ids = dish_ids
+        self.bits = bits
+        self.ingredients = ingredients
+        self.techniques = techniques
+        self.n_dishes = len(dish_ids)
+        self.ingredient_index = {normalize_name(x): i for i, x in enumerate(ingredients)}
+        self.technique_index = {normalize_name(x): len(ingredients) + i for i, x in enumerate(techniques)}
+        self.ones_row = bits.shape[0] - 2
+        self.zeros_row = bits.shape[0] - 1
+
+    # --- Costruzione ---
+
+    @classmethod
+    def from_lists(cls, dish_ids: Sequence[int], ingredient_lists: Sequence[Iterable[str]],
+                   technique_lists: Optional[Sequence[Iterable[str]]] = None) -> "DishBitMatrix":
+        technique_lists = technique_lists or [[] for _ in dish_ids]
+        ingredients, techniques = {}, {}
+        rows, cols = [], []
+        for d, (ings, tecs) in enumerate(zip(ingredient_lists, technique_lists)):
+            for x in ings:
+                rows.append(ingredients.setdefault(normalize_name(x), (len(ingredients), x))[0])
+                cols.append(d)
+            for x in tecs:
+                rows.append(-1 - techniques.setdefault(normalize_name(x), (len(techniques), x))[0])
+                cols.append(d)
+
+        n_ing, n_tec, n_dishes = len(ingredients), len(techniques), len(dish_ids)
+        rows = np.asarray(rows, dtype=np.int64)
+        # Le tecniche (indici negativi) vanno dopo gli ingredienti
+        rows = np.where(rows >= 0, rows, n_ing + (-1 - rows))
+        cols = np.asarray(cols, dtype=np.int64)
+
+        # Imposta i bit direttamente nel formato packed (big-endian come np.packbits)
+        bits = np.zeros((n_ing + n_tec + 2, (n_dishes + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(bits, (rows, cols >> 3), (0x80 >> (cols & 7)).astype(np.uint8))
+        bits[n_ing + n_tec] = np.packbits(np.ones(n_dishes, dtype=bool))  # sentinella: tutti i piatti
+
+        by_index = lambda d: [name for _, (i, name) in sorted(d.items(), key=lambda kv: kv[1][0])]
+        return cls(np.asarray(dish_ids, dtype=np.int64), bits, by_index(ingredients), by_index(techniques))
+
+    @classmethod
+    def from_records(cls, records: List[DishRecord]) -> "DishBitMatrix":
+        return cls.from_lists(
+            [r.dish_id for r in records],
+            [r.ingredienti for r in records],
+            [r.tecniche for r in records],
+        )
+
+    # --- Query ---
+
+    def term_row(self, name: str) -> Optional[int]:
+        key = normalize_name(name)
+        if key in self.ingredient_index:
+            return self.ingredient_index[key]
+        return self.technique_index.get(key)
+
+    def kind_row(self, kind: str, key: str) -> Optional[int]:
+        """Riga di un ingrediente o di una tecnica (nome già normalizzato)"""
+        if kind == "ingrediente":
+            return self.ingredient_index.get(key)
+        if kind == "tecnica":
+            return self.technique_index.get(key)
+        return None
+
+    def all_mask(self) -> np.ndarray:
+        return self.bits[self.ones_row]
+
+    def positions(self, mask: np.ndarray) -> np.ndarray:
+        """Colonne (posizioni nel catalogo) dei bit accesi di una maschera"""
+        return np.flatnonzero(np.unpackbits(mask, count=self.n_dishes))
+
+    def ids(self, mask: np.ndarray) -> List[int]:
+        return self.dish_ids[self.positions(mask)].tolist()
+
+    def masks(self, queries: Sequence[Tuple[Sequence[int], Sequence[int]]]) -> np.ndarray:
+        """
+        Maschere (packed) dei piatti che soddisfano ogni query.
+        queries: lista di (righe da includere, righe da escludere).
+        Restituisce un array (n_query, n_byte) uint8.
+        """
+        n_inc = max((len(inc) for inc, _ in queries), default=0) or 1
+        n_exc = max((len(exc) for _, exc in queries), default=0) or 1
+        inc_idx = np.full((len(queries), n_inc), self.ones_row, dtype=np.int64)
+        exc_idx = np.full((len(queries), n_exc), self.zeros_row, dtype=np.int64)
+        for q, (inc, exc) in enumerate(queries):
+            inc_idx[q, :len(inc)] = inc
+            exc_idx[q, :len(exc)] = exc
+
+        included = np.bitwise_and.reduce(self.bits[inc_idx], axis=1)
+        excluded = np.bitwise_or.reduce(self.bits[exc_idx], axis=1)
+        return included & ~excluded
+
+    def filter_batch(self, queries: Sequence[Tuple[Sequence[str], Sequence[str]]]) -> List[List[int]]:
+        """
+        Filtra per nomi: queries è una lista di (nomi da includere, nomi da escludere).
+        Un nome sconosciuto da includere produce un risultato vuoto; da escludere è ignorato.
+        """
+        row_queries, unknown = [], []
+        for include, exclude in queries:
+            inc = [self.term_row(n) for n in include]
+            exc = [r for r in (self.term_row(n) for n in exclude) if r is not None]
+            unknown.append(any(r is None for r in inc))
+            row_queries.append(([r for r in inc if r is not None], exc))
+
+        masks = self.masks(row_queries)
+        results = []
+        for mask, missing in zip(masks, unknown):
+            if missing:
+                results.append([])
+                continue
+            results.append(self.ids(mask))
+        return results
+
+    def filter(self, include: Sequence[str] = (), exclude: Sequence[str] = ()) -> List[int]:
+        return self.filter_batch([(include, exclude)])[0]
+
+    # --- Serializzazione ---
+
+    def save(self, path: str) -> None:
+        header = {
+            "n_dishes": self.n_dishes,
+            "n_rows": int(self.bits.shape[0]),
+            "n_bytes": int(self.bits.shape[1]),
+            "ingredients": self.ingredients,
+            "techniques": self.techniques,
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        prefix = len(MAGIC) + 8 + len(header_bytes)
+        padding = (-prefix) % ALIGN
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header_bytes).to_bytes(8, "little"))
+            f.write(header_bytes)
+            f.write(b"\0" * padding)
+            f.write(np.ascontiguousarray(self.dish_ids, dtype="<i8").tobytes())
+            f.write(np.ascontiguousarray(self.bits, dtype=np.uint8).tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "DishBitMatrix":
+        """Apre il file in memory-map: nessuna copia dei dati"""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"❌ '{path}' non è un file DishBitMatrix")
+            header_len = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        offset = len(MAGIC) + 8 + header_len
+        offset += (-offset) % ALIGN
+
+        n_dishes, n_rows, n_bytes = header["n_dishes"], header["n_rows"], header["n_bytes"]
+        dish_ids = np.memmap(path, dtype="<i8", mode="r", offset=offset, shape=(n_dishes,))
+        bits = np.memmap(path, dtype=np.uint8, mode="r", offset=offset + 8 * n_dishes,
+                         shape=(n_rows, n_bytes))
+        return cls(dish_ids, bits, header["ingredients"], header["techniques"])
+
+
+def synthetic_matrix(n_dishes: int = 100_000, n_ingredients: int = 3000, n_techniques: int = 300,
+                     per_dish: int = 10, seed: int = 0) -> DishBitMatrix:
+    """Catalogo sintetico per i benchmark"""
+    rng = np.random.default_rng(seed)
+    # Distribuzione Zipf-like: pochi ingredienti molto comuni, molti rari
+    weights = 1.0 / np.arange(1, n_ingredients + 1)
+    weights /= weights.sum()
+    ing_names = [f"ingrediente {i}" for i in range(n_ingredients)]
+    tec_names = [f"tecnica {i}" for i in range(n_techniques)]
+    ingredient_lists = [
+        [ing_names[i] for i in rng.choice(n_ingredients, per_dish, replace=False, p=weights)]
+        for _ in range(n_dishes)
+    ]
+    technique_lists = [
+        [tec_names[i] for i in rng.choice(n_techniques, 3, replace=False)]
+        for _ in range(n_dishes)
+    ]
+    return DishBitMatrix.from_lists(range(n_dishes), ingredient_lists, technique_lists)
+
+
+def benchmark(n_dishes: int = 100_000, n_ingredients: int = 3000, n_queries: int = 1000) -> Dict[str, float]:
+    t0 = time.perf_counter()
+    matrix = synthetic_matrix(n_dishes, n_ingredients)
+    build_s = time.perf_counter() - t0
+
+    rng = np.random.default_rng(1)
+    n_rows = len(matrix.ingredients) + len(matrix.techniques)
+    queries = [
+        (rng.choice(n_rows, 2, replace=False).tolist(), rng.choice(n_rows, 1).tolist())
+        for _ in range(n_queries)
+    ]
+    t0 = time.perf_counter()
+    masks = matrix.masks(queries)
+    batch_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for q in queries[:100]:
+        matrix.masks([q])
+    single_s = (time.perf_counter() - t0) / 100
+
+    return {
+        "n_dishes": n_dishes,
+        "n_terms": n_rows,
+        "matrix_mb": matrix.bits.nbytes / 1e6,
+        "build_s": build_s,
+        "batch_ms_per_query": batch_s / n_queries * 1000,
+        "single_query_ms": single_s * 1000,
+        "avg_hits": float(np.unpackbits(masks, axis=1).sum(axis=1).mean()),
+    }
+
+
+if __name__ == "__main__":
+    print("🧪 Benchmark DishBitMatrix su catalogo sintetico")
+    for key, value in benchmark().items():
+        print(f"   • {key}: {value:.4f}" if isinstance(value, float) else f"   • {key}: {value}")
@@ -0,0 +1,94 @@
+"""
+Caricamento dei piatti estratti (ricette_estratte_agentico.csv) con il loro
+ID in dish_mapping.json e, se presenti, le colonne strutturate (tecniche,
+ordini, pianeta, licenze) prodotte da extract_recipe_agent.py, in un formato comune alle pipeline locali
+(motore di query, matrice di bit, pre-filtro).
+"""
+
+import csv
+import json
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+RICETTE_PATH = "Hackapizza Dataset/ricette_estratte_agentico.csv"
+MAPPING_PATH = "Hackapizza Dataset/Misc/dish_mapping.json"
+
+
+@dataclass
+class DishRecord:
+    dish_id: int
+    nome: str
+    ristorante: str
+    ingredienti: List[str] = field(default_factory=list)
+    tecniche: List[str] = field(default_factory=list)
+    ordini: List[str] = field(default_factory=list)
+    pianeta: str = ""
+    licenze: List[str] = field(default_factory=list)
+
+
+def normalize_name(text: str) -> str:
+    """
+    Forma normalizzata per i confronti: minuscolo, senza accenti,
+    apostrofi tipografici (’ ‘ `) convertiti in ' e spazi compattati.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.replace("’", "'").replace("‘", "'").replace("`", "'")
+    return " ".join(text.lower().split())
+
+
+def split_list(value: Optional[str]) -> List[str]:
+    """'a, b, c' -> ['a', 'b', 'c'] (ignora valori vuoti)"""
+    if not value:
+        return []
+    return [x.strip() for x in value.split(",") if x.strip()]
+
+
+def load_dish_mapping(mapping_path: str = MAPPING_PATH) -> Dict[str, int]:
+    with open(mapping_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def resolve_dish_id(nome: str, dish_mapping: Dict[str, int], resolver) -> Optional[int]:
+    """ID del piatto: match esatto, altrimenti fuzzy con il NameResolver"""
+    if nome in dish_mapping:
+        return dish_mapping[nome]
+    match = resolver.best_match(nome, cutoff=0.8)
+    return dish_mapping[match] if match else None
+
+
+def load_dish_records(ricette_path: str = RICETTE_PATH,
+                      mapping_path: str = MAPPING_PATH) -> List[DishRecord]:
+    """
+    Legge le ricette estratte e associa a ciascuna il suo ID.
+    Le ricette senza corrispondenza in dish_mapping.json vengono scartate.
+    """
+    from name_resolver import NameResolver
+
+    dish_mapping = load_dish_mapping(mapping_path)
+    resolver = NameResolver(dish_mapping.keys())
+
+    records = []
+    skipped = []
+    with open(ricette_path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            nome = (row.get("nome_ricetta") or "").strip()
+            dish_id = resolve_dish_id(nome, dish_mapping, resolver)
+            if dish_id is None:
+                skipped.append(nome)
+                continue
+            records.append(DishRecord(
+                dish_id=int(dish_id),
+                nome=nome,
+                ristorante=(row.get("ristorante") or "").strip(),
+                ingredienti=split_list(row.get("ingredienti")),
+                tecniche=split_list(row.get("tecniche")),
+                ordini=split_list(row.get("ordini")),
+                pianeta=(row.get("pianeta") or "").strip(),
+                licenze=split_list(row.get("licenze")),
+            ))
+
+    if skipped:
+        print(f"⚠️ {len(skipped)} ricette senza ID in dish_mapping: {', '.join(skipped[:5])}")
+    return records
@@ -0,0 +1,304 @@
+"""
+Archivio colonnare dei piatti, mappabile in memoria.
+
+Costruito una volta da ricette_estratte_agentico.csv + dish_mapping.json,
+sostituisce pd.read_csv + iterrows negli script. È una cartella di file
+.npy aperti con np.load(mmap_mode="r") solo quando servono (zero copie):
+
+- dish_id.npy                       int64, un valore per piatto
+- id_sorted.npy / id_order.npy      ID ordinati + permutazione: lookup per ID
+                                    con np.searchsorted, O(log n) senza dizionari
+- nome.offsets.npy / nome.utf8.npy  stringhe come offset + byte UTF-8
+- ristorante.npy, pianeta.npy       codici int32 su vocabolario (dictionary encoding)
+- <lista>.indptr.npy / .codes.npy   liste in formato CSR con codici int32
+                                    (ingredienti, tecniche, ordini, licenze)
+- estratto.npy                      1 se il piatto compare nelle ricette estratte,
+                                    0 se è solo in dish_mapping.json
+- header.json                       numero di piatti, vocabolari, firma delle sorgenti
+
+Ogni costruzione scrive una sottocartella di versione; il file CURRENT
+indica quella attiva e viene sostituito con os.replace, che è atomico.
+Un lettore risolve CURRENT una sola volta, quindi tutte le colonne che apre
+appartengono alla stessa costruzione anche se nel frattempo ne arriva una nuova.
+
+All'apertura si leggono solo CURRENT e header.json: il costo di avvio non
+dipende dal numero di piatti. L'archivio viene ricostruito se le sorgenti cambiano.
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import time
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from dish_records import (DishRecord, MAPPING_PATH, RICETTE_PATH, load_dish_mapping,
+                          load_dish_records, normalize_name)
+
+DISH_STORE_DIR = os.getenv("DISH_STORE_DIR", ".cache/dish_store")
+FORMAT_VERSION = 1
+CURRENT_FILE = "CURRENT"
+VERSION_PREFIX = "v-"
+# Una costruzione senza header.json più vecchia di così è considerata abbandonata
+STALE_BUILD_SECONDS = 3600
+
+LIST_COLUMNS = ("ingredienti", "tecniche", "ordini", "licenze")
+DICT_COLUMNS = ("ristorante", "pianeta")
+
+
+def _source_signature(paths: Sequence[str]) -> Dict[str, List[int]]:
+    """Dimensione e mtime delle sorgenti: costo costante, senza rileggerle"""
+    signature = {}
+    for p in paths:
+        st = os.stat(p)
+        signature[os.path.abspath(p)] = [st.st_size, st.st_mtime_ns]
+    return signature
+
+
+class _Vocabulary:
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        key = normalize_name(value)
+        if key not in self.codes:
+            self.codes[key] = len(self.values)
+            self.values.append(value)
+        return self.codes[key]
+
+
+def build_dish_store(records: Iterable[DishRecord], dish_mapping: Dict[str, int],
+                     store_dir: str = DISH_STORE_DIR,
+                     sources: Optional[Dict[str, List[int]]] = None) -> "DishStore":
+    """
+    Scrive l'archivio: prima le ricette estratte (nell'ordine del CSV), poi i
+    piatti presenti solo in dish_mapping.json. La nuova versione diventa
+    visibile solo con la sostituzione atomica di CURRENT, così un lettore
+    non vede mai un archivio a metà né resta senza archivio.
+    """
+    dish_ids, names, estratto = [], [], []
+    vocab = {c: _Vocabulary() for c in DICT_COLUMNS + LIST_COLUMNS}
+    dict_codes = {c: [] for c in DICT_COLUMNS}
+    list_codes = {c: [] for c in LIST_COLUMNS}
+    indptr = {c: [0] for c in LIST_COLUMNS}
+
+    def add(record: DishRecord, extracted: bool) -> None:
+        dish_ids.append(record.dish_id)
+        names.append(record.nome.encode("utf-8"))
+        estratto.append(extracted)
+        for c in DICT_COLUMNS:
+            value = getattr(record, c)
+            dict_codes[c].append(vocab[c].code(value) if value else -1)
+        for c in LIST_COLUMNS:
+            list_codes[c].extend(vocab[c].code(v) for v in getattr(record, c))
+            indptr[c].append(len(list_codes[c]))
+
+    seen = set()
+    for r in records:
+        seen.add(r.dish_id)
+        add(r, True)
+    for nome, dish_id in dish_mapping.items():
+        if int(dish_id) not in seen:
+            seen.add(int(dish_id))
+            add(DishRecord(dish_id=int(dish_id), nome=nome, ristorante=""), False)
+
+    os.makedirs(store_dir, exist_ok=True)
+    version_dir = tempfile.mkdtemp(dir=store_dir, prefix=VERSION_PREFIX)
+
+    def save(name: str, array: np.ndarray) -> None:
+        np.save(os.path.join(version_dir, f"{name}.npy"), array)
+
+    ids = np.asarray(dish_ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    save("dish_id", ids)
+    save("id_order", order.astype(np.int64))
+    save("id_sorted", ids[order])
+    lengths = np.fromiter((len(n) for n in names), dtype=np.int64, count=len(names))
+    save("nome.offsets", np.concatenate(([0], np.cumsum(lengths))).astype(np.int64))
+    save("nome.utf8", np.frombuffer(b"".join(names), dtype=np.uint8))
+    save("estratto", np.asarray(estratto, dtype=np.uint8))
+    for c in DICT_COLUMNS:
+        save(c, np.asarray(dict_codes[c], dtype=np.int32))
+    for c in LIST_COLUMNS:
+        save(f"{c}.indptr", np.asarray(indptr[c], dtype=np.int64))
+        save(f"{c}.codes", np.asarray(list_codes[c], dtype=np.int32))
+
+    header = {
+        "version": FORMAT_VERSION,
+        "n_dishes": len(dish_ids),
+        "sources": sources or {},
+        "vocab": {c: vocab[c].values for c in vocab},
+    }
+    with open(os.path.join(version_dir, "header.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+
+    previous = _current_version(store_dir)
+    fd, tmp_path = tempfile.mkstemp(dir=store_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(tmp_path, os.path.join(store_dir, CURRENT_FILE))
+    _remove_old_versions(store_dir, keep={os.path.basename(version_dir), previous})
+    return DishStore(store_dir)
+
+
+def _current_version(store_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(store_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _remove_old_versions(store_dir: str, keep: set) -> None:
+    """
+    Elimina le versioni superate. La precedente resta: un lettore che l'ha
+    appena risolta può ancora aprirne le colonne. Le costruzioni senza
+    header.json sono di un altro processo ancora al lavoro, salvo se vecchie.
+    """
+    now = time.time()
+    for name in os.listdir(store_dir):
+        path = os.path.join(store_dir, name)
+        if name in keep or name == CURRENT_FILE:
+            continue
+        if not os.path.isdir(path):
+            # File della vecchia struttura (colonne direttamente in store_dir)
+            if name.endswith(".npy") or name == "header.json":
+                os.remove(path)
+            continue
+        if not name.startswith(VERSION_PREFIX):
+            continue
+        complete = os.path.exists(os.path.join(path, "header.json"))
+        if complete or now - os.path.getmtime(path) > STALE_BUILD_SECONDS:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class DishStore:
+    def __init__(self, store_dir: str = DISH_STORE_DIR):
+        self.store_dir = store_dir
+        version = _current_version(store_dir)
+        if version is None:
+            raise FileNotFoundError(f"❌ Nessuna versione attiva in '{store_dir}'")
+        # Risolto una volta sola: le colonne lette dopo sono della stessa versione
+        self.data_dir = os.path.join(store_dir, version)
+        with open(os.path.join(self.data_dir, "header.json"), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+        if self.header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"❌ Versione dell'archivio '{store_dir}' non supportata")
+        self.n_dishes: int = self.header["n_dishes"]
+        self.vocab: Dict[str, List[str]] = self.header["vocab"]
+
+    def __len__(self) -> int:
+        return self.n_dishes
+
+    def _column(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.data_dir, f"{name}.npy"), mmap_mode="r")
+
+    # --- Colonne (aperte al primo accesso) ---
+
+    @cached_property
+    def dish_ids(self) -> np.ndarray:
+        return self._column("dish_id")
+
+    @cached_property
+    def estratto(self) -> np.ndarray:
+        return self._column("estratto")
+
+    @cached_property
+    def _id_sorted(self) -> np.ndarray:
+        return self._column("id_sorted")
+
+    @cached_property
+    def _id_order(self) -> np.ndarray:
+        return self._column("id_order")
+
+    @cached_property
+    def _name_offsets(self) -> np.ndarray:
+        return self._column("nome.offsets")
+
+    @cached_property
+    def _name_bytes(self) -> np.ndarray:
+        return self._column("nome.utf8")
+
+    @cached_property
+    def _dict_codes(self) -> Dict[str, np.ndarray]:
+        return {c: self._column(c) for c in DICT_COLUMNS}
+
+    @cached_property
+    def _lists(self) -> Dict[str, tuple]:
+        return {c: (self._column(f"{c}.indptr"), self._column(f"{c}.codes")) for c in LIST_COLUMNS}
+
+    # --- Lookup per ID ---
+
+    def rows_of(self, dish_ids: Iterable[int]) -> np.ndarray:
+        """Riga di ciascun ID (-1 se assente), vettorizzato"""
+        ids = np.asarray(list(dish_ids), dtype=np.int64)
+        if not len(ids) or not self.n_dishes:
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self._id_sorted, ids)
+        pos = np.minimum(pos, self.n_dishes - 1)
+        found = self._id_sorted[pos] == ids
+        return np.where(found, self._id_order[pos], -1)
+
+    def row_of(self, dish_id: int) -> Optional[int]:
+        row = int(self.rows_of([dish_id])[0])
+        return row if row >= 0 else None
+
+    def contains(self, dish_ids: Iterable[int]) -> np.ndarray:
+        return self.rows_of(dish_ids) >= 0
+
+    # --- Valori di una riga ---
+
+    def nome(self, row: int) -> str:
+        start, end = self._name_offsets[row], self._name_offsets[row + 1]
+        return self._name_bytes[start:end].tobytes().decode("utf-8")
+
+    def value(self, column: str, row: int) -> str:
+        code = int(self._dict_codes[column][row])
+        return self.vocab[column][code] if code >= 0 else ""
+
+    def values(self, column: str, row: int) -> List[str]:
+        indptr, codes = self._lists[column]
+        names = self.vocab[column]
+        return [names[c] for c in codes[indptr[row]:indptr[row + 1]]]
+
+    def record(self, row: int) -> DishRecord:
+        return DishRecord(
+            dish_id=int(self.dish_ids[row]),
+            nome=self.nome(row),
+            ristorante=self.value("ristorante", row),
+            pianeta=self.value("pianeta", row),
+            **{c: self.values(c, row) for c in LIST_COLUMNS},
+        )
+
+    def records(self, only_extracted: bool = True) -> Iterator[DishRecord]:
+        """Piatti nell'ordine del CSV (di default solo quelli con una ricetta estratta)"""
+        rows = np.flatnonzero(self.estratto) if only_extracted else range(self.n_dishes)
+        for row in rows:
+            yield self.record(int(row))
+
+
+def open_dish_store(store_dir: str = DISH_STORE_DIR, ricette_path: str = RICETTE_PATH,
+                    mapping_path: str = MAPPING_PATH) -> DishStore:
+    """Apre l'archivio, ricostruendolo se manca o se le sorgenti sono cambiate"""
+    sources = _source_signature([ricette_path, mapping_path])
+    try:
+        store = DishStore(store_dir)
+        if store.header.get("sources") == sources:
+            return store
+    except (OSError, ValueError, KeyError):
+        pass
+
+    print(f"🗄️ Costruzione dell'archivio dei piatti in '{store_dir}'...")
+    records = load_dish_records(ricette_path, mapping_path)
+    return build_dish_store(records, load_dish_mapping(mapping_path), store_dir, sources)
+
+
+if __name__ == "__main__":
+    store = open_dish_store()
+    print(f"✅ {len(store)} piatti ({int(store.estratto.sum())} con ricetta estratta)")
+    for c in DICT_COLUMNS + LIST_COLUMNS:
+        print(f"   • {c}: {len(store.vocab[c])} valori distinti")
@@ -0,0 +1,202 @@
+"""
+Cache degli embedding a livello di chunk.
+
+Ogni testo viene identificato da (modello, SHA-256 del testo). Per ciascun
+modello la cache è una cartella con:
+- vectors.f32: matrice float32 (righe = embedding) letta con np.memmap
+- index.json: dimensione dei vettori e offset {hash del testo: riga}
+
+I testi non in cache vengono embeddati con richieste batch di dimensione
+configurabile. Cambiare chunk_size/chunk_overlap ricalcola solo i chunk
+con testo nuovo.
+
+Le scritture sono serializzate da un lock tra thread e da un lock su file
+(.lock nella cartella) tra processi; prima di ogni append l'indice viene
+riletto da disco. Le domande (embed_query) non finiscono su disco: hanno
+solo una piccola LRU in memoria.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo il lock tra thread
+    fcntl = None
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+QUERY_CACHE_SIZE = 256
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Lock esclusivo su file (no-op dove fcntl non esiste)"""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """Matrice float32 append-only su disco + indice hash -> riga"""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.vectors_path = os.path.join(store_dir, "vectors.f32")
+        self.index_path = os.path.join(store_dir, "index.json")
+        self.lock_path = os.path.join(store_dir, ".lock")
+        os.makedirs(store_dir, exist_ok=True)
+
+        self.dim: Optional[int] = None
+        self.offsets: Dict[str, int] = {}
+        self._matrix = None
+        self._lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        """Rilegge index.json, scartando le righe oltre la fine di vectors.f32"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            dim, offsets = data["dim"], data["offsets"]
+        except (OSError, ValueError, KeyError):
+            return
+        try:
+            rows = os.path.getsize(self.vectors_path) // (dim * 4) if dim else 0
+        except OSError:
+            rows = 0
+        self.dim = dim
+        self.offsets = {h: row for h, row in offsets.items() if row < rows}
+        self._matrix = None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def matrix(self) -> np.ndarray:
+        """Vista memory-mapped (sola lettura) delle righe indicizzate"""
+        with self._lock:
+            n_rows = max(self.offsets.values(), default=-1) + 1
+            if self._matrix is None or self._matrix.shape[0] < n_rows:
+                if not n_rows:
+                    return np.empty((0, self.dim or 0), dtype=np.float32)
+                self._matrix = np.memmap(
+                    self.vectors_path, dtype=np.float32, mode="r",
+                    shape=(n_rows, self.dim)
+                )
+            return self._matrix
+
+    def get(self, hashes: List[str]) -> np.ndarray:
+        with self._lock:
+            rows = [self.offsets[h] for h in hashes]
+            return np.array(self.matrix()[rows])
+
+    def append(self, hashes: List[str], vectors: np.ndarray) -> None:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, _file_lock(self.lock_path):
+            # Un altro processo può aver aggiunto righe dall'ultima lettura
+            self._load_index()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"⚠️ Dimensione embedding {vectors.shape[1]} diversa da quella in cache ({self.dim})")
+
+            new = {}
+            for h, v in zip(hashes, vectors):
+                if h not in self.offsets and h not in new:
+                    new[h] = v
+            if not new:
+                return
+
+            # Le righe vengono scritte prima dell'indice: un crash lascia al più righe orfane
+            start = max(self.offsets.values(), default=-1) + 1
+            with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+                f.seek(start * self.dim * 4)
+                f.write(np.stack(list(new.values())).tobytes())
+                f.truncate()
+            for i, h in enumerate(new):
+                self.offsets[h] = start + i
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "offsets": self.offsets}, f)
+            os.replace(tmp_path, self.index_path)
+            self._matrix = None
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wrapper di un modello di embedding LangChain con cache su disco
+    e richieste batch per i testi mancanti.
+    """
+
+    def __init__(self, underlying: Embeddings, model: Optional[str] = None,
+                 cache_dir: str = DEFAULT_CACHE_DIR, batch_size: int = 256):
+        self.underlying = underlying
+        self.model = model or getattr(underlying, "model", type(underlying).__name__)
+        self.batch_size = batch_size
+        safe_model = "".join(c if c.isalnum() or c in "-_." else "_" for c in self.model)
+        self.store = EmbeddingStore(os.path.join(cache_dir, safe_model))
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [_text_hash(t) for t in texts]
+
+        # Testi unici non ancora in cache, nell'ordine di prima apparizione
+        missing = {}
+        with self.store._lock:
+            for h, t in zip(hashes, texts):
+                if h not in self.store.offsets and h not in missing:
+                    missing[h] = t
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+
+        missing_items = list(missing.items())
+        for start in range(0, len(missing_items), self.batch_size):
+            batch = missing_items[start:start + self.batch_size]
+            vectors = self.underlying.embed_documents([t for _, t in batch])
+            self.store.append([h for h, _ in batch], np.asarray(vectors, dtype=np.float32))
+
+        if not texts:
+            return []
+        return self.store.get(hashes).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Le domande non vanno su disco: solo una LRU in memoria"""
+        with self._lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+                return list(vector)
+        vector = self.underlying.embed_query(text)
+        with self._lock:
+            self._queries[text] = vector
+            if len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return list(vector)
+
+    def print_stats(self) -> None:
+        total = self.hits + self.misses
+        if total:
+            print(f"🧮 Cache embedding ({self.model}): {self.hits} hit, {self.misses} calcolati "
+                  f"({len(self.store)} vettori in cache)")
@@ -0,0 +1,208 @@
+"""
+Riconoscimento di ingredienti e tecniche nel testo delle domande con un
+automa di Aho–Corasick: tutte le occorrenze del vocabolario vengono trovate
+in un'unica passata lineare sul testo, indipendentemente dalla dimensione
+del vocabolario.
+
+Il testo viene normalizzato (minuscolo, senza accenti, ’ -> ') mantenendo
+la corrispondenza con gli offset del testo originale. Ogni occorrenza è
+marcata come negata se cade in una clausola introdotta da "senza",
+"escludendo", "evitando", ... La clausola si chiude alla prima
+punteggiatura o "ma"/"però" dopo l'oggetto negato: "evitando però X" e
+"senza però X" negano X, "non solo X ma anche Y" non nega nulla.
+"""
+
+import re
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dish_records import DishRecord, normalize_name
+
+# Parole che aprono una clausola negativa ("senza X", "escludendo X", ...)
+NEGATION_CUES = ("senza", "non", "escludendo", "escludono", "escluso", "esclusi",
+                 "evitando", "evitano", "evita", "tranne", "eccetto")
+NEGATION_RE = re.compile(r"\b(" + "|".join(NEGATION_CUES) + r")\b")
+# Punteggiatura e congiunzioni avversative chiudono la clausola negativa
+CLAUSE_BREAK_RE = re.compile(r"[,.;:?!]|\bma\b|\bpero\b")
+PUNCTUATION_RE = re.compile(r"[,.;:?!]")
+# "non solo X ma anche Y": nessuna negazione
+NOT_ONLY_RE = re.compile(r"\s*(solo|soltanto|solamente)\b")
+
+
+@dataclass
+class SpottedEntity:
+    kind: str       # es. "ingrediente" | "tecnica"
+    name: str       # nome come compare nel vocabolario
+    key: str        # nome normalizzato
+    start: int      # offset nel testo originale
+    end: int
+    negated: bool = False
+
+
+def normalize_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """
+    Normalizza come normalize_name e restituisce, per ogni carattere del testo
+    normalizzato, l'offset del carattere originale da cui proviene.
+    """
+    chars, offsets = [], []
+    for i, c in enumerate(text):
+        if c.isspace():
+            # Spazi consecutivi collassati in uno solo
+            if chars and chars[-1] != " ":
+                chars.append(" ")
+                offsets.append(i)
+            continue
+        if c in "’‘`":
+            c = "'"
+        for d in unicodedata.normalize("NFKD", c):
+            if unicodedata.combining(d):
+                continue
+            for low in d.lower():
+                chars.append(low)
+                offsets.append(i)
+    return "".join(chars), offsets
+
+
+class AhoCorasick:
+    """Automa di Aho–Corasick su stringhe (pattern già normalizzati)"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str) -> None:
+        state = 0
+        for c in pattern:
+            nxt = self.goto[state].get(c)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][c] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = nxt
+        self.output[state].append(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build(self) -> None:
+        # BFS: i figli della radice falliscono sulla radice, gli altri sul
+        # suffisso proprio più lungo presente nel trie
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(c, 0) if state else 0
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def iter(self, text: str):
+        """Genera (inizio, fine, indice del pattern) per ogni occorrenza"""
+        state = 0
+        for i, c in enumerate(text):
+            while state and c not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(c, 0)
+            for p in self.output[state]:
+                yield i + 1 - len(self.patterns[p]), i + 1, p
+
+
+class EntitySpotter:
+    def __init__(self, vocabulary: Dict[str, Iterable[str]]):
+        """vocabulary: {tipo: nomi}, es. {"ingrediente": [...], "tecnica": [...]}"""
+        self.entries: List[Tuple[str, str]] = []  # (tipo, nome) per pattern
+        keys = []
+        seen = set()
+        for kind, names in vocabulary.items():
+            for name in names:
+                key = normalize_name(name)
+                if not key or (kind, key) in seen:
+                    continue
+                seen.add((kind, key))
+                self.entries.append((kind, name))
+                keys.append(key)
+        self.automaton = AhoCorasick(keys)
+
+    @classmethod
+    def from_records(cls, records: List[DishRecord],
+                     techniques: Optional[Iterable[str]] = None) -> "EntitySpotter":
+        ingredients = [x for r in records for x in r.ingredienti]
+        all_techniques = [x for r in records for x in r.tecniche] + list(techniques or [])
+        return cls({"ingrediente": ingredients, "tecnica": all_techniques})
+
+    def spot(self, text: str, overlapping: bool = False) -> List[SpottedEntity]:
+        """
+        Tutte le occorrenze del vocabolario nel testo, ordinate per posizione.
+        Con overlapping=False tiene solo le occorrenze più lunghe non sovrapposte.
+        """
+        norm, offsets = normalize_with_offsets(text)
+        found = []
+        for start, end, p in self.automaton.iter(norm):
+            # Solo parole intere: "latte" non deve matchare dentro "lattuga"
+            if start > 0 and _is_word(norm[start - 1]) and _is_word(norm[start]):
+                continue
+            if end < len(norm) and _is_word(norm[end]) and _is_word(norm[end - 1]):
+                continue
+            found.append((start, end, p))
+
+        if not overlapping:
+            found.sort(key=lambda m: (-(m[1] - m[0]), m[0]))
+            taken = [False] * len(norm)
+            selected = []
+            for start, end, p in found:
+                if any(taken[start:end]):
+                    continue
+                for i in range(start, end):
+                    taken[i] = True
+                selected.append((start, end, p))
+            found = selected
+
+        negation_spans = _negation_spans(norm, [start for start, _, _ in found])
+        entities = []
+        for start, end, p in sorted(found):
+            kind, name = self.entries[p]
+            entities.append(SpottedEntity(
+                kind=kind,
+                name=name,
+                key=self.automaton.patterns[p],
+                start=offsets[start],
+                end=offsets[end - 1] + 1,
+                negated=any(a <= start < b for a, b in negation_spans),
+            ))
+        return entities
+
+
+def _is_word(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+
+def _negation_spans(norm: str, entity_starts: List[int]) -> List[Tuple[int, int]]:
+    """
+    Intervalli (nel testo normalizzato) coperti da una clausola negativa.
+    Prima dell'oggetto negato (la prima entità dopo il trigger) chiude la
+    clausola solo la punteggiatura: "ma"/"però" subito dopo il trigger
+    ("evitando però X") non la interrompono.
+    """
+    spans = []
+    for m in NEGATION_RE.finditer(norm):
+        if m.group(1) == "non" and NOT_ONLY_RE.match(norm, m.end()):
+            continue
+        first = min((s for s in entity_starts if s >= m.end()), default=None)
+        punct = PUNCTUATION_RE.search(norm, m.end())
+        if first is None or (punct is not None and punct.start() < first):
+            end = punct.start() if punct else len(norm)
+        else:
+            brk = CLAUSE_BREAK_RE.search(norm, first)
+            end = brk.start() if brk else len(norm)
+        spans.append((m.end(), end))
+    return spans
@@ -2,30 +2,63 @@ import os
 import csv
 import json
 import re
+import time
+import argparse
+import tempfile
+import difflib
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from glob import glob
-from unstructured.partition.pdf import partition_pdf
-from openai import OpenAI
 from dotenv import load_dotenv
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("⚠️ Variabile OPENAI_API_KEY mancante nel .env")
+from pdf_cache import hash_file, load_partition_pages
+from llm_cache import chat_completion, get_default_cache
+from token_packer import count_tokens
+from dish_records import normalize_name, split_list
+from backends import make_chat_client, require_api_key
+from tracing import get_tracer
 
-client = OpenAI(api_key=api_key)
+_client = None
+
+
+def get_client():
+    """Client creato al primo uso (in ogni processo del pool), non all'import"""
+    global _client
+    if _client is None:
+        load_dotenv()
+        # Con HACKAPIZZA_BACKEND=local la chiave non serve e le risposte sono simulate
+        _client = make_chat_client(api_key=require_api_key())
+    return _client
+
+
+MODELLO_ESTRAZIONE = "gpt-3.5-turbo"
+# Oltre questo numero di token il PDF viene estratto in map-reduce a gruppi di pagine
+MAX_TOKEN_GRUPPO = int(os.getenv("MAX_TOKEN_GRUPPO", "6000"))
+# Coda del gruppo precedente ripetuta all'inizio del successivo, per i piatti a cavallo di pagina
+OVERLAP_CARATTERI = 800
 
 def extract_text_from_pdf(pdf_file):
     """
     Estrae TUTTO il testo grezzo da un PDF.
+    Il testo per pagina viene letto dalla cache su disco se il PDF non è cambiato.
     """
-    elements = partition_pdf(
-        filename=pdf_file,
-        strategy="fast",
-        infer_table_structure=False,
-        extract_images_in_pdf=False
-    )
-    texts = [el.text.strip() for el in elements if el.text.strip()]
-    return "\n\n".join(texts)
+    pages = load_partition_pages(pdf_file, strategy="fast")
+    return "\n\n".join(p for p in pages if p)
+
+def extract_pages_from_pdf(pdf_file):
+    """
+    Testo del PDF pagina per pagina (dalla cache su disco se il PDF non è cambiato).
+    """
+    return [p for p in load_partition_pages(pdf_file, strategy="fast") if p]
+
+def _load_pages_timed(pdf_file):
+    """
+    extract_pages_from_pdf per il process pool: restituisce anche inizio e
+    durata, così il processo padre registra lo span pdf_load.
+    """
+    start, t0 = time.time(), time.perf_counter()
+    pages = extract_pages_from_pdf(pdf_file)
+    return pages, start, (time.perf_counter() - t0) * 1000
 
 def extract_json_from_response(text):
     """
@@ -39,16 +72,77 @@ def extract_json_from_response(text):
     else:
         return text.strip()
 
+def _as_list(value):
+    """Il modello a volte restituisce le liste come stringhe separate da virgola"""
+    if isinstance(value, list):
+        return [str(x).strip() for x in value if str(x).strip()]
+    return split_list(str(value or ""))
+
+def _parse_menu(data):
+    """
+    Normalizza il JSON del modello in
+    {"ristorante": {"pianeta", "chef", "licenze": [{"nome", "livello"}]},
+     "ricette": [{"nome", "ingredienti", "tecniche", "ordini"}]}
+    """
+    if isinstance(data, list):
+        # Vecchio formato: solo la lista di ricette
+        data = {"ristorante": {}, "ricette": data}
+    if not isinstance(data, dict) or not isinstance(data.get("ricette"), list):
+        raise ValueError("Il JSON restituito non contiene la lista 'ricette'.")
+
+    info = data.get("ristorante") or {}
+    licenze = []
+    for lic in info.get("licenze") or []:
+        if isinstance(lic, dict) and lic.get("nome"):
+            licenze.append({"nome": str(lic["nome"]).strip(), "livello": str(lic.get("livello", "")).strip()})
+    ricette = []
+    for r in data["ricette"]:
+        if not isinstance(r, dict):
+            continue
+        ricette.append({
+            "nome": str(r.get("nome", "")).strip(),
+            "ingredienti": _as_list(r.get("ingredienti")),
+            "tecniche": _as_list(r.get("tecniche")),
+            "ordini": _as_list(r.get("ordini")),
+        })
+    return {
+        "ristorante": {
+            "pianeta": str(info.get("pianeta") or "").strip(),
+            "chef": str(info.get("chef") or "").strip(),
+            "licenze": licenze,
+        },
+        "ricette": ricette,
+    }
+
+def empty_menu():
+    return {"ristorante": {"pianeta": "", "chef": "", "licenze": []}, "ricette": []}
+
 def call_gpt_extract_recipes(text):
     """
-    Chiede a GPT di identificare le ricette e restituirle in JSON.
+    Chiede a GPT di estrarre in un solo passaggio le informazioni del
+    ristorante (pianeta, chef, licenze) e le ricette con ingredienti,
+    tecniche e ordini professionali, restituite in JSON.
     """
     prompt = f"""
 Il testo seguente proviene da un menu in PDF. 
-Analizza attentamente e restituisci una lista JSON di ricette.
-Ogni ricetta DEVE avere questi campi:
-- nome (stringa): nome completo del piatto
-- ingredienti (stringa): elenco degli ingredienti principali
+Analizza attentamente e restituisci un oggetto JSON con questa struttura:
+{{
+  "ristorante": {{
+    "pianeta": "pianeta su cui si trova il ristorante (stringa, vuota se non indicato)",
+    "chef": "nome dello chef (stringa)",
+    "licenze": [{{"nome": "es. Psionica", "livello": "es. III"}}]
+  }},
+  "ricette": [
+    {{
+      "nome": "nome completo del piatto",
+      "ingredienti": ["ingrediente", "..."],
+      "tecniche": ["tecnica di preparazione", "..."],
+      "ordini": ["ordine professionale per cui il piatto è indicato", "..."]
+    }}
+  ]
+}}
+Riporta ingredienti e tecniche esattamente come sono scritti nelle sezioni
+"Ingredienti" e "Tecniche" di ogni piatto. Usa liste vuote se un'informazione manca.
 
 Restituisci SOLO il JSON.
 
@@ -58,60 +152,349 @@ Testo:
 \"\"\"
 """
 
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
+    content = chat_completion(
+        get_client(),
+        model=MODELLO_ESTRAZIONE,
         messages=[
             {"role": "system", "content": "Sei un assistente culinario che estrae dati strutturati da menu PDF."},
             {"role": "user", "content": prompt}
         ],
         temperature=0
-    )
-    content = response.choices[0].message.content.strip()
+    ).strip()
 
     clean_json = extract_json_from_response(content)
 
     try:
-        recipes = json.loads(clean_json)
-        if not isinstance(recipes, list):
-            raise ValueError("Il JSON restituito non è una lista.")
+        menu = _parse_menu(json.loads(clean_json))
     except Exception as e:
         print("⚠️ Errore nel parsing JSON:", e)
         print("Risposta grezza GPT:\n", content)
-        return []
+        return empty_menu()
 
-    return recipes
+    return menu
+
+def group_pages(pages, max_tokens=MAX_TOKEN_GRUPPO):
+    """
+    Raggruppa pagine consecutive in gruppi di al massimo max_tokens token.
+    Ogni gruppo (tranne il primo) inizia con la coda del gruppo precedente.
+    """
+    groups = []
+    current, current_tokens = [], 0
+    for page in pages:
+        page_tokens = count_tokens(page, MODELLO_ESTRAZIONE)
+        if current and current_tokens + page_tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(page)
+        current_tokens += page_tokens
+    if current:
+        groups.append(current)
+
+    texts = []
+    for i, group in enumerate(groups):
+        text = "\n\n".join(group)
+        if i > 0:
+            text = "\n\n".join(groups[i - 1])[-OVERLAP_CARATTERI:] + "\n\n" + text
+        texts.append(text)
+    return texts
+
+def _merge_unique(target, values):
+    seen = {normalize_name(x) for x in target}
+    for v in values:
+        if normalize_name(v) not in seen:
+            seen.add(normalize_name(v))
+            target.append(v)
+
+def merge_menus(partial_menus):
+    """
+    Unisce i risultati parziali dei gruppi di pagine: i piatti con lo stesso nome
+    (normalizzato, o quasi identico) vengono fusi unendo ingredienti, tecniche e
+    ordini; delle informazioni sul ristorante si tiene il primo valore non vuoto.
+    """
+    menu = empty_menu()
+    merged = {}
+    for partial in partial_menus:
+        info = partial["ristorante"]
+        for campo in ("pianeta", "chef"):
+            menu["ristorante"][campo] = menu["ristorante"][campo] or info.get(campo, "")
+        nomi_licenze = {l["nome"] for l in menu["ristorante"]["licenze"]}
+        menu["ristorante"]["licenze"] += [l for l in info.get("licenze", []) if l["nome"] not in nomi_licenze]
+
+        for r in partial["ricette"]:
+            if not r["nome"]:
+                continue
+            key = normalize_name(r["nome"])
+            if key not in merged:
+                simili = difflib.get_close_matches(key, list(merged), n=1, cutoff=0.9)
+                key = simili[0] if simili else key
+            entry = merged.setdefault(key, {"nome": r["nome"], "ingredienti": [], "tecniche": [], "ordini": []})
+            for campo in ("ingredienti", "tecniche", "ordini"):
+                _merge_unique(entry[campo], r[campo])
+    menu["ricette"] = list(merged.values())
+    return menu
+
+def extract_recipes_from_pages(pages, pdf_file=None):
+    """
+    Estrae le ricette dal testo per pagina: una sola chiamata se il documento
+    sta nel budget, altrimenti map-reduce sui gruppi di pagine in parallelo.
+    """
+    groups = group_pages(pages)
+    attrs = {"pdf": restaurant_name(pdf_file)} if pdf_file else {}
+    with get_tracer().span("pdf", pages=len(pages), groups=max(len(groups), 1), **attrs) as span:
+        if len(groups) <= 1:
+            menu = call_gpt_extract_recipes("\n\n".join(pages))
+        else:
+            print(f"🧩 Documento grande: {len(pages)} pagine in {len(groups)} gruppi estratti in parallelo")
+            with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+                # I thread non ereditano il contesto: ogni gruppo riceve una copia dello span corrente
+                futures = [pool.submit(contextvars.copy_context().run, call_gpt_extract_recipes, g)
+                           for g in groups]
+                partial_menus = [f.result() for f in futures]
+            menu = merge_menus(partial_menus)
+        span.set(n_ricette=len(menu["ricette"]))
+    return menu
+
+CSV_HEADER = ["ristorante", "nome_ricetta", "ingredienti", "tecniche", "ordini",
+              "pianeta", "chef", "licenze"]
+
+def menu_rows(ristorante, menu):
+    """Righe CSV di un menu: le liste sono separate da virgola, le licenze come 'Nome Livello'"""
+    info = menu["ristorante"]
+    licenze = ", ".join(f"{l['nome']} {l['livello']}".strip() for l in info["licenze"])
+    return [
+        [ristorante, r["nome"], ", ".join(r["ingredienti"]), ", ".join(r["tecniche"]),
+         ", ".join(r["ordini"]), info["pianeta"], info["chef"], licenze]
+        for r in menu["ricette"] if r["nome"]
+    ]
+
+def write_parquet(output_csv, parquet_path):
+    """
+    Converte il CSV in un file colonnare tipizzato (Parquet): le colonne
+    lista diventano list<string>, le licenze list<struct<nome, livello>>.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("⚠️ pyarrow non installato: file Parquet non generato")
+        return
+
+    with open(output_csv, "r", newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+
+    def licenze(value):
+        out = []
+        for item in split_list(value):
+            nome, _, livello = item.rpartition(" ")
+            out.append({"nome": nome or livello, "livello": livello if nome else ""})
+        return out
+
+    table = pa.table({
+        "ristorante": pa.array([r["ristorante"] for r in rows], pa.string()),
+        "nome_ricetta": pa.array([r["nome_ricetta"] for r in rows], pa.string()),
+        "ingredienti": pa.array([split_list(r["ingredienti"]) for r in rows], pa.list_(pa.string())),
+        "tecniche": pa.array([split_list(r.get("tecniche")) for r in rows], pa.list_(pa.string())),
+        "ordini": pa.array([split_list(r.get("ordini")) for r in rows], pa.list_(pa.string())),
+        "pianeta": pa.array([r.get("pianeta") or "" for r in rows], pa.string()).dictionary_encode(),
+        "chef": pa.array([r.get("chef") or "" for r in rows], pa.string()),
+        "licenze": pa.array([licenze(r.get("licenze")) for r in rows],
+                            pa.list_(pa.struct([("nome", pa.string()), ("livello", pa.string())]))),
+    })
+    pq.write_table(table, parquet_path)
+    print(f"🗂️ File colonnare creato: {parquet_path}")
+
+def extract_recipes_parallel(pdf_files, workers):
+    """
+    Elabora i PDF in parallelo: il partizionamento (CPU-bound) gira in un
+    process pool, le chiamate a GPT (I/O-bound) in un thread pool.
+    Ogni chiamata LLM parte appena il testo del suo PDF è pronto.
+
+    Genera (pdf_file, ricette) in ordine di completamento; ricette è None
+    se l'elaborazione del PDF è fallita.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pdf_pool, \
+            ThreadPoolExecutor(max_workers=workers) as llm_pool:
+        submitted = time.time()
+        futures_testo = {pdf_pool.submit(_load_pages_timed, f): f for f in pdf_files}
+        futures_llm = {}
+        pending = set(futures_testo)
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut in futures_testo:
+                    pdf_file = futures_testo[fut]
+                    ristorante = restaurant_name(pdf_file)
+                    try:
+                        pages, start, duration_ms = fut.result()
+                    except Exception as e:
+                        # Tempi misurati dal padre: dall'invio al pool fino all'errore
+                        get_tracer().record("pdf_load", submitted, (time.time() - submitted) * 1000,
+                                            pdf=ristorante, error=f"{type(e).__name__}: {e}")
+                        print(f"⚠️ Errore nella lettura di '{pdf_file}': {e}")
+                        yield pdf_file, None
+                        continue
+                    # Il pool non ha il tracer del padre: lo span si registra qui, con i tempi del worker
+                    get_tracer().record("pdf_load", start, duration_ms, pdf=ristorante)
+                    fut_llm = llm_pool.submit(extract_recipes_from_pages, pages, pdf_file)
+                    futures_llm[fut_llm] = pdf_file
+                    pending.add(fut_llm)
+                else:
+                    pdf_file = futures_llm[fut]
+                    try:
+                        yield pdf_file, fut.result()
+                    except Exception as e:
+                        print(f"⚠️ Errore GPT per '{pdf_file}': {e}")
+                        yield pdf_file, None
+
+def extract_recipes_sequential(pdf_files):
+    """
+    Elabora i PDF uno alla volta (comportamento originale).
+    """
+    for pdf_file in pdf_files:
+        ristorante = os.path.splitext(os.path.basename(pdf_file))[0]
+        print(f"📄 Elaboro '{ristorante}'...")
+        with get_tracer().span("pdf_load", pdf=ristorante):
+            pages = extract_pages_from_pdf(pdf_file)
+        yield pdf_file, extract_recipes_from_pages(pages, pdf_file)
+
+def restaurant_name(pdf_file):
+    return os.path.splitext(os.path.basename(pdf_file))[0]
+
+def load_manifest(manifest_path):
+    """
+    Manifest dei PDF completati: {pdf_file: {"sha256": ..., "ristorante": ..., "n_ricette": ...}}
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("pdfs", {})
+    except (OSError, ValueError):
+        return {}
+
+def _atomic_write(path, write_fn):
+    """Scrive su un file temporaneo, fsync e rename: il file non resta mai a metà"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+        write_fn(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def save_manifest(manifest_path, completed):
+    _atomic_write(manifest_path, lambda f: json.dump({"pdfs": completed}, f, ensure_ascii=False, indent=2))
+
+def rewrite_csv(output_csv, keep_row=lambda row: True, order=None):
+    """
+    Riscrive il CSV tenendo solo le righe per cui keep_row(row) è vero.
+    Con order (lista di ristoranti) le righe vengono ordinate in modo stabile per ristorante.
+    """
+    with open(output_csv, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, CSV_HEADER)
+        rows = [row for row in reader if row and keep_row(row)]
+    if order is not None:
+        position = {r: i for i, r in enumerate(order)}
+        rows.sort(key=lambda row: position.get(row[0], len(position)))
+
+    def write(f):
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    _atomic_write(output_csv, write)
 
 def main():
+    parser = argparse.ArgumentParser(description="Estrae le ricette dai menu PDF con GPT")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Numero di PDF elaborati in parallelo (default: 1, sequenziale)")
+    parser.add_argument("--output", default="ricette_estratte_agentico.csv",
+                        help="CSV di output (default: ricette_estratte_agentico.csv)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Riprende un'estrazione interrotta saltando i PDF già completati")
+    parser.add_argument("--parquet", default="ricette_strutturate.parquet",
+                        help="File colonnare tipizzato generato a fine estrazione")
+    parser.add_argument("--only-changed", action="store_true",
+                        help="Ri-estrae solo i menu nuovi o modificati e rimuove quelli cancellati")
+    args = parser.parse_args()
+    # Chiave mancante: errore subito, prima di leggere i PDF
+    get_client()
+
     pdf_folder = "Hackapizza Dataset/Menu/"
-    output_csv = "ricette_estratte_agentico.csv"
+    output_csv = args.output
+    manifest_path = output_csv + ".manifest.json"
 
-    pdf_files = glob(os.path.join(pdf_folder, "*.pdf"))
+    # Ordine stabile: il CSV finale non dipende dall'ordine di glob né dal completamento
+    pdf_files = sorted(glob(os.path.join(pdf_folder, "*.pdf")))
     if not pdf_files:
         raise FileNotFoundError("❌ Nessun PDF trovato nella cartella 'Menu'.")
+    hashes = {f: hash_file(f) for f in pdf_files}
 
-    with open(output_csv, "w", newline="", encoding="utf-8") as f_out:
-        writer = csv.writer(f_out)
-        writer.writerow(["ristorante", "nome_ricetta", "ingredienti"])
+    incremental = (args.resume or args.only_changed) and os.path.exists(output_csv)
+    if incremental:
+        with open(output_csv, "r", newline="", encoding="utf-8") as f:
+            if next(csv.reader(f), None) != CSV_HEADER:
+                print("♻️ CSV esistente in un formato precedente: estrazione completa")
+                incremental = False
+    if incremental:
+        completed = load_manifest(manifest_path)
+        if args.only_changed:
+            completed = {f: c for f, c in completed.items() if f in hashes}
+        todo = [f for f in pdf_files
+                if completed.get(f, {}).get("sha256") != hashes[f]]
+        for f in todo:
+            completed.pop(f, None)
+        # Via le righe dei ristoranti da ri-estrarre (anche parziali di un run interrotto)
+        # e, con --only-changed, quelle dei menu rimossi
+        keep = {c["ristorante"] for c in completed.values()}
+        if args.only_changed:
+            rewrite_csv(output_csv, lambda row: row[0] in keep)
+        else:
+            redo = {restaurant_name(f) for f in todo}
+            rewrite_csv(output_csv, lambda row: row[0] not in redo)
+        save_manifest(manifest_path, completed)
+        print(f"⏩ {len(pdf_files) - len(todo)} PDF già completati, {len(todo)} da elaborare")
+    else:
+        completed = {}
+        todo = pdf_files
+        _atomic_write(output_csv, lambda f: csv.writer(f).writerow(CSV_HEADER))
+        save_manifest(manifest_path, completed)
+
+    if args.workers > 1 and len(todo) > 1:
+        print(f"⚡ Elaborazione parallela di {len(todo)} PDF con {args.workers} worker...")
+        risultati = extract_recipes_parallel(todo, args.workers)
+    else:
+        risultati = extract_recipes_sequential(todo)
 
-        for pdf_file in pdf_files:
-            ristorante = os.path.splitext(os.path.basename(pdf_file))[0]
-            print(f"📄 Elaboro '{ristorante}'...")
+    # Ogni ristorante viene aggiunto e sincronizzato su disco appena completato,
+    # poi registrato nel manifest: un crash perde al più i ristoranti in corso
+    with open(output_csv, "a", newline="", encoding="utf-8") as f_out:
+        writer = csv.writer(f_out)
 
-            text = extract_text_from_pdf(pdf_file)
-            recipes = call_gpt_extract_recipes(text)
+        for pdf_file, menu in risultati:
+            ristorante = restaurant_name(pdf_file)
+            recipes = menu_rows(ristorante, menu) if menu else []
 
             if not recipes:
                 print(f"⚠️ Nessuna ricetta trovata in '{ristorante}'.")
                 continue
 
-            for r in recipes:
-                nome = r.get("nome", "").strip()
-                ingredienti = r.get("ingredienti", "").strip()
-                writer.writerow([ristorante, nome, ingredienti])
+            writer.writerows(recipes)
+            f_out.flush()
+            os.fsync(f_out.fileno())
+
+            completed[pdf_file] = {"sha256": hashes[pdf_file], "ristorante": ristorante, "n_ricette": len(recipes)}
+            save_manifest(manifest_path, completed)
 
             print(f"✅ Estratte {len(recipes)} ricette da '{ristorante}'.")
 
+    # Ordine finale stabile per ristorante, indipendente dall'ordine di completamento
+    rewrite_csv(output_csv, order=[restaurant_name(f) for f in pdf_files])
+
+    mancanti = [restaurant_name(f) for f in pdf_files if f not in completed]
+    if mancanti:
+        print(f"⚠️ {len(mancanti)} menu senza ricette, rilancia con --resume: {', '.join(mancanti)}")
     print(f"✅ File creato: {output_csv}")
+    write_parquet(output_csv, args.parquet)
+    get_default_cache().print_stats()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
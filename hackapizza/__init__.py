@@ -0,0 +1,15 @@
+"""
+Punto d'ingresso unico delle pipeline Hackapizza.
+
+    python -m hackapizza --help
+    python -m hackapizza extract --workers 4
+    python -m hackapizza index --pipeline rag2 --dish-chunks
+    python -m hackapizza ask "Quali piatti contengono Latte+?"
+    python -m hackapizza run --pipeline attempt
+    python -m hackapizza validate --submission risposte.csv
+    python -m hackapizza submit risposte.csv --team "Team Alpha"
+
+I moduli restano nella radice del repository (attempt.py, rag.py, ...):
+il pacchetto contiene solo la CLI, che li importa all'interno del comando
+che li usa. Va eseguito dalla radice del repository, come gli script.
+"""
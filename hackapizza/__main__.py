@@ -0,0 +1,3 @@
+from hackapizza.cli import main
+
+main()
@@ -0,0 +1,109 @@
+"""
+CLI con i sottocomandi extract, index, ask, run, serve, validate e submit.
+
+All'avvio si importa solo argparse: langchain, FAISS, pandas e openai
+vengono importati dal comando che li usa, quindi `--help` e i comandi
+leggeri (validate, submit) non pagano il costo delle pipeline.
+extract, run, serve, validate e submit passano gli argomenti restanti al
+main() dello script corrispondente.
+"""
+
+import sys
+import json
+import argparse
+import importlib
+from typing import List, Optional
+
+PIPELINES = ("attempt", "rag", "rag2")
+# Sottocomando -> script il cui main() riceve gli argomenti restanti
+SCRIPTS = {
+    "extract": ("extract_recipe_agent", "Estrae le ricette dai menu PDF (extract_recipe_agent.py)"),
+    "serve": ("qa_service", "Servizio HTTP locale con la pipeline già caricata (qa_service.py)"),
+    "validate": ("validate_submission", "Valida un CSV di submission (validate_submission.py)"),
+    "submit": ("submit_to_server", "Sottomette un CSV al server di valutazione (submit_to_server.py)"),
+}
+
+
+def _delegate(module_name: str, argv: List[str]) -> None:
+    module = importlib.import_module(module_name)
+    sys.argv = [f"{module_name}.py"] + argv
+    module.main()
+
+
+def cmd_index(args) -> None:
+    if args.pipeline == "attempt":
+        from dish_store import open_dish_store
+        store = open_dish_store()
+        print(f"✅ Archivio dei piatti pronto: {store.n_dishes} piatti")
+        return
+    module = importlib.import_module(args.pipeline)
+    pipeline = module.build_pipeline(dish_chunks=args.dish_chunks)
+    pipeline.embedding.print_stats()
+
+
+def cmd_ask(args) -> None:
+    if args.url:
+        from urllib.request import Request, urlopen
+        request = Request(args.url.rstrip("/") + "/batch",
+                          data=json.dumps({"domande": args.domande}).encode("utf-8"),
+                          headers={"Content-Type": "application/json"}, method="POST")
+        with urlopen(request) as response:
+            risposte = [r["ids"] for r in json.load(response)["risposte"]]
+    else:
+        from qa_service import load_pipeline
+        kwargs = {"dish_chunks": True} if args.dish_chunks and args.pipeline != "attempt" else {}
+        _, answer_batch = load_pipeline(args.pipeline, **kwargs)
+        risposte = [ids for ids, _ in answer_batch(args.domande)]
+
+    if args.json:
+        json.dump([{"domanda": d, "ids": ids} for d, ids in zip(args.domande, risposte)],
+                  sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+    for domanda, ids in zip(args.domande, risposte):
+        print(f"➡️ {domanda}")
+        print(f"✅ ID: {', '.join(map(str, ids)) if ids else 'nessuno'}")
+
+
+def cmd_run(args) -> None:
+    _delegate(args.pipeline, [])
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m hackapizza", description="Pipeline Hackapizza")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    for name, (module_name, help_text) in SCRIPTS.items():
+        p = sub.add_parser(name, help=help_text, add_help=False)
+        p.set_defaults(func=lambda args, m=module_name: _delegate(m, args.extra), passthrough=True)
+
+    p = sub.add_parser("index", help="Costruisce o aggiorna l'indice di una pipeline")
+    p.add_argument("--pipeline", choices=PIPELINES, default="rag2")
+    p.add_argument("--dish-chunks", action="store_true", help="Un chunk per piatto (rag/rag2)")
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser("ask", help="Risponde a una o più domande con gli ID dei piatti")
+    p.add_argument("domande", nargs="+")
+    p.add_argument("--pipeline", choices=PIPELINES, default="rag2")
+    p.add_argument("--dish-chunks", action="store_true", help="Un chunk per piatto (rag/rag2)")
+    p.add_argument("--url", default=None, help="Usa un qa_service già avviato (es. http://127.0.0.1:8765)")
+    p.add_argument("--json", action="store_true", help="Stampa le risposte in JSON")
+    p.set_defaults(func=cmd_ask)
+
+    p = sub.add_parser("run", help="Esegue lo script completo di una pipeline")
+    p.add_argument("--pipeline", choices=PIPELINES, default="attempt")
+    p.set_defaults(func=cmd_run)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = build_parser()
+    # Gli argomenti non riconosciuti (anche --help) vanno allo script delegato
+    args, args.extra = parser.parse_known_args(argv)
+    if args.extra and not getattr(args, "passthrough", False):
+        parser.error(f"argomenti non riconosciuti: {' '.join(args.extra)}")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
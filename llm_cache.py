@@ -0,0 +1,213 @@
+"""
+Cache persistente (SQLite) delle risposte LLM.
+
+La chiave è l'hash di (modello, messaggi, parametri): rilanciare la pipeline
+dopo una piccola modifica al prompt paga solo i prompt cambiati.
+
+Modalità (variabile d'ambiente LLM_CACHE_MODE):
+- "readwrite" (default): legge dalla cache, in caso di miss chiama il modello e salva
+- "replay": legge SOLO dalla cache, un miss solleva ReplayMissError
+  (nessuna chiamata di rete: utile per benchmark di regressione offline)
+- "off": cache disattivata
+
+Usata da extract_recipe_agent.py, attempt.py e (tramite install_langchain_cache)
+dalle RetrievalQA di rag.py/rag2.py.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from tracing import current_span, get_tracer, record_llm_usage
+
+# Il backend locale (backends.py) ha un database separato: le sue risposte
+# sintetiche non devono mai finire tra quelle dei modelli reali
+DEFAULT_DB_PATH = os.getenv("LLM_CACHE_PATH") or (
+    ".cache/llm_cache_local.sqlite" if os.getenv("HACKAPIZZA_BACKEND") == "local"
+    else ".cache/llm_cache.sqlite"
+)
+MODES = ("readwrite", "replay", "off")
+
+
+class ReplayMissError(RuntimeError):
+    """Sollevata in modalità replay quando un prompt non è in cache"""
+
+
+class LLMCache:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, mode: Optional[str] = None):
+        mode = mode or os.getenv("LLM_CACHE_MODE", "readwrite")
+        if mode not in MODES:
+            raise ValueError(f"⚠️ Modalità cache LLM non valida: '{mode}' (attese: {', '.join(MODES)})")
+        self.mode = mode
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        if mode != "off":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            # Le pipeline chiamano la cache da thread pool diversi: serializziamo con un lock
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, request TEXT, response TEXT, created_at REAL)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages, params: Optional[Dict] = None) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params or {}},
+            sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if self._conn is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, request, response: str) -> None:
+        if self._conn is None or self.mode == "replay":
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, json.dumps(request, ensure_ascii=False), response, time.time())
+            )
+            self._conn.commit()
+
+    def cached_call(self, model: str, messages, params: Optional[Dict],
+                    call_fn: Callable[[], str]) -> str:
+        """
+        Restituisce la risposta dalla cache, oppure esegue call_fn() e la salva.
+        """
+        if self.mode == "off":
+            return call_fn()
+
+        key = self.make_key(model, messages, params)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            current_span().incr("cache_hits")
+            return cached
+
+        self.misses += 1
+        current_span().incr("cache_misses")
+        if self.mode == "replay":
+            raise ReplayMissError(f"❌ Prompt non presente in cache (modello {model}, chiave {key[:12]})")
+
+        response = call_fn()
+        self.put(key, model, {"messages": messages, "params": params or {}}, response)
+        return response
+
+    async def acached_call(self, model: str, messages, params: Optional[Dict],
+                           acall_fn: Callable[[], Awaitable[str]]) -> str:
+        """
+        Versione async di cached_call: acall_fn() è una coroutine factory.
+        """
+        if self.mode == "off":
+            return await acall_fn()
+
+        key = self.make_key(model, messages, params)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            current_span().incr("cache_hits")
+            return cached
+
+        self.misses += 1
+        current_span().incr("cache_misses")
+        if self.mode == "replay":
+            raise ReplayMissError(f"❌ Prompt non presente in cache (modello {model}, chiave {key[:12]})")
+
+        response = await acall_fn()
+        self.put(key, model, {"messages": messages, "params": params or {}}, response)
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def print_stats(self) -> None:
+        total = self.hits + self.misses
+        if total:
+            print(f"💾 Cache LLM ({self.mode}): {self.hits} hit, {self.misses} miss "
+                  f"({self.hits / total * 100:.0f}% hit rate)")
+
+
+_default_cache = None
+
+
+def get_default_cache() -> LLMCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LLMCache()
+    return _default_cache
+
+
+def chat_completion(client, model: str, messages: List[Dict], cache: Optional[LLMCache] = None,
+                    **params) -> str:
+    """
+    client.chat.completions.create con cache: restituisce il contenuto testuale
+    della prima scelta.
+    """
+    cache = cache or get_default_cache()
+
+    def call():
+        response = client.chat.completions.create(model=model, messages=messages, **params)
+        content = response.choices[0].message.content
+        record_llm_usage(model, messages, content, getattr(response, "usage", None))
+        return content
+
+    with get_tracer().span("llm_call", model=model):
+        return cache.cached_call(model, messages, params, call)
+
+
+def install_langchain_cache(cache: Optional[LLMCache] = None) -> LLMCache:
+    """
+    Registra la cache come cache globale di LangChain, così le chain
+    (es. RetrievalQA) la usano per ogni chiamata al chat model.
+    """
+    from langchain_core.caches import BaseCache
+    from langchain_core.globals import set_llm_cache
+    from langchain_core.load import dumps, loads
+
+    cache = cache or get_default_cache()
+
+    class _LangchainLLMCache(BaseCache):
+        def lookup(self, prompt, llm_string):
+            if cache.mode == "off":
+                return None
+            key = cache.make_key(llm_string, prompt)
+            cached = cache.get(key)
+            if cached is not None:
+                cache.hits += 1
+                current_span().incr("cache_hits")
+                return [loads(g) for g in json.loads(cached)]
+            cache.misses += 1
+            current_span().incr("cache_misses")
+            if cache.mode == "replay":
+                raise ReplayMissError(f"❌ Prompt non presente in cache (chiave {key[:12]})")
+            return None
+
+        def update(self, prompt, llm_string, return_val):
+            key = cache.make_key(llm_string, prompt)
+            cache.put(key, llm_string, {"prompt": prompt}, json.dumps([dumps(g) for g in return_val]))
+
+        def clear(self, **kwargs):
+            if cache._conn is not None:
+                with cache._lock:
+                    cache._conn.execute("DELETE FROM responses")
+                    cache._conn.commit()
+
+    set_llm_cache(_LangchainLLMCache())
+    return cache
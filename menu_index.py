@@ -0,0 +1,159 @@
+"""
+Indice FAISS dei menu salvato su disco, con aggiornamento incrementale.
+
+Nella cartella dell'indice vengono salvati:
+- index.faiss / index.pkl: l'indice FAISS (FAISS.save_local) con i chunk e i loro metadati
+- manifest.json: impostazioni di chunking/embedding, hash SHA-256 di ogni PDF
+  e i chunk_id generati da ciascun PDF
+
+All'avvio l'indice viene caricato; solo i PDF aggiunti o modificati vengono
+ri-letti, ri-suddivisi e ri-embeddati, mentre i chunk dei PDF rimossi o
+modificati vengono cancellati. Se cambiano le impostazioni l'indice viene
+ricostruito da zero.
+
+I chunk_id di un PDF sono consecutivi, così NeighborRetriever (rag2.py) può
+continuare a espandere cid - 1 / cid + 1.
+
+Con un PipelineStats (pipeline_stats.py) vengono misurate separatamente le
+fasi pdf_load, chunking, embedding e index_build.
+"""
+
+import os
+import json
+import tempfile
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+
+from pdf_cache import hash_file, load_pdf_documents
+
+MANIFEST_NAME = "manifest.json"
+
+
+def _stage(stats, name: str):
+    return stats.stage(name) if stats is not None else nullcontext()
+
+
+def _add_documents(db: Optional[FAISS], docs: List, ids: List[str], embedding, stats=None) -> FAISS:
+    """Embedding e inserimento nell'indice come fasi distinte"""
+    texts = [d.page_content for d in docs]
+    with _stage(stats, "embedding"):
+        vectors = embedding.embed_documents(texts)
+    with _stage(stats, "index_build"):
+        pairs = list(zip(texts, vectors))
+        metadatas = [d.metadata for d in docs]
+        if db is None:
+            return FAISS.from_embeddings(pairs, embedding, metadatas=metadatas, ids=ids)
+        db.add_embeddings(pairs, metadatas=metadatas, ids=ids)
+        return db
+
+
+def list_pdfs(menu_dir: str) -> List[str]:
+    pdfs = []
+    for root, dirs, files in os.walk(menu_dir):
+        for file in files:
+            if file.lower().endswith('.pdf'):
+                pdfs.append(os.path.join(root, file))
+    return sorted(pdfs)
+
+
+def _load_manifest(index_dir: str) -> Dict:
+    try:
+        with open(os.path.join(index_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(index_dir: str, manifest: Dict) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=index_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST_NAME))
+
+
+def load_or_update_index(menu_dir: str, index_dir: str, text_splitter, embedding,
+                         settings: Dict, stats=None) -> Tuple[FAISS, Dict[int, object]]:
+    """
+    Carica l'indice da index_dir e lo allinea ai PDF in menu_dir.
+
+    settings: impostazioni che, se cambiano, invalidano l'indice
+    (es. chunk_size, chunk_overlap, modello di embedding).
+
+    Restituisce (db, all_docs_map) dove all_docs_map è {chunk_id: Document}.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = _load_manifest(index_dir)
+
+    db = None
+    if manifest.get("settings") == settings and os.path.exists(os.path.join(index_dir, "index.faiss")):
+        with _stage(stats, "index_load"):
+            db = FAISS.load_local(index_dir, embedding, allow_dangerous_deserialization=True)
+    else:
+        if manifest:
+            print("♻️ Impostazioni dell'indice cambiate: ricostruzione completa")
+        manifest = {"settings": settings, "next_chunk_id": 0, "files": {}}
+
+    indexed = manifest["files"]
+    current = {path: hash_file(path) for path in list_pdfs(menu_dir)}
+
+    removed = [p for p in indexed if p not in current]
+    changed = [p for p in current if p in indexed and indexed[p]["sha256"] != current[p]]
+    added = [p for p in current if p not in indexed]
+
+    if not (removed or changed or added):
+        print(f"📂 Indice caricato da '{index_dir}' ({len(indexed)} PDF, nessuna modifica)")
+        return db, _docs_map(db)
+
+    print(f"🔄 Aggiornamento indice: {len(added)} aggiunti, {len(changed)} modificati, {len(removed)} rimossi")
+
+    # Cancella i chunk dei PDF rimossi o modificati
+    stale_ids = [str(cid) for p in removed + changed for cid in indexed[p]["chunk_ids"]]
+    if db is not None and stale_ids:
+        db.delete(stale_ids)
+    for p in removed:
+        del indexed[p]
+
+    # Embedda solo i PDF nuovi o modificati
+    for path in changed + added:
+        with _stage(stats, "pdf_load"):
+            pages = load_pdf_documents(path)
+        with _stage(stats, "chunking"):
+            docs = text_splitter.split_documents(pages)
+        first_id = manifest["next_chunk_id"]
+        chunk_ids = list(range(first_id, first_id + len(docs)))
+        for cid, doc in zip(chunk_ids, docs):
+            doc.metadata['chunk_id'] = cid
+        manifest["next_chunk_id"] = first_id + len(docs)
+        indexed[path] = {"sha256": current[path], "chunk_ids": chunk_ids}
+
+        if not docs:
+            continue
+        db = _add_documents(db, docs, [str(cid) for cid in chunk_ids], embedding, stats)
+
+    if db is not None:
+        db.save_local(index_dir)
+    _save_manifest(index_dir, manifest)
+    print(f"💾 Indice salvato in '{index_dir}'")
+    return db, _docs_map(db)
+
+
+def build_index(documents: List, text_splitter, embedding, stats=None) -> Tuple[FAISS, Dict[int, object]]:
+    """
+    Indice in memoria (non salvato) da documenti già caricati, ad esempio il
+    corpus sintetico di benchmark.py. I chunk_id seguono l'ordine dei documenti.
+    """
+    with _stage(stats, "chunking"):
+        docs = text_splitter.split_documents(documents)
+    for cid, doc in enumerate(docs):
+        doc.metadata['chunk_id'] = cid
+    db = _add_documents(None, docs, [str(cid) for cid in range(len(docs))], embedding, stats) if docs else None
+    return db, _docs_map(db)
+
+
+def _docs_map(db) -> Dict[int, object]:
+    if db is None:
+        return {}
+    docs = sorted(db.docstore._dict.values(), key=lambda d: d.metadata['chunk_id'])
+    return {d.metadata['chunk_id']: d for d in docs}
@@ -0,0 +1,138 @@
+"""
+Suddivisione dei menu in un chunk per piatto.
+
+Con RecursiveCharacterTextSplitter un piatto finisce spesso a cavallo di
+due chunk (da qui l'espansione cid - 1 / cid + 1 di NeighborRetriever).
+MenuSplitter riconosce invece i confini dei piatti:
+
+    Ristorante "Nome"            -> chunk di intestazione del ristorante
+    Chef ..., descrizione, licenze
+    Menu
+    <nome del piatto>            -> un chunk per piatto
+    descrizione
+    Ingredienti
+    ...
+    Tecniche
+    ...
+
+Una riga (o 2-3 righe consecutive, per i nomi lunghi andati a capo) è
+l'inizio di un piatto se coincide, normalizzata, con un nome di
+dish_mapping. Nei menu con le sezioni "Ingredienti" un nuovo piatto inizia
+solo dopo gli ingredienti del precedente: i nomi citati nelle descrizioni
+(spesso su una riga a sé nel testo estratto) non aprono un nuovo chunk.
+
+Metadati: source, page, ristorante, tipo ("ristorante" | "piatto") e, per i
+piatti, piatto e dish_id. Espone split_documents come i text splitter di
+LangChain, quindi si usa direttamente con menu_index. Con dish_lookup le
+risposte dell'LLM si mappano agli ID dei chunk recuperati senza fuzzy matching.
+"""
+
+import os
+import re
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from dish_records import normalize_name
+
+SPLITTER_NAME = "piatti"
+_RISTORANTE = re.compile(r'^\s*ristorante\s+["“”]?(.+?)["“”]?\s*$', re.IGNORECASE)
+
+
+def _is_section(line: str, name: str) -> bool:
+    """Intestazione di sezione: "Ingredienti" da sola o "Ingredienti: a, b" """
+    key = normalize_name(line)
+    return key == name or key.startswith(name + ":")
+
+
+class MenuSplitter:
+    def __init__(self, dish_mapping: Dict[str, int], max_name_lines: int = 3):
+        self.names = {normalize_name(nome): (nome, dish_id) for nome, dish_id in dish_mapping.items()}
+        self.max_name_lines = max_name_lines
+
+    def _dish_at(self, lines: List[str], i: int) -> Tuple[Optional[str], int]:
+        """(chiave del piatto, righe occupate dal nome) se lines[i] inizia un nome"""
+        for n in range(1, self.max_name_lines + 1):
+            if i + n > len(lines):
+                break
+            key = normalize_name(" ".join(lines[i:i + n]))
+            if key in self.names:
+                return key, n
+        return None, 0
+
+    def split_menu(self, pages: List[Document]) -> List[Document]:
+        """Le pagine di un menu (in ordine) -> intestazione + un chunk per piatto"""
+        if not pages:
+            return []
+        source = pages[0].metadata.get("source", "")
+        lines: List[Tuple[str, int]] = []
+        for page in pages:
+            for line in page.page_content.splitlines():
+                if line.strip():
+                    lines.append((line, page.metadata.get("page", 0)))
+        texts = [line for line, _ in lines]
+
+        ristorante = os.path.splitext(os.path.basename(source))[0]
+        for line in texts[:5]:
+            m = _RISTORANTE.match(line)
+            if m:
+                ristorante = m.group(1).strip()
+                break
+        strict = any(_is_section(line, "ingredienti") for line in texts)
+
+        # blocchi: (chiave del piatto o None per l'intestazione, prima riga, pagina)
+        blocks: List[List] = [[None, [], lines[0][1] if lines else 0]]
+        seen = set()
+        after_ingredients = True
+        i = 0
+        while i < len(lines):
+            key, n = self._dish_at(texts, i)
+            if key is not None and key not in seen and (after_ingredients or not strict):
+                seen.add(key)
+                blocks.append([key, [], lines[i][1]])
+                after_ingredients = False
+            else:
+                n = 1
+                if _is_section(texts[i], "ingredienti"):
+                    after_ingredients = True
+            blocks[-1][1].extend(texts[i:i + n])
+            i += n
+
+        docs = []
+        for key, block_lines, page in blocks:
+            metadata = {"source": source, "page": page, "ristorante": ristorante}
+            if key is None:
+                metadata["tipo"] = "ristorante"
+                content = "\n".join(block_lines)
+            else:
+                nome, dish_id = self.names[key]
+                metadata.update(tipo="piatto", piatto=nome, dish_id=dish_id)
+                # Il ristorante nel testo serve sia al retrieval sia all'LLM
+                content = f"Ristorante: {ristorante}\n" + "\n".join(block_lines)
+            if content.strip():
+                docs.append(Document(page_content=content, metadata=metadata))
+        return docs
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """Raggruppa le pagine per source (un menu per PDF) e le suddivide per piatto"""
+        menus: Dict[str, List[Document]] = {}
+        for doc in documents:
+            menus.setdefault(doc.metadata.get("source", ""), []).append(doc)
+        chunks = []
+        for pages in menus.values():
+            chunks.extend(self.split_menu(pages))
+        return chunks
+
+
+def splitter_settings(dish_mapping: Dict[str, int]) -> Dict:
+    """Impostazioni per il manifest di menu_index: l'indice va ricostruito se cambia il mapping"""
+    mapping = json.dumps(sorted(dish_mapping.items()), ensure_ascii=False)
+    return {"splitter": SPLITTER_NAME, "dish_mapping_sha256": hashlib.sha256(mapping.encode("utf-8")).hexdigest()}
+
+
+def dish_lookup(docs: List[Document]) -> Dict[str, Tuple[str, int]]:
+    """{nome normalizzato: (nome, dish_id)} dei chunk-piatto recuperati"""
+    return {normalize_name(d.metadata["piatto"]): (d.metadata["piatto"], d.metadata["dish_id"])
+            for d in docs if d.metadata.get("dish_id") is not None}
@@ -0,0 +1,88 @@
+"""
+Risoluzione fuzzy dei nomi dei piatti con un indice invertito di trigrammi.
+
+Al posto di difflib.get_close_matches su tutte le chiavi (O(N·L²) per ogni
+nome), i candidati si ottengono dalle liste di posting dei trigrammi del
+nome cercato; solo i migliori per coefficiente di Dice vengono ri-ordinati
+con SequenceMatcher. Le chiavi sono normalizzate con normalize_name.
+"""
+
+import difflib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dish_records import normalize_name
+
+
+def _ngrams(text: str, n: int) -> List[str]:
+    padded = f"{' ' * (n - 1)}{text} "
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+
+class NameResolver:
+    def __init__(self, names: Iterable[str], n: int = 3, rerank: int = 20):
+        self.n = n
+        self.rerank = rerank
+        self.names: List[str] = []
+        self.keys: List[str] = []
+        self.sizes: List[int] = []
+        self.exact: Dict[str, int] = {}
+        self.postings: Dict[str, List[int]] = {}
+
+        for name in names:
+            key = normalize_name(name)
+            if key in self.exact:
+                continue
+            idx = len(self.names)
+            self.exact[key] = idx
+            self.names.append(name)
+            self.keys.append(key)
+            grams = set(_ngrams(key, n))
+            self.sizes.append(len(grams))
+            for g in grams:
+                self.postings.setdefault(g, []).append(idx)
+
+    def resolve(self, query: str, top_k: int = 5, cutoff: float = 0.0) -> List[Tuple[str, float]]:
+        """I top_k nomi più simili a query, con punteggio in [0, 1]"""
+        key = normalize_name(query)
+        if not key:
+            return []
+        if key in self.exact:
+            return [(self.names[self.exact[key]], 1.0)][:top_k]
+
+        grams = set(_ngrams(key, self.n))
+        shared = Counter()
+        for g in grams:
+            for idx in self.postings.get(g, ()):
+                shared[idx] += 1
+        if not shared:
+            return []
+
+        # Dice sui trigrammi per scegliere i candidati, SequenceMatcher per il punteggio finale
+        dice = sorted(
+            ((2 * c / (len(grams) + self.sizes[idx]), idx) for idx, c in shared.items()),
+            reverse=True
+        )[:max(self.rerank, top_k)]
+        scored = []
+        for _, idx in dice:
+            score = difflib.SequenceMatcher(None, key, self.keys[idx]).ratio()
+            if score >= cutoff:
+                scored.append((self.names[idx], score))
+        scored.sort(key=lambda x: -x[1])
+        return scored[:top_k]
+
+    def best_match(self, query: str, cutoff: float = 0.8) -> Optional[str]:
+        matches = self.resolve(query, top_k=1, cutoff=cutoff)
+        return matches[0][0] if matches else None
+
+    def resolve_batch(self, queries: Iterable[str], top_k: int = 1,
+                      cutoff: float = 0.8) -> List[List[Tuple[str, float]]]:
+        """Risolve in una sola chiamata tutti i nomi di una risposta dell'LLM"""
+        cache: Dict[str, List[Tuple[str, float]]] = {}
+        results = []
+        for q in queries:
+            key = normalize_name(q)
+            if key not in cache:
+                cache[key] = self.resolve(q, top_k=top_k, cutoff=cutoff)
+            results.append(cache[key])
+        return results
@@ -0,0 +1,185 @@
+"""
+Cache su disco del testo estratto dai PDF, indirizzata per contenuto.
+
+La chiave è l'hash SHA-256 del file PDF combinato con le impostazioni
+dell'estrattore (loader, strategia, ...): se il PDF non cambia, il parsing
+non viene rifatto. Ogni voce contiene il testo pagina per pagina (con i
+metadati della pagina) ed è un file JSON in DEFAULT_CACHE_DIR.
+Le voci meno usate di recente vengono eliminate (LRU sull'mtime) quando si
+superano max_entries o max_bytes.
+
+Condivisa da extract_recipe_agent.py (partition_pdf) e da rag.py/rag2.py
+(PyPDFLoader).
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_CACHE_DIR = os.getenv("PDF_CACHE_DIR", ".cache/pdf_text")
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """Hash SHA-256 del contenuto di un file"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class PDFTextCache:
+    """
+    Cache LRU su disco: una voce JSON per (hash del PDF, impostazioni).
+    Ogni voce è una lista di pagine {"text": ..., "metadata": {...}}.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, file_hash: str, settings: Dict) -> str:
+        settings_str = json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(f"{file_hash}|{settings_str}".encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                pages = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Aggiorna l'mtime: è il timestamp di ultimo utilizzo per l'LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return pages
+
+    def put(self, key: str, pages: List[Dict]) -> None:
+        # Scrittura atomica: un processo concorrente non legge mai un file a metà
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(pages, f, ensure_ascii=False)
+        os.replace(tmp_path, self._entry_path(key))
+        self.evict()
+
+    def evict(self) -> None:
+        """Elimina le voci usate meno di recente oltre i limiti configurati"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        entries.sort(reverse=True)
+        total_bytes = 0
+        for i, (_, size, path) in enumerate(entries):
+            total_bytes += size
+            if i >= self.max_entries or total_bytes > self.max_bytes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get_pages(self, pdf_path: str, settings: Dict,
+                  extractor: Callable[[str], List[Dict]]) -> List[Dict]:
+        """
+        Restituisce le pagine del PDF dalla cache, oppure le estrae con
+        `extractor(pdf_path)` e le salva.
+        """
+        key = self.make_key(hash_file(pdf_path), settings)
+        pages = self.get(key)
+        if pages is not None:
+            self.hits += 1
+            return pages
+        self.misses += 1
+        pages = extractor(pdf_path)
+        self.put(key, pages)
+        return pages
+
+
+_default_cache = None
+
+
+def get_default_cache() -> PDFTextCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PDFTextCache()
+    return _default_cache
+
+
+def _partition_pages(pdf_path: str, strategy: str) -> List[Dict]:
+    from unstructured.partition.pdf import partition_pdf
+
+    elements = partition_pdf(
+        filename=pdf_path,
+        strategy=strategy,
+        infer_table_structure=False,
+        extract_images_in_pdf=False
+    )
+    # Raggruppa gli elementi per numero di pagina mantenendo l'ordine
+    pages = {}
+    for el in elements:
+        text = el.text.strip()
+        if not text:
+            continue
+        page_number = getattr(el.metadata, "page_number", None) or 1
+        pages.setdefault(page_number, []).append(text)
+    return [
+        {"text": "\n\n".join(texts), "metadata": {"source": pdf_path, "page": n}}
+        for n, texts in sorted(pages.items())
+    ]
+
+
+def load_partition_pages(pdf_path: str, strategy: str = "fast",
+                         cache: Optional[PDFTextCache] = None) -> List[str]:
+    """Testo per pagina estratto con unstructured.partition_pdf (con cache)"""
+    cache = cache or get_default_cache()
+    settings = {"loader": "unstructured.partition_pdf", "strategy": strategy}
+    pages = cache.get_pages(pdf_path, settings, lambda p: _partition_pages(p, strategy))
+    return [p["text"] for p in pages]
+
+
+def _pypdf_pages(pdf_path: str) -> List[Dict]:
+    from langchain_community.document_loaders import PyPDFLoader
+
+    return [
+        {"text": doc.page_content, "metadata": dict(doc.metadata)}
+        for doc in PyPDFLoader(pdf_path).load()
+    ]
+
+
+def load_pdf_documents(pdf_path: str, cache: Optional[PDFTextCache] = None):
+    """
+    Equivalente di PyPDFLoader(pdf_path).load() con cache: restituisce una
+    lista di Document (una per pagina) con gli stessi metadati.
+    """
+    from langchain_core.documents import Document
+
+    cache = cache or get_default_cache()
+    settings = {"loader": "langchain.PyPDFLoader"}
+    pages = cache.get_pages(pdf_path, settings, _pypdf_pages)
+    # Il path nei metadati segue la chiamata corrente, non quella che ha popolato la cache
+    return [
+        Document(page_content=p["text"], metadata={**p["metadata"], "source": pdf_path})
+        for p in pages
+    ]
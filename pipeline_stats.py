@@ -0,0 +1,111 @@
+"""
+Statistiche di esecuzione delle pipeline: tempo per fase e uso dell'LLM.
+
+Le pipeline (rag.py, rag2.py, attempt.py) e menu_index.py accettano un
+PipelineStats opzionale e vi registrano:
+- il tempo di ogni fase (pdf_load, chunking, embedding, index_build,
+  retrieval, llm, matching, ...), sommato su tutte le chiamate
+- token in input/output e numero di chiamate LLM
+
+benchmark.py le raccoglie per confrontarle con una baseline.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from token_packer import count_message_tokens, count_tokens
+from tracing import current_span, get_tracer, record_llm_usage
+
+
+class PipelineStats:
+    def __init__(self, model: str = "gpt-4o"):
+        self.model = model
+        self.stages: Dict[str, float] = {}
+        self.stage_calls: Dict[str, int] = {}
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.llm_calls = 0
+        self.questions = 0
+
+    @contextmanager
+    def stage(self, name: str):
+        """Misura la fase e la registra anche come span di tracing (tracing.py)"""
+        start = time.perf_counter()
+        try:
+            with get_tracer().span(name):
+                yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+            self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+
+    def record_llm(self, tokens_in: int, tokens_out: int, calls: int = 1) -> None:
+        self.tokens_in += tokens_in
+        self.tokens_out += tokens_out
+        self.llm_calls += calls
+
+    def record_chat(self, messages: List[Dict], response: str) -> None:
+        """Una chiamata di chat: token misurati con il tokenizer del modello"""
+        self.record_llm(count_message_tokens(messages, self.model), count_tokens(response or "", self.model))
+
+    def as_dict(self) -> Dict:
+        n = max(self.questions, 1)
+        return {
+            "stages": {k: round(v, 6) for k, v in self.stages.items()},
+            "stage_calls": dict(self.stage_calls),
+            "total_seconds": round(sum(self.stages.values()), 6),
+            "questions": self.questions,
+            "llm": {
+                "calls": self.llm_calls,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "calls_per_question": round(self.llm_calls / n, 3),
+                "tokens_in_per_question": round(self.tokens_in / n, 1),
+                "tokens_out_per_question": round(self.tokens_out / n, 1),
+            },
+        }
+
+    def print_summary(self) -> None:
+        print("⏱️ Tempi per fase:")
+        for name, seconds in self.stages.items():
+            print(f"   • {name}: {seconds:.3f}s ({self.stage_calls[name]} chiamate)")
+        if self.llm_calls:
+            print(f"   • LLM: {self.llm_calls} chiamate, {self.tokens_in} token in input, "
+                  f"{self.tokens_out} in output")
+
+
+def _span_cache_hits() -> int:
+    span = current_span()
+    return span.attrs.get("cache_hits", 0) if span.enabled else 0
+
+
+def langchain_usage_callback(stats: PipelineStats):
+    """
+    Callback LangChain che registra ogni chiamata del chat model in stats.
+    LangChain invoca i callback anche per le risposte servite dalla cache:
+    queste non finiscono nel tracing (record_llm_usage), riconosciute dal
+    contatore cache_hits dello span incrementato da install_langchain_cache.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    roles = {"system": "system", "human": "user", "ai": "assistant"}
+
+    class _UsageCallback(BaseCallbackHandler):
+        def __init__(self):
+            self.pending: List[Tuple[List[Dict], int]] = []
+
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            hits = _span_cache_hits()
+            for batch in messages:
+                self.pending.append(([{"role": roles.get(m.type, "user"), "content": m.content}
+                                      for m in batch], hits))
+
+        def on_llm_end(self, response, **kwargs):
+            for generations in response.generations:
+                messages, hits = self.pending.pop(0) if self.pending else ([], _span_cache_hits())
+                text = generations[0].text if generations else ""
+                stats.record_chat(messages, text)
+                if _span_cache_hits() <= hits:
+                    record_llm_usage(stats.model, messages, text)
+
+    return _UsageCallback()
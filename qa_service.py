@@ -0,0 +1,303 @@
+"""
+Servizio residente di domanda/risposta con indici già caldi.
+
+Gli script (attempt.py, rag.py, rag2.py) ricostruiscono tutto a ogni avvio:
+PDF, chunking, embedding, indice FAISS, prompt. Il servizio carica una
+pipeline una sola volta e risponde su HTTP locale, così la latenza di una
+domanda è solo retrieval + LLM.
+
+Endpoint (JSON):
+    POST /ask     {"domanda": "..."}          -> {"domanda", "ids", "ms"}
+    POST /batch   {"domande": ["...", ...]}   -> {"risposte": [{"domanda", "ids"}, ...], "ms"}
+    GET  /health                              -> pipeline e stato
+    GET  /stats                               -> tempi per fase, uso LLM, contatori del servizio
+
+- coalescenza: domande identiche (normalizzate) già in corso condividono
+  lo stesso risultato invece di ripartire
+- pool limitato: `workers` thread consumano una coda di al massimo
+  `max_queue` domande; a coda piena si risponde 503
+- micro-batch: un worker prende fino a `max_batch` domande in coda insieme;
+  per attempt.py finiscono in un solo answer_all (chiamate LLM in parallelo
+  con AsyncLLMRunner), per rag/rag2 si risponde una domanda alla volta
+- cache delle risposte (answer_cache.py): le riformulazioni della stessa
+  domanda (stesse entità, stessa polarità) rispondono senza retrieval né LLM
+
+    python qa_service.py --pipeline rag2 --port 8765
+    curl -s localhost:8765/ask -d '{"domanda": "Quali piatti contengono Latte+?"}'
+"""
+
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dish_records import normalize_name
+
+PIPELINES = ("attempt", "rag", "rag2")
+HOST = "127.0.0.1"
+PORT = int(os.getenv("HACKAPIZZA_QA_PORT", "8765"))
+# Default per pipeline: attempt parallelizza già le chiamate dentro un batch;
+# rag/rag2 condividono chain, callback di uso e PipelineStats, che non sono
+# thread-safe, quindi un solo worker
+DEFAULTS = {
+    "attempt": {"workers": 1, "max_batch": 64},
+    "rag": {"workers": 1, "max_batch": 1},
+    "rag2": {"workers": 1, "max_batch": 1},
+}
+
+
+class QAServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Backlog di connessioni in attesa (il default di socketserver è 5)
+    request_queue_size = 128
+
+
+class ServiceBusy(Exception):
+    """Coda piena: la richiesta va ritentata più tardi"""
+
+
+def load_pipeline(name: str, **kwargs):
+    """
+    (pipeline, funzione domande -> [(ID, completa)]) per attempt, rag o rag2.
+    completa è False per le risposte parziali o vuote dovute a un errore
+    (attempt trasforma i blocchi falliti in risposte vuote invece di sollevare).
+    """
+    if name == "attempt":
+        from attempt import AttemptPipeline
+        pipeline = AttemptPipeline(**kwargs)
+        return pipeline, lambda domande: [(r["ids"], r["completa"]) for r in pipeline.answer_all(domande)]
+    if name not in PIPELINES:
+        raise ValueError(f"Pipeline sconosciuta: {name}")
+    pipeline = __import__(name).build_pipeline(**kwargs)
+    return pipeline, lambda domande: [(pipeline.answer_ids(d), True) for d in domande]
+
+
+class QAService:
+    def __init__(self, answer_batch: Callable[[List[str]], List[Tuple[List[int], bool]]],
+                 workers: int = 1, max_batch: int = 1, max_queue: int = 256, answer_cache=None):
+        self.answer_batch = answer_batch
+        self.answer_cache = answer_cache
+        self.max_batch = max_batch
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.inflight: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.counters = {"domande": 0, "coalescenti": 0, "batch": 0, "errori": 0, "rifiutate": 0}
+        self.threads = [threading.Thread(target=self._worker, daemon=True, name=f"qa-worker-{i}")
+                        for i in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, domanda: str) -> Future:
+        """Future con la lista di ID; riusa quello di una domanda identica in corso"""
+        if self.answer_cache is not None:
+            cached = self.answer_cache.get(domanda)
+            if cached is not None:
+                with self.lock:
+                    self.counters["domande"] += 1
+                future = Future()
+                future.set_result(cached)
+                return future
+        key = normalize_name(domanda)
+        with self.lock:
+            self.counters["domande"] += 1
+            future = self.inflight.get(key)
+            if future is not None:
+                self.counters["coalescenti"] += 1
+                return future
+            future = Future()
+            try:
+                self.queue.put_nowait((key, domanda, future))
+            except queue.Full:
+                self.counters["rifiutate"] += 1
+                raise ServiceBusy(f"coda piena ({self.queue.maxsize} domande in attesa)")
+            self.inflight[key] = future
+            return future
+
+    def ask(self, domande: List[str], timeout: Optional[float] = None) -> List[List[int]]:
+        futures = [self.submit(d) for d in domande]
+        return [f.result(timeout=timeout) for f in futures]
+
+    def _worker(self) -> None:
+        while True:
+            items = [self.queue.get()]
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.lock:
+                self.counters["batch"] += 1
+            try:
+                results = self.answer_batch([domanda for _, domanda, _ in items])
+                outcomes = [(f, ids, None) for (_, _, f), (ids, _) in zip(items, results)]
+                if len(results) != len(items):
+                    # zip tronca in silenzio: le domande senza risposta falliscono invece di restare appese
+                    error = RuntimeError(f"❌ La pipeline ha restituito {len(results)} risposte "
+                                         f"per {len(items)} domande")
+                    outcomes += [(f, None, error) for _, _, f in items[len(results):]]
+                    with self.lock:
+                        self.counters["errori"] += 1
+                if self.answer_cache is not None:
+                    # Le risposte parziali o vuote per un errore non vanno in cache
+                    for (_, domanda, _), (ids, completa) in zip(items, results):
+                        if completa:
+                            self.answer_cache.put(domanda, ids)
+            except Exception as e:
+                with self.lock:
+                    self.counters["errori"] += 1
+                outcomes = [(f, None, e) for _, _, f in items]
+            with self.lock:
+                for key, _, _ in items:
+                    self.inflight.pop(key, None)
+            for future, result, error in outcomes:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+def make_handler(service: QAService, info: Dict, stats=None, timeout: float = 300.0):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self) -> Dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("il corpo deve essere un oggetto JSON")
+            return payload
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {**info, "in_coda": service.queue.qsize()})
+            elif self.path == "/stats":
+                with service.lock:
+                    counters = dict(service.counters)
+                payload = {"servizio": counters, "pipeline": stats.as_dict() if stats else {}}
+                if service.answer_cache is not None:
+                    payload["cache_risposte"] = service.answer_cache.stats()
+                self._send(200, payload)
+            else:
+                self._send(404, {"errore": f"endpoint sconosciuto: {self.path}"})
+
+        def do_POST(self):
+            try:
+                payload = self._read_json()
+            except ValueError as e:
+                self._send(400, {"errore": f"JSON non valido: {e}"})
+                return
+            if self.path == "/ask":
+                domande = [payload.get("domanda")]
+            elif self.path == "/batch":
+                domande = payload.get("domande")
+            else:
+                self._send(404, {"errore": f"endpoint sconosciuto: {self.path}"})
+                return
+            if not isinstance(domande, list) or not domande or not all(isinstance(d, str) and d.strip()
+                                                                       for d in domande):
+                self._send(400, {"errore": "specificare 'domanda' (/ask) o 'domande' (/batch)"})
+                return
+
+            start = time.perf_counter()
+            try:
+                risultati = service.ask(domande, timeout=timeout)
+            except ServiceBusy as e:
+                self._send(503, {"errore": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"errore": f"{type(e).__name__}: {e}"})
+                return
+            ms = round(1000 * (time.perf_counter() - start), 3)
+            if self.path == "/ask":
+                self._send(200, {"domanda": domande[0], "ids": risultati[0], "ms": ms})
+            else:
+                self._send(200, {"risposte": [{"domanda": d, "ids": ids} for d, ids in zip(domande, risultati)],
+                                 "ms": ms})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def make_answer_cache(pipeline, args):
+    """AnswerCache sul QueryEngine della pipeline (o costruito dall'archivio dei piatti)"""
+    from answer_cache import AnswerCache
+    engine = getattr(pipeline, "query_engine", None)
+    if engine is None:
+        from dish_store import open_dish_store
+        from query_engine import QueryEngine
+        engine = QueryEngine(list(open_dish_store().records()))
+    embedding = None
+    if args.cache_similarity > 0:
+        from backends import make_embeddings
+        embedding = make_embeddings()
+    return AnswerCache(engine, max_entries=args.cache_size, ttl=args.cache_ttl or None,
+                       embedding=embedding, similarity=args.cache_similarity)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servizio HTTP locale di domanda/risposta")
+    parser.add_argument("--pipeline", choices=PIPELINES, default="rag2")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Thread del pool (default per pipeline; rag/rag2 non sono thread-safe)")
+    parser.add_argument("--max-batch", type=int, default=None, help="Domande prese insieme da un worker")
+    parser.add_argument("--max-queue", type=int, default=256, help="Domande in attesa prima di rispondere 503")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Attesa massima di una richiesta (s)")
+    parser.add_argument("--no-answer-cache", action="store_true", help="Disattiva la cache delle risposte")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Voci massime della cache delle risposte")
+    parser.add_argument("--cache-ttl", type=float, default=3600.0, help="Validità di una risposta in cache (s, 0 = sempre)")
+    parser.add_argument("--cache-similarity", type=float, default=0.0,
+                        help="Coseno minimo per riusare la risposta di una domanda simile (0 = solo chiave esatta)")
+    args = parser.parse_args()
+
+    from pipeline_stats import PipelineStats
+    defaults = DEFAULTS[args.pipeline]
+    stats = PipelineStats(__import__(args.pipeline).MODELLO)
+
+    print(f"🔥 Caricamento della pipeline {args.pipeline}...")
+    start = time.perf_counter()
+    pipeline, answer_batch = load_pipeline(args.pipeline, stats=stats)
+    load_seconds = time.perf_counter() - start
+    print(f"✅ Pipeline pronta in {load_seconds:.2f}s")
+
+    answer_cache = None if args.no_answer_cache else make_answer_cache(pipeline, args)
+    service = QAService(
+        answer_batch,
+        workers=args.workers or defaults["workers"],
+        max_batch=args.max_batch or defaults["max_batch"],
+        max_queue=args.max_queue,
+        answer_cache=answer_cache
+    )
+    info = {"pipeline": args.pipeline, "ready": True, "load_seconds": round(load_seconds, 3),
+            "workers": len(service.threads), "max_batch": service.max_batch,
+            "cache_risposte": answer_cache is not None}
+    server = QAServer((args.host, args.port), make_handler(service, info, stats, args.timeout))
+    print(f"🌐 In ascolto su http://{args.host}:{args.port} (/ask, /batch, /health, /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Arresto del servizio")
+    finally:
+        server.server_close()
+        stats.print_summary()
+        if answer_cache is not None:
+            answer_cache.print_stats()
+        if getattr(pipeline, "llm_cache", None) is not None:
+            pipeline.llm_cache.print_stats()
+
+
+if __name__ == "__main__":
+    main()
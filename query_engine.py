@@ -0,0 +1,165 @@
+"""
+Motore di query deterministico su insiemi di ingredienti e tecniche.
+
+La maggior parte delle domande è algebra booleana sugli insiemi
+("contiene X e Y ma non la tecnica Z"): si risponde localmente, senza LLM,
+con operazioni bit a bit sulle righe della DishBitMatrix (un bit per piatto).
+Ordini e pianeti non sono nella matrice: le loro righe vengono impacchettate
+qui, nello stesso formato.
+Le domande che il parser non riesce a interpretare restituiscono None e
+vanno gestite dall'LLM.
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from dish_bitmatrix import DishBitMatrix
+from dish_records import DishRecord, normalize_name
+from entity_spotter import EntitySpotter, SpottedEntity
+
+# Vincoli che il motore non sa ancora valutare: la domanda va all'LLM
+UNSUPPORTED_CUES = ("ristorante", "licenz", "distanza", "anni luce", "chef", "ordine")
+# Cue che diventano valutabili quando la domanda cita un'entità del tipo indicato
+# ("in un ristorante su Asgard" -> pianeta, "adatti all'Ordine di Andromeda" -> ordine)
+CUE_KINDS = {"ristorante": "pianeta", "ordine": "ordine"}
+
+
+@dataclass(frozen=True)
+class Term:
+    kind: str  # "ingrediente" | "tecnica" | "ordine" | "pianeta"
+    name: str  # nome normalizzato
+
+
+@dataclass(frozen=True)
+class And:
+    children: Tuple
+
+
+@dataclass(frozen=True)
+class Or:
+    children: Tuple
+
+
+@dataclass(frozen=True)
+class Not:
+    child: object
+
+
+Expr = Union[Term, And, Or, Not]
+
+
+class QueryEngine:
+    def __init__(self, records: List[DishRecord]):
+        self.records = records
+        self.index: Dict[str, Dict[str, Set[int]]] = {
+            "ingrediente": {}, "tecnica": {}, "ordine": {}, "pianeta": {}
+        }
+        # Nome originale per ogni voce normalizzata (per messaggi e prompt)
+        self.display_names: Dict[Tuple[str, str], str] = {}
+        # Ordini e pianeti non sono nella DishBitMatrix: colonne booleane per (tipo, nome)
+        extra_columns: Dict[Tuple[str, str], np.ndarray] = {}
+
+        for j, r in enumerate(records):
+            fields = (("ingrediente", r.ingredienti), ("tecnica", r.tecniche),
+                      ("ordine", r.ordini), ("pianeta", [r.pianeta] if r.pianeta else []))
+            for kind, values in fields:
+                for value in values:
+                    key = normalize_name(value)
+                    self.index[kind].setdefault(key, set()).add(r.dish_id)
+                    self.display_names.setdefault((kind, key), value)
+                    if kind in ("ordine", "pianeta"):
+                        extra_columns.setdefault((kind, key), np.zeros(len(records), dtype=bool))[j] = True
+
+        self.spotter = EntitySpotter({
+            kind: [self.display_names[(kind, key)] for key in self.index[kind]]
+            for kind in self.index if self.index[kind]
+        })
+
+        # Bit j di ogni riga = records[j]
+        self.bitmatrix = DishBitMatrix.from_records(records)
+        self.extra_rows = {k: np.packbits(v) for k, v in extra_columns.items()}
+        self._empty = np.zeros_like(self.bitmatrix.all_mask())
+
+    # --- Valutazione ---
+
+    def term_mask(self, term: Term) -> np.ndarray:
+        """Maschera packed dei piatti che contengono il termine"""
+        row = self.bitmatrix.kind_row(term.kind, term.name)
+        if row is not None:
+            return self.bitmatrix.bits[row]
+        return self.extra_rows.get((term.kind, term.name), self._empty)
+
+    def evaluate_mask(self, expr: Expr) -> np.ndarray:
+        if isinstance(expr, Term):
+            return self.term_mask(expr)
+        if isinstance(expr, Not):
+            return ~self.evaluate_mask(expr.child) & self.bitmatrix.all_mask()
+        if isinstance(expr, (And, Or)):
+            masks = [self.evaluate_mask(child) for child in expr.children]
+            if not masks:
+                return self.bitmatrix.all_mask() if isinstance(expr, And) else self._empty
+            op = np.bitwise_and if isinstance(expr, And) else np.bitwise_or
+            return op.reduce(masks)
+        raise TypeError(f"Espressione non supportata: {expr!r}")
+
+    def evaluate(self, expr: Expr) -> Set[int]:
+        return set(self.bitmatrix.ids(self.evaluate_mask(expr)))
+
+    # --- Parsing delle domande ---
+
+    def find_entities(self, question: str) -> List[SpottedEntity]:
+        """Ingredienti, tecniche, ordini e pianeti nella domanda, con la polarità (negati o no)"""
+        return self.spotter.spot(question)
+
+    def parse(self, question: str) -> Optional[Expr]:
+        matches = self.find_entities(question)
+        if not matches:
+            return None
+        text = normalize_name(question)
+        kinds = {m.kind for m in matches}
+        if any(cue in text and CUE_KINDS.get(cue) not in kinds for cue in UNSUPPORTED_CUES):
+            return None
+        if _has_unmatched_proper_nouns(question, matches):
+            return None
+
+        positives = [m for m in matches if not m.negated]
+        negatives = [m for m in matches if m.negated]
+
+        # "A o B" / "A oppure B" tra due entità positive consecutive -> OR
+        groups = []
+        for prev, cur in zip([None] + positives[:-1], positives):
+            between = normalize_name(question[prev.end:cur.start]) if prev else ""
+            if prev and re.fullmatch(r"\W*(o|oppure)\W*(\w+\W+){0,2}", between + " "):
+                groups[-1].append(cur)
+            else:
+                groups.append([cur])
+
+        children = []
+        for group in groups:
+            terms = tuple(Term(m.kind, m.key) for m in group)
+            children.append(terms[0] if len(terms) == 1 else Or(terms))
+        children.extend(Not(Term(m.kind, m.key)) for m in negatives)
+        return children[0] if len(children) == 1 else And(tuple(children))
+
+    def answer(self, question: str) -> Optional[List[int]]:
+        """ID dei piatti che soddisfano la domanda, o None se non interpretabile"""
+        expr = self.parse(question)
+        if expr is None:
+            return None
+        return sorted(self.evaluate(expr))
+
+
+def _has_unmatched_proper_nouns(question: str, matches: List[SpottedEntity]) -> bool:
+    """
+    Una parola con l'iniziale maiuscola fuori dalle entità riconosciute è
+    probabilmente un ingrediente/tecnica/luogo sconosciuto: meglio l'LLM.
+    """
+    masked = list(question)
+    for m in matches:
+        for i in range(m.start, m.end):
+            masked[i] = " "
+    words = re.findall(r"\w[\w+\-]*", "".join(masked))
+    return any(w[0].isupper() for w in words[1:])
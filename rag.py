@@ -1,63 +1,36 @@
-import pandas as pd
 import os
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 import json
-from difflib import get_close_matches
 import re
 from langchain_core.documents import Document
 
-# 1. Carica .env e la chiave
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("⚠️ La variabile OPENAI_API_KEY non è stata trovata nel file .env")
-os.environ["OPENAI_API_KEY"] = api_key
-
-# 2. Carica tutti i menu (PDF)
-menu_dir = "Hackapizza Dataset/Menu"
-documents = []
-for root, dirs, files in os.walk(menu_dir):
-    for file in files:
-        if file.lower().endswith('.pdf'):
-            path = os.path.join(root, file)
-            loader = PyPDFLoader(path)
-            documents.extend(loader.load())
-
-# 3. Chunking
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=800,
-    chunk_overlap=150
-)
-docs = text_splitter.split_documents(documents)
-
-# 4. Crea embeddings
-embedding = OpenAIEmbeddings()
-
-# 5. Costruisci FAISS
-db = FAISS.from_documents(docs, embedding)
-
-# 6. Crea retriever con k=5
-retriever = db.as_retriever(search_kwargs={"k": 5})
-
-# 7. Carica dish_mapping.json se esiste
-mapping_path = "Hackapizza Dataset/Misc/dish_mapping.json"
-if os.path.exists(mapping_path):
-    with open(mapping_path, "r", encoding="utf-8") as f:
-        dish_mapping = json.load(f)
-    dish_names = list(dish_mapping.keys())
-else:
-    dish_mapping = {}
-    dish_names = []
-
-# 8. Prepara il prompt
+from dish_records import normalize_name
+from menu_index import build_index, load_or_update_index
+from menu_splitter import MenuSplitter, dish_lookup, splitter_settings
+from embedding_cache import CachedEmbeddings
+from name_resolver import NameResolver
+from llm_cache import install_langchain_cache
+from backends import make_chat_model, make_embeddings, require_api_key
+from pipeline_stats import PipelineStats, langchain_usage_callback
+from tracing import get_tracer
+
+MENU_DIR = "Hackapizza Dataset/Menu"
+INDEX_DIR = ".cache/faiss_rag"
+MAPPING_PATH = "Hackapizza Dataset/Misc/dish_mapping.json"
+DOMANDE_PATH = "Hackapizza Dataset/domande.csv"
+MODELLO = "gpt-3.5-turbo"
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 150
+K = 5
+# Un chunk per piatto (menu_splitter.py) invece di chunk a dimensione fissa
+DISH_CHUNKS = False
+
+
+# Prompt con la lista completa dei piatti
 def make_prompt_template(dish_names):
     piatti_string = "\n".join(dish_names) if dish_names else ""
     return f"""
@@ -75,70 +48,191 @@ Contesto:
 Domanda: {{question}}
 Risposta:
 """
-prompt_template = make_prompt_template(dish_names)
-PROMPT = PromptTemplate(
-    input_variables=["context", "question"],
-    template=prompt_template
-)
-
-# 9. Crea LLM e QA chain
-llm = ChatOpenAI(model="gpt-3.5-turbo")
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=retriever,
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": PROMPT}
-)
-
-# 10. Carica domande dal CSV
-df_domande = pd.read_csv("Hackapizza Dataset/domande.csv")
-if 'domanda' in df_domande.columns:
-    domanda_col = 'domanda'
-elif 'question' in df_domande.columns:
-    domanda_col = 'question'
-else:
-    domanda_col = df_domande.columns[1]
-
-# 11. Loop sulle domande e stampa risposta, fonti, match e chunk
-for n, (idx, row) in enumerate(df_domande.iterrows(), 1):
-    query = str(row[domanda_col])
-    print(f"\n➡️ Domanda {n}: {query}")
-    result = qa_chain.invoke({"query": query})
-
-    # Risposta generata
-    print("✅ Risposta:", result['result'])
-
-    # File usati come fonte
-    fonti = set()
-    for doc in result['source_documents']:
-        source = doc.metadata.get("source", "sconosciuto")
-        filename = os.path.basename(source)
-        fonti.add(filename)
-    print("📄 Documenti usati:", ", ".join(sorted(fonti)))
-
-    # Contenuto dei chunk
-    print("📦 Chunk recuperati:")
-    for i, doc in enumerate(result['source_documents'], 1):
-        source = doc.metadata.get("source", "sconosciuto")
-        filename = os.path.basename(source)
-        print(f"--- Chunk {i} da '{filename}' ---")
-        print(doc.page_content.strip())
-        print("―" * 40)
-
-    # Matching piatti
-    if dish_names:
-        risposta = result['result']
-        candidate_dishes = [x.strip() for x in risposta.split(",") if x.strip().lower() != "nessuno"]
-        if candidate_dishes:
-            print("🔎 Matching piatti trovati:")
-            for cand in candidate_dishes:
-                if cand in dish_mapping:
-                    print(f"  '{cand}' → ID: {dish_mapping[cand]}")
-                else:
-                    print(f"  '{cand}' → nessun match trovato")
-        else:
-            print("🔎 Matching piatti trovati: Nessuno")
 
-    if n == 4:
-        break
+
+class RagPipeline:
+    """
+    Stato della pipeline (indice, chain, mapping) e risposta a una domanda.
+    Le fasi retrieval, llm e matching vengono misurate in self.stats.
+    """
+
+    def __init__(self, qa_chain, dish_mapping, name_resolver, stats, llm_cache, embedding):
+        self.qa_chain = qa_chain
+        self.dish_mapping = dish_mapping
+        self.name_resolver = name_resolver
+        self.stats = stats
+        self.llm_cache = llm_cache
+        self.embedding = embedding
+        self.usage_callback = langchain_usage_callback(stats)
+
+    def answer(self, query):
+        """Risposta dell'LLM, chunk usati e piatti riconosciuti [(candidato, nome, ID, score)]"""
+        self.stats.questions += 1
+        with get_tracer().span("question", pipeline="rag", domanda=query) as span:
+            with self.stats.stage("retrieval"):
+                docs = self.qa_chain.retriever.invoke(query)
+            span.set(chunk_ids=[d.metadata.get('chunk_id') for d in docs])
+            with self.stats.stage("llm"):
+                output = self.qa_chain.combine_documents_chain.invoke(
+                    {"input_documents": docs, "question": query},
+                    config={"callbacks": [self.usage_callback]}
+                )
+            risposta = output["output_text"]
+
+            matches = []
+            with self.stats.stage("matching"):
+                candidate_dishes = [x.strip() for x in risposta.split(",") if x.strip().lower() != "nessuno"]
+                # Con i chunk per piatto (menu_splitter.py) l'ID è nei metadati dei chunk recuperati
+                lookup = dish_lookup(docs)
+                direct = [lookup.get(normalize_name(cand)) for cand in candidate_dishes]
+                resolved = iter(self.name_resolver.resolve_batch(
+                    [cand for cand, hit in zip(candidate_dishes, direct) if hit is None]))
+                for cand, hit in zip(candidate_dishes, direct):
+                    if hit is not None:
+                        matches.append((cand, hit[0], hit[1], 1.0))
+                        continue
+                    found = next(resolved)
+                    if found:
+                        nome, score = found[0]
+                        matches.append((cand, nome, self.dish_mapping[nome], score))
+                    else:
+                        matches.append((cand, None, None, 0.0))
+            span.set(dish_ids=[m[2] for m in matches if m[2] is not None])
+        return {"result": risposta, "source_documents": docs, "matches": matches}
+
+    def answer_ids(self, query):
+        return [dish_id for _, _, dish_id, _ in self.answer(query)["matches"] if dish_id is not None]
+
+
+def build_pipeline(menu_dir=MENU_DIR, index_dir=INDEX_DIR, chunk_size=CHUNK_SIZE,
+                   chunk_overlap=CHUNK_OVERLAP, k=K, dish_chunks=DISH_CHUNKS, documents=None,
+                   dish_mapping=None, stats=None):
+    """
+    dish_chunks: un chunk per piatto e uno di intestazione per ristorante (MenuSplitter),
+    con ristorante, piatto e dish_id nei metadati; chunk_size/chunk_overlap non si usano.
+    documents/dish_mapping: corpus alternativo (es. sintetico, da benchmark.py);
+    in quel caso l'indice è costruito in memoria e non salvato.
+    """
+    stats = stats or PipelineStats(MODELLO)
+
+    # 1. Carica .env e la chiave (non necessaria con HACKAPIZZA_BACKEND=local)
+    load_dotenv()
+    require_api_key("OPENAI_API_KEY")
+
+    # 2. Carica dish_mapping.json se esiste (serve anche a MenuSplitter)
+    if dish_mapping is None:
+        if os.path.exists(MAPPING_PATH):
+            with open(MAPPING_PATH, "r", encoding="utf-8") as f:
+                dish_mapping = json.load(f)
+        else:
+            dish_mapping = {}
+    dish_names = list(dish_mapping.keys())
+    name_resolver = NameResolver(dish_names)
+
+    # 3-6. Carica l'indice FAISS da disco e ri-embedda solo i menu aggiunti o modificati
+    if dish_chunks:
+        text_splitter = MenuSplitter(dish_mapping)
+        settings = splitter_settings(dish_mapping)
+    else:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    # Gli embedding dei chunk già visti (stesso testo) vengono letti dalla cache su disco
+    embedding = CachedEmbeddings(make_embeddings(), batch_size=256)
+    if documents is not None:
+        db, all_docs_map = build_index(documents, text_splitter, embedding, stats)
+    else:
+        db, all_docs_map = load_or_update_index(
+            menu_dir,
+            index_dir,
+            text_splitter,
+            embedding,
+            settings={**settings, "embedding_model": embedding.model},
+            stats=stats
+        )
+
+    # 7. Crea retriever con k chunk (default 5)
+    retriever = db.as_retriever(search_kwargs={"k": k})
+
+    # 8. Prepara il prompt
+    PROMPT = PromptTemplate(
+        input_variables=["context", "question"],
+        template=make_prompt_template(dish_names)
+    )
+
+    # 9. Crea LLM e QA chain
+    # Le risposte vengono salvate nella cache SQLite (LLM_CACHE_MODE=replay per girare offline)
+    llm_cache = install_langchain_cache()
+    llm = make_chat_model(MODELLO)
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True,
+        chain_type_kwargs={"prompt": PROMPT}
+    )
+    return RagPipeline(qa_chain, dish_mapping, name_resolver, stats, llm_cache, embedding)
+
+
+def main():
+    import pandas as pd
+
+    pipeline = build_pipeline()
+
+    # 10. Carica domande dal CSV
+    df_domande = pd.read_csv(DOMANDE_PATH)
+    if 'domanda' in df_domande.columns:
+        domanda_col = 'domanda'
+    elif 'question' in df_domande.columns:
+        domanda_col = 'question'
+    else:
+        domanda_col = df_domande.columns[1]
+
+    # 11. Loop sulle domande e stampa risposta, fonti, match e chunk
+    for n, query in enumerate(df_domande[domanda_col].astype(str), 1):
+        print(f"\n➡️ Domanda {n}: {query}")
+        result = pipeline.answer(query)
+
+        # Risposta generata
+        print("✅ Risposta:", result['result'])
+
+        # File usati come fonte
+        fonti = set()
+        for doc in result['source_documents']:
+            source = doc.metadata.get("source", "sconosciuto")
+            filename = os.path.basename(source)
+            fonti.add(filename)
+        print("📄 Documenti usati:", ", ".join(sorted(fonti)))
+
+        # Contenuto dei chunk
+        print("📦 Chunk recuperati:")
+        for i, doc in enumerate(result['source_documents'], 1):
+            source = doc.metadata.get("source", "sconosciuto")
+            filename = os.path.basename(source)
+            print(f"--- Chunk {i} da '{filename}' ---")
+            print(doc.page_content.strip())
+            print("―" * 40)
+
+        # Matching piatti
+        if pipeline.dish_mapping:
+            if result['matches']:
+                print("🔎 Matching piatti trovati:")
+                for cand, nome, dish_id, score in result['matches']:
+                    if nome:
+                        print(f"  '{cand}' → '{nome}' ID: {dish_id} (score {score:.2f})")
+                    else:
+                        print(f"  '{cand}' → nessun match trovato")
+            else:
+                print("🔎 Matching piatti trovati: Nessuno")
+
+        if n == 4:
+            break
+
+    pipeline.llm_cache.print_stats()
+    pipeline.embedding.print_stats()
+
+
+if __name__ == "__main__":
+    main()
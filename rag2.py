@@ -1,53 +1,39 @@
-import pandas as pd
 import os
 from dotenv import load_dotenv
 
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
 from langchain.schema import BaseRetriever
 from pydantic import Field
 import json
+import re
+from typing import Any, Dict
 from langchain_core.documents import Document
 
-# 1. Carica .env e la chiave
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_API_KEY_OPENAI")
-if not api_key:
-    raise ValueError("⚠️ La variabile OPENAI_API_KEY non è stata trovata nel file .env")
-os.environ["OPENAI_API_KEY"] = api_key
-
-# 2. Carica tutti i menu (PDF)
-menu_dir = "Hackapizza Dataset/Menu"
-documents = []
-for root, dirs, files in os.walk(menu_dir):
-    for file in files:
-        if file.lower().endswith('.pdf'):
-            path = os.path.join(root, file)
-            loader = PyPDFLoader(path)
-            documents.extend(loader.load())
-
-# 3. Chunking classico + assegnazione chunk_id
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=500,
-    chunk_overlap=150
-)
-docs = text_splitter.split_documents(documents)
-for idx, doc in enumerate(docs):
-    doc.metadata['chunk_id'] = idx
-
-# Mappa globale di tutti i chunk
-all_docs_map = {d.metadata['chunk_id']: d for d in docs}
-
-# 4. Crea embeddings e FAISS
-embedding = OpenAIEmbeddings()
-db = FAISS.from_documents(list(all_docs_map.values()), embedding)
-
-# 5. Retriever base con k=5
-base_retriever = db.as_retriever(search_kwargs={"k": 3})
+from bm25_index import BM25Index
+from dish_records import normalize_name
+from menu_index import build_index, load_or_update_index
+from menu_splitter import MenuSplitter, dish_lookup, splitter_settings
+from embedding_cache import CachedEmbeddings
+from name_resolver import NameResolver
+from llm_cache import install_langchain_cache
+from backends import make_chat_model, make_embeddings, require_api_key
+from pipeline_stats import PipelineStats, langchain_usage_callback
+from tracing import get_tracer
+
+MENU_DIR = "Hackapizza Dataset/Menu"
+INDEX_DIR = ".cache/faiss_rag2"
+MAPPING_PATH = "Hackapizza Dataset/Misc/dish_mapping.json"
+DOMANDE_PATH = "Hackapizza Dataset/domande.csv"
+MODELLO = "gpt-3.5-turbo"
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 150
+K = 3
+# Candidati di ciascun ranking (vettoriale e BM25) prima della fusione
+FETCH_K = 10
+# Un chunk per piatto (menu_splitter.py): l'espansione ai vicini non serve più
+DISH_CHUNKS = False
 
 
 # 6. Implementa NeighborRetriever ereditando BaseRetriever correttamente
@@ -75,20 +61,28 @@ class NeighborRetriever(BaseRetriever):
         return unique_docs
 
 
-# 7. Instanzia NeighborRetriever
-retriever = NeighborRetriever(
-    base_retriever=base_retriever,
-    docs_map=all_docs_map
-)
+class HybridRetriever(BaseRetriever):
+    """
+    Fonde i risultati vettoriali (FAISS) e lessicali (BM25 sugli stessi chunk)
+    con reciprocal rank fusion: punteggio = Σ 1 / (rrf_k + posizione).
+    Restituisce i k chunk migliori, che NeighborRetriever espande poi ai vicini.
+    """
+    vector_retriever: BaseRetriever = Field(...)
+    bm25: Any = Field(...)
+    docs_map: dict = Field(...)
+    k: int = 3
+    fetch_k: int = 10
+    rrf_k: int = 60
 
-# 8. Carica dish_mapping.json se esiste
-dish_mapping = {}
-dish_names = []
-map_path = "Hackapizza Dataset/Misc/dish_mapping.json"
-if os.path.exists(map_path):
-    with open(map_path, "r", encoding="utf-8") as f:
-        dish_mapping = json.load(f)
-    dish_names = list(dish_mapping.keys())
+    def _get_relevant_documents(self, query: str, **kwargs):
+        vector_ids = [d.metadata['chunk_id'] for d in self.vector_retriever.invoke(query)]
+        lexical_ids = [cid for cid, _ in self.bm25.search(query, self.fetch_k)]
+        fused: Dict[int, float] = {}
+        for ranking in (vector_ids, lexical_ids):
+            for rank, cid in enumerate(ranking):
+                fused[cid] = fused.get(cid, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        best = sorted(fused, key=lambda cid: -fused[cid])[:self.k]
+        return [self.docs_map[cid] for cid in best if cid in self.docs_map]
 
 
 # 9. Prompt template aggiornato per includere nome e codice
@@ -124,63 +118,211 @@ RISPOSTA:
 """
 
 
-# Aggiorna PromptTemplate con dish_mapping
-PROMPT = PromptTemplate(
-    input_variables=["context", "question"],
-    template=make_prompt_template(dish_mapping)
-)
-
-# 10. Crea LLM e RetrievalQA
-llm = ChatOpenAI(model="gpt-3.5-turbo")
-qa_chain = RetrievalQA.from_chain_type(
-    llm=llm,
-    chain_type="stuff",
-    retriever=retriever,
-    return_source_documents=True,
-    chain_type_kwargs={"prompt": PROMPT}
-)
-
-# 11. Carica domande e seleziona in codice quali processare
-import pandas as pd
-
-df = pd.read_csv("Hackapizza Dataset/domande.csv")
-if 'domanda' in df.columns:
-    qcol = 'domanda'
-elif 'question' in df.columns:
-    qcol = 'question'
-else:
-    qcol = df.columns[1]
-
-# Specifica qui gli indici da processare
-selected_indices = [0, 2, 5]
-
-# Filtra il DataFrame in base agli indici
-try:
-    df = df.loc[selected_indices]
-except KeyError:
-    print(f"Attenzione: alcuni indici {selected_indices} non esistono. Elaboro tutte le domande.")
-
-# Loop sulle domande selezionate
-for i, row in df.iterrows():
-    query = str(row[qcol])
-    print(f"\n➡️ Domanda [{i}]: {query}")
-    result = qa_chain.invoke({"query": query})
-    print("✅ Risposta:", result['result'])
-
-    # mostra i chunk (precedente, corrente, successivo)
-    print("📦 Chunk passati all'LLM:")
-    for doc in result['source_documents']:
-        cid = doc.metadata['chunk_id']
-        print(f"--- chunk_id {cid} ---")
-        print(doc.page_content.strip())
-        print("―" * 30)
-
-    # match piatti e codice
-    if dish_names:
-        found = [p.strip() for p in result['result'].split(',') if p.strip().lower() != 'nessuno']
-        if found:
-            print("🔎 Matching:")
-            for p in found:
-                print(f"  {p} → {dish_mapping.get(p, 'nessun match')}")
-        else:
-            print("🔎 Matching: Nessuno")
+class Rag2Pipeline:
+    """
+    Stato della pipeline (indice, chain, mapping) e risposta a una domanda.
+    Le fasi retrieval (inclusa l'espansione ai vicini), llm e matching
+    vengono misurate in self.stats.
+    """
+
+    def __init__(self, qa_chain, dish_mapping, name_resolver, stats, llm_cache, embedding):
+        self.qa_chain = qa_chain
+        self.dish_mapping = dish_mapping
+        self.name_resolver = name_resolver
+        self.stats = stats
+        self.llm_cache = llm_cache
+        self.embedding = embedding
+        self.usage_callback = langchain_usage_callback(stats)
+
+    def answer(self, query):
+        """Risposta dell'LLM, chunk usati e piatti riconosciuti [(risposta, ID)]"""
+        self.stats.questions += 1
+        with get_tracer().span("question", pipeline="rag2", domanda=query) as span:
+            with self.stats.stage("retrieval"):
+                docs = self.qa_chain.retriever.invoke(query)
+            span.set(chunk_ids=[d.metadata.get('chunk_id') for d in docs])
+            with self.stats.stage("llm"):
+                output = self.qa_chain.combine_documents_chain.invoke(
+                    {"input_documents": docs, "question": query},
+                    config={"callbacks": [self.usage_callback]}
+                )
+            risposta = output["output_text"]
+
+            matches = []
+            with self.stats.stage("matching"):
+                found = [p.strip() for p in risposta.split(',') if p.strip().lower() != 'nessuno']
+                # Il prompt chiede "Nome (codice)": si risolve il nome senza il codice
+                nomi = [re.sub(r"\s*\(\d+\)\s*$", "", p) for p in found]
+                # Con i chunk per piatto l'ID è nei metadati dei chunk recuperati:
+                # si accetta il codice citato o il nome esatto, altrimenti fuzzy matching
+                lookup = dish_lookup(docs)
+                retrieved_ids = {dish_id for _, dish_id in lookup.values()}
+                direct = []
+                for p, nome in zip(found, nomi):
+                    code = re.search(r"\((\d+)\)\s*$", p)
+                    if code and int(code.group(1)) in retrieved_ids:
+                        direct.append(int(code.group(1)))
+                    else:
+                        hit = lookup.get(normalize_name(nome))
+                        direct.append(hit[1] if hit else None)
+                resolved = iter(self.name_resolver.resolve_batch(
+                    [nome for nome, dish_id in zip(nomi, direct) if dish_id is None]))
+                for p, dish_id in zip(found, direct):
+                    if dish_id is None:
+                        best = next(resolved)
+                        dish_id = self.dish_mapping[best[0][0]] if best else None
+                    matches.append((p, dish_id))
+            span.set(dish_ids=[dish_id for _, dish_id in matches if dish_id is not None])
+        return {"result": risposta, "source_documents": docs, "matches": matches}
+
+    def answer_ids(self, query):
+        return [dish_id for _, dish_id in self.answer(query)["matches"] if dish_id is not None]
+
+
+def build_pipeline(menu_dir=MENU_DIR, index_dir=INDEX_DIR, chunk_size=CHUNK_SIZE,
+                   chunk_overlap=CHUNK_OVERLAP, k=K, neighbors=True, hybrid=True,
+                   fetch_k=FETCH_K, dish_chunks=DISH_CHUNKS, documents=None,
+                   dish_mapping=None, stats=None):
+    """
+    neighbors: espande i chunk recuperati al precedente e al successivo (NeighborRetriever)
+    dish_chunks: un chunk per piatto (MenuSplitter) con dish_id nei metadati; disattiva
+    l'espansione ai vicini e chunk_size/chunk_overlap non si usano
+    hybrid: fonde FAISS e BM25 (HybridRetriever) prima dell'espansione ai vicini
+    documents/dish_mapping: corpus alternativo (es. sintetico, da benchmark.py);
+    in quel caso l'indice è costruito in memoria e non salvato.
+    """
+    stats = stats or PipelineStats(MODELLO)
+
+    # 1. Carica .env e la chiave (non necessaria con HACKAPIZZA_BACKEND=local)
+    load_dotenv()
+    require_api_key("OPENAI_API_KEY", "OPENAI_API_KEY_OPENAI")
+
+    # 2. Carica dish_mapping.json se esiste (serve anche a MenuSplitter)
+    if dish_mapping is None:
+        dish_mapping = {}
+        if os.path.exists(MAPPING_PATH):
+            with open(MAPPING_PATH, "r", encoding="utf-8") as f:
+                dish_mapping = json.load(f)
+    name_resolver = NameResolver(list(dish_mapping.keys()))
+
+    # 3-4. Carica l'indice FAISS da disco e ri-embedda solo i menu aggiunti o modificati.
+    # I chunk_id sono salvati nei metadati e consecutivi all'interno di ogni PDF.
+    if dish_chunks:
+        text_splitter = MenuSplitter(dish_mapping)
+        settings = splitter_settings(dish_mapping)
+        neighbors = False
+    else:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        settings = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    # Gli embedding dei chunk già visti (stesso testo) vengono letti dalla cache su disco
+    embedding = CachedEmbeddings(make_embeddings(), batch_size=256)
+    if documents is not None:
+        db, all_docs_map = build_index(documents, text_splitter, embedding, stats)
+    else:
+        db, all_docs_map = load_or_update_index(
+            menu_dir,
+            index_dir,
+            text_splitter,
+            embedding,
+            settings={**settings, "embedding_model": embedding.model},
+            stats=stats
+        )
+
+    # 5. Retriever base con k chunk (default 3); in modalità ibrida FAISS restituisce
+    # fetch_k candidati che vengono fusi con quelli di BM25, e ne restano k
+    if hybrid:
+        with stats.stage("bm25_build"):
+            bm25 = BM25Index.from_docs_map(all_docs_map)
+        base_retriever = HybridRetriever(
+            vector_retriever=db.as_retriever(search_kwargs={"k": max(k, fetch_k)}),
+            bm25=bm25,
+            docs_map=all_docs_map,
+            k=k,
+            fetch_k=max(k, fetch_k)
+        )
+    else:
+        base_retriever = db.as_retriever(search_kwargs={"k": k})
+
+    # 7. Instanzia NeighborRetriever
+    retriever = base_retriever
+    if neighbors:
+        retriever = NeighborRetriever(
+            base_retriever=base_retriever,
+            docs_map=all_docs_map
+        )
+
+    # Aggiorna PromptTemplate con dish_mapping
+    PROMPT = PromptTemplate(
+        input_variables=["context", "question"],
+        template=make_prompt_template(dish_mapping)
+    )
+
+    # 10. Crea LLM e RetrievalQA
+    # Le risposte vengono salvate nella cache SQLite (LLM_CACHE_MODE=replay per girare offline)
+    llm_cache = install_langchain_cache()
+    llm = make_chat_model(MODELLO)
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=llm,
+        chain_type="stuff",
+        retriever=retriever,
+        return_source_documents=True,
+        chain_type_kwargs={"prompt": PROMPT}
+    )
+    return Rag2Pipeline(qa_chain, dish_mapping, name_resolver, stats, llm_cache, embedding)
+
+
+def main():
+    import pandas as pd
+
+    pipeline = build_pipeline()
+
+    # 11. Carica domande e seleziona in codice quali processare
+    df = pd.read_csv(DOMANDE_PATH)
+    if 'domanda' in df.columns:
+        qcol = 'domanda'
+    elif 'question' in df.columns:
+        qcol = 'question'
+    else:
+        qcol = df.columns[1]
+
+    # Specifica qui gli indici da processare
+    selected_indices = [0, 2, 5]
+
+    # Filtra il DataFrame in base agli indici
+    try:
+        df = df.loc[selected_indices]
+    except KeyError:
+        print(f"Attenzione: alcuni indici {selected_indices} non esistono. Elaboro tutte le domande.")
+
+    # Loop sulle domande selezionate
+    for i, query in zip(df.index, df[qcol].astype(str)):
+        print(f"\n➡️ Domanda [{i}]: {query}")
+        result = pipeline.answer(query)
+        print("✅ Risposta:", result['result'])
+
+        # mostra i chunk (precedente, corrente, successivo)
+        print("📦 Chunk passati all'LLM:")
+        for doc in result['source_documents']:
+            cid = doc.metadata['chunk_id']
+            print(f"--- chunk_id {cid} ---")
+            print(doc.page_content.strip())
+            print("―" * 30)
+
+        # match piatti e codice
+        if pipeline.dish_mapping:
+            if result['matches']:
+                print("🔎 Matching:")
+                for p, dish_id in result['matches']:
+                    print(f"  {p} → {dish_id if dish_id is not None else 'nessun match'}")
+            else:
+                print("🔎 Matching: Nessuno")
+
+    pipeline.llm_cache.print_stats()
+    pipeline.embedding.print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -23,9 +23,8 @@ def convert_csv_to_json(csv_path: str, team_name: str) -> dict:
         
         predictions = {}
         
-        for _, row in df.iterrows():
-            row_id = str(int(row['row_id']))
-            result = row['result']
+        for row_id, result in zip(df['row_id'].tolist(), df['result'].tolist()):
+            row_id = str(int(row_id))
             
             # Gestisce result vuoto
             if pd.isna(result) or result == '':
@@ -49,6 +48,21 @@ def convert_csv_to_json(csv_path: str, team_name: str) -> dict:
         sys.exit(1)
 
 
+def warn_unknown_ids(predictions: dict, mapping_path: str) -> None:
+    """Avvisa degli ID che non esistono in dish_mapping.json (se il file è disponibile)"""
+    try:
+        with open(mapping_path, 'r', encoding='utf-8') as f:
+            valid_ids = set(json.load(f).values())
+    except Exception as e:
+        print(f"⚠️  Controllo degli ID saltato: {e}")
+        return
+    unknown = [(row_id, dish_id) for row_id, dish_ids in predictions.items()
+               for dish_id in dish_ids if dish_id not in valid_ids]
+    if unknown:
+        print(f"⚠️  {len(unknown)} ID non esistono in dish_mapping.json "
+              f"(es. domanda {unknown[0][0]}: ID {unknown[0][1]})")
+
+
 def submit_predictions(server_url: str, payload: dict) -> dict:
     """Sottomette predictions al server"""
     try:
@@ -127,6 +141,8 @@ Esempi di utilizzo:
                        help='URL del server (default: http://localhost:5000)')
     parser.add_argument('--no-validate', action='store_true',
                        help='Salta la validazione locale del CSV')
+    parser.add_argument('--dish-mapping', default='Hackapizza Dataset/Misc/dish_mapping.json',
+                       help='Path al file dish_mapping.json (controllo degli ID prima dell\'invio)')
     parser.add_argument('--retry', type=int, default=3,
                        help='Numero di tentativi in caso di errore (default: 3)')
     parser.add_argument('--delay', type=int, default=2,
@@ -163,6 +179,8 @@ Esempi di utilizzo:
     # Converte CSV in JSON
     print("🔄 Convertendo CSV in formato JSON...")
     payload = convert_csv_to_json(str(csv_path), args.team)
+    if not args.no_validate:
+        warn_unknown_ids(payload["predictions"], args.dish_mapping)
     
     # Sottomette con retry
     result = None
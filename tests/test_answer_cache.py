@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from answer_cache import AnswerCache, intent_signature
+from dish_records import DishRecord
+from query_engine import QueryEngine
+from qa_service import QAService
+
+RECORDS = [
+    DishRecord(1, "Ali Fritte", "Ristorante A", ingredienti=["Chocobo Wings", "Latte+"]),
+    DishRecord(2, "Zuppa", "Ristorante B", ingredienti=["Lattuga Namecciana"],
+               tecniche=["Marinatura Psionica"]),
+]
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return QueryEngine(RECORDS)
+
+
+def key(engine, question):
+    return intent_signature(engine, question)[1]
+
+
+def test_rephrasings_share_key(engine):
+    assert key(engine, "Quali sono i piatti che includono le Chocobo Wings come ingrediente?") == \
+        key(engine, "Quali piatti leggendari della galassia contengono le Chocobo Wings?")
+
+
+def test_extra_constraint_changes_key(engine):
+    assert key(engine, "Quali piatti contengono Chocobo Wings e sono vegani?") != \
+        key(engine, "Quali piatti includono le Chocobo Wings?")
+
+
+def test_negation_changes_key(engine):
+    positive = key(engine, "Quali piatti contengono le Chocobo Wings?")
+    negative = key(engine, "Quali piatti non contengono le Chocobo Wings?")
+    assert positive != negative
+    assert negative == key(engine, "Quali piatti escludono le Chocobo Wings?")
+
+
+def test_disjunction_changes_key(engine):
+    assert key(engine, "Quali piatti contengono Chocobo Wings o Latte+?") != \
+        key(engine, "Quali piatti contengono Chocobo Wings e Latte+?")
+
+
+def test_no_entities_falls_back_to_text(engine):
+    assert key(engine, "Quali piatti sono vegani?") is None
+
+
+def test_ttl_and_lru(engine):
+    cache = AnswerCache(engine, max_entries=2, ttl=0.05)
+    cache.put("Quali piatti contengono Chocobo Wings?", [1])
+    cache.put("Quali piatti contengono Latte+?", [1])
+    cache.put("Quali piatti contengono Lattuga Namecciana?", [2])
+    assert len(cache) == 2
+    assert cache.get("Quali piatti contengono Chocobo Wings?") is None
+    assert cache.get("Quali piatti includono la Lattuga Namecciana?") == [2]
+    time.sleep(0.06)
+    assert cache.get("Quali piatti includono la Lattuga Namecciana?") is None
+
+
+def test_service_skips_incomplete_answers(engine):
+    calls = []
+
+    def answer_batch(domande):
+        calls.extend(domande)
+        return [([], False) if "Latte+" in d else ([1], True) for d in domande]
+
+    cache = AnswerCache(engine)
+    service = QAService(answer_batch, answer_cache=cache)
+    assert service.ask(["Quali piatti contengono Latte+?"], timeout=5) == [[]]
+    assert service.ask(["Quali piatti contengono Chocobo Wings?"], timeout=5) == [[1]]
+    assert service.ask(["Quali piatti includono Latte+?"], timeout=5) == [[]]
+    assert service.ask(["Quali piatti includono le Chocobo Wings?"], timeout=5) == [[1]]
+    assert len(calls) == 3 and len(cache) == 1
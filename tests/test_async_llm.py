@@ -0,0 +1,81 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from dish_records import DishRecord
+from llm_cache import LLMCache
+
+
+def _completion(content):
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+
+
+@pytest.fixture
+def chat_server():
+    """Server OpenAI finto con keep-alive: httpx riusa la connessione tra un batch e l'altro"""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            body = json.dumps(_completion("Pizza Cosmica")).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_answer_all_twice_with_httpx_client(monkeypatch, chat_server):
+    monkeypatch.setenv("HACKAPIZZA_BACKEND", "local")
+    from attempt import AttemptPipeline
+
+    base_url, requests = chat_server
+
+    ricette = [
+        DishRecord(dish_id=1, nome="Pizza Cosmica", ristorante="Da Mario", ingredienti=["Farina"]),
+        DishRecord(dish_id=2, nome="Zuppa Stellare", ristorante="Da Mario", ingredienti=["Acqua"]),
+    ]
+    pipeline = AttemptPipeline(ricette=ricette, dish_mapping={"Pizza Cosmica": 1, "Zuppa Stellare": 2})
+    # Client reale (httpx): le connessioni restano legate al loop in cui sono aperte
+    pipeline.client = openai.AsyncOpenAI(api_key="test", base_url=base_url, max_retries=0)
+    pipeline.llm_cache = LLMCache(mode="off")
+
+    for _ in range(2):
+        [risposta] = pipeline.answer_all(["Quale piatto piace ai viaggiatori?"])
+        assert risposta == {"fonte": "llm", "ids": [1], "nomi": ["Pizza Cosmica"], "completa": True}
+    assert len(requests) == 2
+
+
+def test_rate_limit_zero_is_unlimited_and_negative_is_rejected():
+    from async_llm import AsyncLLMRunner, TokenBucket
+    from backends import AsyncLocalChatClient
+
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+    with pytest.raises(ValueError):
+        AsyncLLMRunner(AsyncLocalChatClient(), requests_per_second=-1, cache=LLMCache(mode="off"))
+
+    runner = AsyncLLMRunner(AsyncLocalChatClient(), requests_per_second=0, cache=LLMCache(mode="off"))
+    risposte = runner.run([("gpt-4o", [{"role": "user", "content": f"domanda {i}"}], {}) for i in range(3)])
+    assert all(isinstance(r, str) for r in risposte)
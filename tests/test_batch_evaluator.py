@@ -0,0 +1,53 @@
+import random
+
+import numpy as np
+
+from batch_evaluator import BatchEvaluator, load_submission, parse_result
+
+
+def reference_jaccard(truth, predicted):
+    truth, predicted = set(truth), set(predicted)
+    if not truth and not predicted:
+        return 1.0
+    return len(truth & predicted) / len(truth | predicted)
+
+
+def random_answers(rng, row_ids, pool, max_len=6):
+    return {row_id: rng.sample(pool, rng.randint(0, max_len)) for row_id in row_ids}
+
+
+def test_scores_match_reference():
+    rng = random.Random(0)
+    row_ids = list(range(1, 51))
+    pool = list(range(300))
+    ground_truth = random_answers(rng, row_ids, pool)
+    submissions = [random_answers(rng, row_ids, pool) for _ in range(40)]
+    # Casi limite: submission identica, vuota e con domande mancanti
+    submissions += [dict(ground_truth), {r: [] for r in row_ids}, {1: ground_truth[1]}]
+
+    scores = BatchEvaluator(ground_truth).score(submissions)
+    expected = np.array([[reference_jaccard(ground_truth[r], sub.get(r, [])) for r in row_ids]
+                         for sub in submissions])
+    assert scores.shape == (len(submissions), len(row_ids))
+    assert np.allclose(scores, expected)
+    assert np.allclose(scores[-3], 1.0)
+
+
+def test_ids_outside_ground_truth_count_in_union():
+    evaluator = BatchEvaluator({1: [10, 11], 2: []})
+    scores = evaluator.score([{1: [10, 99], 2: [5]}])
+    assert np.allclose(scores, [[1 / 3, 0.0]])
+
+
+def test_diff_reports_missing_and_extra():
+    evaluator = BatchEvaluator({1: [1, 2], 2: [3]})
+    submission = {1: [2, 7], 2: [3]}
+    diff = evaluator.diff(submission, evaluator.score([submission])[0])
+    assert diff == [{"row_id": 1, "jaccard": 1 / 3, "mancanti": [1], "in_piu": [7]}]
+
+
+def test_load_submission_csv(tmp_path):
+    path = tmp_path / "sub.csv"
+    path.write_text('row_id,result\n1,"3, 4"\n2,\n3,7\n', encoding="utf-8")
+    assert load_submission(str(path)) == {1: [3, 4], 2: [], 3: [7]}
+    assert parse_result("") == []
@@ -0,0 +1,39 @@
+import os
+
+from dish_records import DishRecord
+from dish_store import CURRENT_FILE, DishStore, build_dish_store
+
+
+def _records(nome):
+    return [DishRecord(dish_id=1, nome=nome, ristorante="Da Mario", ingredienti=["Farina"])]
+
+
+def test_rebuild_keeps_open_readers_consistent(tmp_path):
+    store_dir = str(tmp_path / "store")
+    build_dish_store(_records("Vecchio"), {}, store_dir)
+    reader = DishStore(store_dir)
+
+    build_dish_store(_records("Nuovo"), {"Altro": 2}, store_dir)
+
+    # Il lettore aperto prima resta sulla sua versione, colonne comprese
+    assert reader.nome(0) == "Vecchio"
+    assert len(reader) == 1
+    fresh = DishStore(store_dir)
+    assert fresh.nome(0) == "Nuovo"
+    assert len(fresh) == 2
+
+
+def test_old_versions_and_legacy_layout_are_removed(tmp_path):
+    store_dir = tmp_path / "store"
+    store_dir.mkdir()
+    (store_dir / "header.json").write_text("{}")
+    (store_dir / "dish_id.npy").write_bytes(b"")
+
+    for nome in ("a", "b", "c"):
+        build_dish_store(_records(nome), {}, str(store_dir))
+
+    names = set(os.listdir(store_dir))
+    assert CURRENT_FILE in names
+    assert "header.json" not in names and "dish_id.npy" not in names
+    # Restano solo la versione attiva e la precedente
+    assert len([n for n in names if n != CURRENT_FILE]) == 2
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+
+
+class FakeEmbeddings(Embeddings):
+    model = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text):
+        rng = np.random.default_rng(sum(text.encode("utf-8")) + len(text))
+        return rng.random(8).tolist()
+
+
+def test_append_reload_round_trip(tmp_path):
+    texts = ["chunk a", "chunk b", "chunk a", "chunk c"]
+    first = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    vectors = first.embed_documents(texts)
+    assert first.misses == 3 and first.hits == 1
+
+    underlying = FakeEmbeddings()
+    second = CachedEmbeddings(underlying, cache_dir=str(tmp_path))
+    assert np.allclose(second.embed_documents(texts), vectors)
+    assert underlying.calls == 0 and len(second.store) == 3
+
+
+def test_queries_are_not_persisted(tmp_path):
+    cache = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    cache.embed_documents(["chunk"])
+    cache.embed_query("una domanda")
+    assert len(CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path)).store) == 1
+
+
+def test_concurrent_appends(tmp_path):
+    cache = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    errors = []
+
+    def work(i):
+        try:
+            for j in range(50):
+                cache.embed_documents([f"doc {i} {j}", f"comune {j}"])
+                cache.embed_query(f"domanda {i} {j}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    reloaded = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    assert len(reloaded.store) == 4 * 50 + 50
+    assert np.allclose(reloaded.embed_documents(["doc 3 7"]), [FakeEmbeddings().embed_query("doc 3 7")])
+
+
+def test_truncated_vectors_are_dropped(tmp_path):
+    cache = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    cache.embed_documents([f"chunk {i}" for i in range(10)])
+    path = cache.store.vectors_path
+    os.truncate(path, os.path.getsize(path) - 3 * 8 * 4)
+
+    reloaded = CachedEmbeddings(FakeEmbeddings(), cache_dir=str(tmp_path))
+    assert len(reloaded.store) == 7
+    vectors = reloaded.embed_documents([f"chunk {i}" for i in range(10)])
+    assert np.allclose(vectors, [FakeEmbeddings().embed_query(f"chunk {i}") for i in range(10)])
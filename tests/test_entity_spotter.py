@@ -0,0 +1,55 @@
+import pytest
+
+from entity_spotter import EntitySpotter
+
+VOCABULARY = {
+    "ingrediente": ["Carne di Mucca", "Lattuga Namecciana", "Latte+"],
+    "tecnica": ["Affumicatura a Stratificazione Quantica"],
+}
+
+
+@pytest.fixture(scope="module")
+def spotter():
+    return EntitySpotter(VOCABULARY)
+
+
+def polarity(spotter, text):
+    return [(e.key, e.negated) for e in spotter.spot(text)]
+
+
+@pytest.mark.parametrize("text", [
+    "Quali piatti contengono Carne di Mucca, evitando però la Lattuga Namecciana?",
+    "Quali piatti contengono Carne di Mucca senza però la Lattuga Namecciana?",
+    "Quali piatti contengono Carne di Mucca, evitando pero di usare la Lattuga Namecciana?",
+])
+def test_pero_after_trigger_keeps_negation(spotter, text):
+    assert polarity(spotter, text) == [("carne di mucca", False), ("lattuga namecciana", True)]
+
+
+def test_non_solo_ma_anche_is_not_negation(spotter):
+    text = "Quali piatti contengono non solo Carne di Mucca ma anche Lattuga Namecciana?"
+    assert polarity(spotter, text) == [("carne di mucca", False), ("lattuga namecciana", False)]
+
+
+def test_ma_after_object_closes_negation(spotter):
+    text = "Quali piatti non contengono Carne di Mucca ma contengono Lattuga Namecciana?"
+    assert polarity(spotter, text) == [("carne di mucca", True), ("lattuga namecciana", False)]
+
+
+def test_punctuation_before_object_closes_negation(spotter):
+    text = "Quali piatti non sono piccanti, e contengono Latte+?"
+    assert polarity(spotter, text) == [("latte+", False)]
+
+
+def test_technique_negated_after_evitando_pero(spotter):
+    text = ("Quali piatti combinano Carne di Mucca e Latte+, evitando però di utilizzare "
+            "la tecnica di Affumicatura a Stratificazione Quantica?")
+    assert polarity(spotter, text) == [
+        ("carne di mucca", False),
+        ("latte+", False),
+        ("affumicatura a stratificazione quantica", True),
+    ]
+
+
+def test_whole_words_only(spotter):
+    assert polarity(spotter, "Piatti con Lattuga Namecciana") == [("lattuga namecciana", False)]
@@ -0,0 +1,30 @@
+import threading
+
+import pytest
+
+from qa_service import QAService
+
+
+def test_missing_results_fail_leftover_futures():
+    entered, gate = threading.Event(), threading.Event()
+
+    def answer_batch(domande):
+        entered.set()
+        gate.wait(5)
+        # Una risposta in meno del dovuto
+        return [([i], True) for i, _ in enumerate(domande[1:])]
+
+    service = QAService(answer_batch, max_batch=2)
+    first = service.submit("prima")
+    entered.wait(5)
+    # Il worker è bloccato sulla prima domanda: queste due formano il batch successivo
+    second, third = service.submit("seconda"), service.submit("terza")
+    gate.set()
+
+    with pytest.raises(RuntimeError):
+        first.result(timeout=5)
+    assert second.result(timeout=5) == [0]
+    with pytest.raises(RuntimeError):
+        third.result(timeout=5)
+    assert service.counters["errori"] == 2
+    assert not service.inflight
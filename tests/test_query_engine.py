@@ -0,0 +1,30 @@
+from candidate_filter import CandidateFilter
+from dish_records import DishRecord
+from query_engine import And, Not, Or, QueryEngine, Term
+
+RECORDS = [
+    DishRecord(10, "Ali Fritte", "A", ingredienti=["Chocobo Wings", "Latte+"], tecniche=["Frittura"],
+               pianeta="Asgard"),
+    DishRecord(11, "Zuppa", "B", ingredienti=["Lattuga Namecciana"], tecniche=["Frittura"],
+               ordini=["Ordine della Galassia"]),
+    DishRecord(12, "Tortino", "C", ingredienti=["Latte+", "Lattuga Namecciana"], pianeta="Asgard"),
+]
+
+
+def test_boolean_expressions():
+    engine = QueryEngine(RECORDS)
+    latte, lattuga = Term("ingrediente", "latte+"), Term("ingrediente", "lattuga namecciana")
+    assert engine.evaluate(And((latte, lattuga))) == {12}
+    assert engine.evaluate(Or((latte, lattuga))) == {10, 11, 12}
+    assert engine.evaluate(And((Term("tecnica", "frittura"), Not(latte)))) == {11}
+    assert engine.evaluate(Term("pianeta", "asgard")) == {10, 12}
+    assert engine.evaluate(Term("ordine", "ordine della galassia")) == {11}
+    assert engine.evaluate(Term("ingrediente", "sconosciuto")) == set()
+
+
+def test_answer_and_candidates():
+    engine = QueryEngine(RECORDS)
+    assert engine.answer("Quali piatti contengono Latte+ ma non la Lattuga Namecciana?") == [10]
+    candidates = CandidateFilter(engine).candidates("Quali piatti contengono Chocobo Wings o Latte+?")
+    assert [r.dish_id for r in candidates] == [10, 12]
+    assert CandidateFilter(engine).candidates("Quali piatti sono vegani?") is None
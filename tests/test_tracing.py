@@ -0,0 +1,17 @@
+import json
+
+from tracing import Tracer
+
+
+def test_record_emits_child_span_with_given_timing(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(str(path))
+    with tracer.span("extract") as root:
+        tracer.record("pdf_load", 1000.0, 42.5, pdf="Armonia Universale")
+    Tracer(None).record("pdf_load", 1000.0, 1.0)
+
+    spans = {r["name"]: r for r in map(json.loads, path.read_text().splitlines())}
+    load = spans["pdf_load"]
+    assert load["parent_id"] == root.span_id and load["trace_id"] == root.trace_id
+    assert load["start"] == 1000.0 and load["duration_ms"] == 42.5
+    assert load["attrs"] == {"pdf": "Armonia Universale"}
@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.globals import set_llm_cache
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from llm_cache import LLMCache, install_langchain_cache
+from pipeline_stats import PipelineStats, langchain_usage_callback
+from tracing import Tracer
+
+
+def test_cached_calls_are_not_traced_as_llm_usage(tmp_path):
+    install_langchain_cache(LLMCache(str(tmp_path / "llm.db"), mode="readwrite"))
+    tracer = Tracer(str(tmp_path / "trace.jsonl"))
+    stats = PipelineStats("gpt-3.5-turbo")
+    callback = langchain_usage_callback(stats)
+    model = FakeListChatModel(responses=["Ali Fritte", "Zuppa"])
+
+    spans = []
+    try:
+        for _ in range(2):
+            with tracer.span("question") as span:
+                model.invoke("Quali piatti contengono Latte+?", config={"callbacks": [callback]})
+            spans.append(span.attrs)
+    finally:
+        set_llm_cache(None)
+
+    assert spans[0].get("llm_calls") == 1 and spans[0].get("cache_misses") == 1
+    assert spans[1].get("cache_hits") == 1 and "llm_calls" not in spans[1]
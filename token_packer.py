@@ -0,0 +1,134 @@
+"""
+Suddivisione in blocchi misurata in token del modello.
+
+Le voci (es. "nome: ingredienti") vengono misurate con il tokenizer reale
+(tiktoken) e distribuite con first-fit decreasing nel minor numero di
+blocchi che rispettano il budget: finestra di contesto del modello meno
+prompt di sistema, domanda e max_tokens della risposta.
+All'interno di ogni blocco le voci mantengono l'ordine originale.
+"""
+
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+# Token di servizio aggiunti dall'API per ogni messaggio della chat
+TOKENS_PER_MESSAGE = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        print("⚠️ tiktoken non installato: conteggio dei token stimato (4 caratteri per token)")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return math.ceil(len(text) / 4)
+    return len(enc.encode(text))
+
+
+def count_message_tokens(messages: List[dict], model: str = "gpt-4o") -> int:
+    return sum(TOKENS_PER_MESSAGE + count_tokens(m["content"], model) for m in messages) + 3
+
+
+@dataclass
+class PackingReport:
+    model: str
+    budget: int
+    block_tokens: List[int] = field(default_factory=list)
+    prompt_overhead: int = 0
+    max_output_tokens: int = 0
+
+    @property
+    def n_blocks(self) -> int:
+        return len(self.block_tokens)
+
+    def input_tokens_per_question(self) -> int:
+        return sum(self.block_tokens) + self.n_blocks * self.prompt_overhead
+
+    def print_summary(self, n_questions: int = 1,
+                      reports: Optional[List["PackingReport"]] = None) -> None:
+        """
+        reports: i report effettivamente usati, uno per domanda (es. dopo il
+        pre-filtro dei candidati); di default n_questions volte questo report.
+        """
+        reports = reports if reports is not None else [self] * n_questions
+        n_calls = sum(r.n_blocks for r in reports)
+        print(f"📦 {self.n_blocks} blocchi ({self.model}, budget {self.budget} token/blocco)")
+        if self.block_tokens:
+            print(f"   • token per blocco: min {min(self.block_tokens)}, max {max(self.block_tokens)}")
+        print(f"   • chiamate LLM: {n_calls} per {len(reports)} domande "
+              f"(senza pre-filtro {self.n_blocks * len(reports)})")
+        print(f"   • token stimati: {sum(r.input_tokens_per_question() for r in reports)} in input, "
+              f"fino a {sum(r.n_blocks * r.max_output_tokens for r in reports)} in output")
+
+
+def block_budget(model: str, prompt_overhead: int = 0, max_output_tokens: int = 0,
+                 max_block_tokens: Optional[int] = None) -> int:
+    """Token disponibili per le voci di un blocco nella finestra di contesto del modello"""
+    context = CONTEXT_WINDOWS.get(model, 8192)
+    budget = context - prompt_overhead - max_output_tokens
+    if max_block_tokens is not None:
+        budget = min(budget, max_block_tokens)
+    if budget <= 0:
+        raise ValueError(f"❌ Nessuno spazio per le ricette: prompt di {prompt_overhead} token "
+                         f"e risposta di {max_output_tokens} su {context}")
+    return budget
+
+
+def pack_entries(entries: Sequence[str], model: str = "gpt-4o", prompt_overhead: int = 0,
+                 max_output_tokens: int = 0, max_block_tokens: Optional[int] = None,
+                 separator: str = "\n") -> Tuple[List[List[str]], PackingReport]:
+    """
+    Distribuisce le voci nel minor numero di blocchi (first-fit decreasing).
+
+    prompt_overhead: token del prompt escluse le voci (sistema + domanda + formato chat)
+    max_output_tokens: max_tokens della risposta, da riservare nella finestra di contesto
+    max_block_tokens: limite opzionale sul testo di un blocco (oltre alla finestra)
+    """
+    budget = block_budget(model, prompt_overhead, max_output_tokens, max_block_tokens)
+
+    sep_tokens = count_tokens(separator, model)
+    sizes = [count_tokens(e, model) + sep_tokens for e in entries]
+
+    bins: List[List[int]] = []
+    remaining: List[int] = []
+    for idx in sorted(range(len(entries)), key=lambda i: (-sizes[i], i)):
+        size = sizes[idx]
+        if size > budget:
+            print(f"⚠️ Voce di {size} token oltre il budget di {budget}: blocco dedicato")
+        for b, free in enumerate(remaining):
+            if size <= free:
+                bins[b].append(idx)
+                remaining[b] -= size
+                break
+        else:
+            bins.append([idx])
+            remaining.append(budget - size)
+
+    # Ordine originale sia tra i blocchi sia al loro interno
+    bins = sorted((sorted(b) for b in bins), key=lambda b: b[0])
+    blocks = [[entries[i] for i in b] for b in bins]
+    report = PackingReport(
+        model=model,
+        budget=budget,
+        block_tokens=[sum(sizes[i] for i in b) for b in bins],
+        prompt_overhead=prompt_overhead,
+        max_output_tokens=max_output_tokens,
+    )
+    return blocks, report
@@ -0,0 +1,258 @@
+"""
+Tracing strutturato (JSONL) condiviso dalle pipeline.
+
+Ogni span è una riga JSON con trace_id, span_id, parent_id, nome, inizio,
+durata e attributi (chunk_id recuperati, token di prompt/completion, hit
+della cache LLM, retry, ...). Gli span si annidano tramite contextvars:
+una domanda è la radice, le fasi (pipeline_stats.PipelineStats.stage) e le
+chiamate LLM sono i figli.
+
+Configurazione da variabili d'ambiente:
+    HACKAPIZZA_TRACE         file JSONL di output (non impostata = tracing spento)
+    HACKAPIZZA_TRACE_SAMPLE  frazione delle tracce radice registrate (default 1.0)
+
+Con il tracing spento, o per una traccia non campionata, span() restituisce
+un oggetto no-op condiviso: il costo è una chiamata di funzione.
+
+Riepilogo p50/p95 per fase:
+    python tracing.py traces.jsonl
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import threading
+import contextvars
+from typing import Dict, List, Optional
+
+# Prezzi indicativi in USD per milione di token (input, output), per la stima dei costi
+PREZZI_MODELLI = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+# Attributi numerici sommati nel riepilogo
+CONTATORI = ("prompt_tokens", "completion_tokens", "llm_calls", "cache_hits", "cache_misses", "retries")
+
+_current = contextvars.ContextVar("hackapizza_span", default=None)
+
+
+class _NoopSpan:
+    enabled = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def incr(self, key: str, n: int = 1) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _SuppressedSpan(_NoopSpan):
+    """Radice non campionata: i figli restano no-op"""
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+
+class Span:
+    enabled = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str, parent_id: Optional[str], attrs: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration_ms = (time.perf_counter() - self._t0) * 1000
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self._emit(self.start, duration_ms)
+        return False
+
+    def _emit(self, start: float, duration_ms: float) -> None:
+        self.tracer._emit({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(start, 6),
+            "duration_ms": round(duration_ms, 3),
+            "attrs": self.attrs,
+        })
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def incr(self, key: str, n: int = 1) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + n
+
+
+class Tracer:
+    def __init__(self, path: Optional[str] = None, sample_rate: float = 1.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.enabled = bool(path) and sample_rate > 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def span(self, name: str, **attrs):
+        """Span figlio di quello corrente, o radice di una nuova traccia (campionata)"""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current.get()
+        if parent is None:
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return _SuppressedSpan()
+            return Span(self, name, os.urandom(8).hex(), None, attrs)
+        if not parent.enabled:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def record(self, name: str, start: float, duration_ms: float, **attrs) -> None:
+        """
+        Span già concluso altrove (es. in un processo del pool, senza il contesto
+        del chiamante): registrato qui con i tempi misurati là.
+        """
+        span = self.span(name, **attrs)
+        if span.enabled:
+            span._emit(start, duration_ms)
+
+    def _emit(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+
+_tracer = None
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(os.getenv("HACKAPIZZA_TRACE"), float(os.getenv("HACKAPIZZA_TRACE_SAMPLE", "1.0")))
+    return _tracer
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def record_llm_usage(model: str, messages: List[Dict], response: Optional[str], usage=None) -> None:
+    """
+    Token di una chiamata LLM effettiva (non servita dalla cache) sullo span
+    corrente: dall'oggetto usage dell'API se presente, altrimenti stimati.
+    """
+    span = current_span()
+    if not span.enabled:
+        return
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+    else:
+        from token_packer import count_message_tokens, count_tokens
+        prompt_tokens = count_message_tokens(messages, model)
+        completion_tokens = count_tokens(response or "", model)
+    span.set(model=model)
+    span.incr("llm_calls")
+    span.incr("prompt_tokens", prompt_tokens)
+    span.incr("completion_tokens", completion_tokens)
+
+
+# --- Riepilogo ---
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    # Nearest-rank: il più piccolo valore con almeno q * n valori <= di esso
+    idx = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def summarize(path: str) -> Dict[str, Dict]:
+    durations: Dict[str, List[float]] = {}
+    totals: Dict[str, Dict[str, float]] = {}
+    costs: Dict[str, float] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            name, attrs = record["name"], record.get("attrs", {})
+            durations.setdefault(name, []).append(record["duration_ms"])
+            agg = totals.setdefault(name, {})
+            for key in CONTATORI:
+                if isinstance(attrs.get(key), (int, float)):
+                    agg[key] = agg.get(key, 0) + attrs[key]
+            prezzi = PREZZI_MODELLI.get(attrs.get("model"))
+            if prezzi and "prompt_tokens" in attrs:
+                costs[name] = costs.get(name, 0.0) + (
+                    attrs["prompt_tokens"] * prezzi[0] + attrs.get("completion_tokens", 0) * prezzi[1]
+                ) / 1e6
+
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": _percentile(values, 0.50),
+            "p95_ms": _percentile(values, 0.95),
+            "max_ms": max(values),
+            "total_ms": sum(values),
+            **totals.get(name, {}),
+            **({"cost_usd": round(costs[name], 6)} if name in costs else {}),
+        }
+        for name, values in durations.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Riepilogo p50/p95 per fase di un file di tracce JSONL")
+    parser.add_argument("trace_file", nargs="?", default=os.getenv("HACKAPIZZA_TRACE"))
+    parser.add_argument("--json", action="store_true", help="Stampa il riepilogo in JSON")
+    args = parser.parse_args()
+    if not args.trace_file:
+        parser.error("specificare il file di tracce (o HACKAPIZZA_TRACE)")
+
+    summary = summarize(args.trace_file)
+    if args.json:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return
+
+    print(f"📈 Riepilogo di '{args.trace_file}'")
+    print(f"   {'span':<24} {'n':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}  extra")
+    for name, s in sorted(summary.items(), key=lambda x: -x[1]["total_ms"]):
+        extra = ", ".join(f"{k}={s[k]:g}" for k in CONTATORI + ("cost_usd",) if k in s)
+        print(f"   {name:<24} {s['count']:>6} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} {s['max_ms']:>10.2f}  {extra}")
+
+
+if __name__ == "__main__":
+    main()
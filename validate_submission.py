@@ -4,6 +4,7 @@ Script di Validazione Submission - Per Partecipanti
 Valida il formato della submission senza rivelare le risposte corrette
 """
 
+import numpy as np
 import pandas as pd
 import json
 import argparse
@@ -60,9 +61,7 @@ def validate_submission_format(filepath: str) -> Tuple[bool, List[str], Dict[int
             errors.append(f"❌ row_id extra: {sorted(extra)}")
     
     # Verifica risultati
-    for idx, row in df.iterrows():
-        row_id = row['row_id']
-        result = row['result']
+    for row_id, result in zip(df['row_id'].tolist(), df['result'].tolist()):
         
         # Verifica campo non vuoto
         if pd.isna(result) or result == '':
@@ -90,16 +89,12 @@ def validate_submission_format(filepath: str) -> Tuple[bool, List[str], Dict[int
 
 def validate_dish_ids(parsed_data: Dict[int, List[int]], 
                      dish_mapping: Dict[str, int]) -> List[str]:
-    """Valida che tutti gli ID esistano nel dish_mapping"""
-    errors = []
-    valid_ids = set(dish_mapping.values())
-    
-    for row_id, dish_ids in parsed_data.items():
-        for dish_id in dish_ids:
-            if dish_id not in valid_ids:
-                errors.append(f"⚠️  Domanda {row_id}: ID {dish_id} non esiste in dish_mapping.json")
-    
-    return errors
+    """Valida che tutti gli ID esistano nel dish_mapping (un solo np.isin su tutti gli ID)"""
+    pairs = [(row_id, dish_id) for row_id, dish_ids in parsed_data.items() for dish_id in dish_ids]
+    found = np.isin(np.asarray([dish_id for _, dish_id in pairs], dtype=np.int64),
+                    np.fromiter(dish_mapping.values(), dtype=np.int64, count=len(dish_mapping)))
+    return [f"⚠️  Domanda {row_id}: ID {dish_id} non esiste in dish_mapping.json"
+            for (row_id, dish_id), ok in zip(pairs, found) if not ok]
 
 
 def generate_validation_report(filepath: str, 